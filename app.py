@@ -1,6 +1,13 @@
 import os
+import uuid
 import streamlit as st
-from app.runtime import init_graph, run_question
+from app.runtime import init_graph, run_question, stream_question, answer_cache_stats, cursor_pool_stats
+from app.router import router_stats
+from app.lazy import startup_report
+from app.tracing import trace_stats, recent_traces, get_trace
+from app.llm_cache import llm_cache_stats
+from app.chart_fastpath import chart_fast_path_stats
+from app.sql_guard import sql_guard_stats
 
 @st.cache_resource      #cache graph / session because this is taking too much time and memory
 def get_graph():
@@ -24,6 +31,88 @@ def extract_chart_paths(result):
                     seen.add(img_path)
     return paths
 
+def show_answer(route, result):
+    st.markdown(f"**Route selected:** `{route}`" + (" (cached answer)" if result.get("cached") else ""))
+    output = result.get("output") or result.get("answer") or str(result)            #from agent executor? (verify this + return should be a dictionary)
+    st.markdown("### Answer")
+    st.write(output)
+    if route == "analysis_with_chart":
+        chart_paths = extract_chart_paths(result)
+        if chart_paths:
+            st.markdown("### Chart(s)")
+            for p in chart_paths:
+                st.image(p, caption=os.path.basename(p))
+        else:
+            st.info("No chart images found in tool outputs.")
+
+# Streaming mode: route, tool steps and charts appear as they happen, answer tokens render incrementally
+def stream_answer(graph, question, session_id=None):
+    route_slot = st.empty()
+    steps = st.status("Working...", expanded=False)
+    charts_slot = st.container()
+    st.markdown("### Answer")
+    answer_slot = st.empty()
+    text = ""
+    shown_charts = set()
+    route, result = None, None
+    for event in stream_question(graph, question, session_id=session_id):
+        kind = event["type"]
+        if kind == "route":
+            route_slot.markdown(f"**Route selected:** `{event['route']}`")
+        elif kind == "token":
+            text += event["text"]
+            answer_slot.markdown(text + "▌")
+        elif kind == "tool_start":
+            steps.update(label=f"Running `{event['tool']}`...")
+            steps.write(f"▶ `{event['tool']}` {event['input']}")
+        elif kind == "tool_end":
+            steps.write(f"✔ `{event['tool']}` done")
+        elif kind == "chart":
+            image_path = event["image_path"]
+            if image_path not in shown_charts and os.path.exists(image_path):
+                shown_charts.add(image_path)
+                charts_slot.image(image_path, caption=os.path.basename(image_path))
+        elif kind == "error":
+            steps.update(label="Failed", state="error")
+            answer_slot.error(event["error"])
+        elif kind == "final":
+            route, result = event["route"], event["result"]
+    if result is None:
+        return
+    steps.update(label="Done", state="complete")
+    route_slot.markdown(f"**Route selected:** `{route}`" + (" (cached answer)" if result.get("cached") else ""))
+    answer_slot.write(result.get("output") or text)
+    if route == "analysis_with_chart":
+        for p in extract_chart_paths(result):                  # fallback chart / cached answer charts
+            if p not in shown_charts:
+                shown_charts.add(p)
+                charts_slot.image(p, caption=os.path.basename(p))
+        if not shown_charts:
+            st.info("No chart images found in tool outputs.")
+    if result.get("first_token_ms") is not None:
+        st.caption(f"First token after {result['first_token_ms'] / 1000:.1f}s, full answer after {result['total_ms'] / 1000:.1f}s")
+
+# Where questions spend their time: p50/p95 per span, llm token usage, per-question span breakdown
+def show_traces():
+    stats = trace_stats()
+    st.table([
+        {"span": name, "count": row["count"], "p50_ms": round(row["p50_ms"], 1), "p95_ms": round(row["p95_ms"], 1), "max_ms": round(row["max_ms"], 1)}
+        for name, row in stats["spans"].items()
+        ])
+    st.json(stats["llm_tokens"], expanded=False)
+    st.json(stats["per_question"], expanded=False)
+    traces = [row for row in recent_traces() if row["name"] == "question"]
+    if not traces:
+        return
+    labels = {f"{row['duration_ms'] / 1000:.1f}s · {row['llm_calls']} llm calls · {row['route']} · {(row['question'] or '')[:40]}": row["trace_id"] for row in traces}
+    choice = st.selectbox("Recent question", list(labels))
+    st.table([
+        {"span": span["name"], "kind": span["kind"], "ms": round(span["duration_ms"], 1),
+         "detail": span["attrs"].get("sql") or span["attrs"].get("input") or span["attrs"].get("node") or "",
+         "error": span.get("error") or span["attrs"].get("error") or ""}
+        for span in get_trace(labels[choice])
+        ])
+
 def main():
     st.title("CFO Insights Apple Financials - Multi-Agent Demo")
     graph = get_graph()
@@ -33,21 +122,32 @@ def main():
         height=120,
     )
     
+    streaming = st.sidebar.checkbox("Stream answers", value=True)
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)      # per-browser-session SQL budget
     if st.button("Run analysis") and question.strip():
-        with st.spinner("Thinking..."):
-            route, result = run_question(graph, question.strip())
-        st.markdown(f"**Route selected:** `{route}`")
-        output = result.get("output") or result.get("answer") or str(result)            #from agent executor? (verify this + return should be a dictionary)
-        st.markdown("### Answer")
-        st.write(output)
-        if route == "analysis_with_chart":
-            chart_paths = extract_chart_paths(result)
-            if chart_paths:
-                st.markdown("### Chart(s)")
-                for p in chart_paths:
-                    st.image(p, caption=os.path.basename(p))
-            else:
-                st.info("No chart images found in tool outputs.")
+        if streaming:
+            stream_answer(graph, question.strip(), session_id=session_id)
+        else:
+            with st.spinner("Thinking..."):
+                route, result = run_question(graph, question.strip(), session_id=session_id)
+            show_answer(route, result)
+
+    with st.sidebar.expander("Router metrics"):
+        st.json(router_stats())
+    with st.sidebar.expander("Chart fast path"):
+        st.json(chart_fast_path_stats())
+    with st.sidebar.expander("Answer cache"):
+        st.json(answer_cache_stats())
+    with st.sidebar.expander("LLM cache"):
+        st.json(llm_cache_stats())
+    with st.sidebar.expander("SQL guard"):
+        st.json(sql_guard_stats())
+    with st.sidebar.expander("DuckDB cursor pool"):
+        st.json(cursor_pool_stats())
+    with st.sidebar.expander("Traces"):
+        show_traces()
+    with st.sidebar.expander("Startup profile"):
+        st.table(startup_report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,14 +1,42 @@
-from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_classic.agents import create_tool_calling_agent, AgentExecutor
-from langchain_classic.chains import LLMChain
+from .lazy import timed_import
+from .llm_cache import get_llm_cache, with_cached_streaming
+from .config import llm_cache_max_temperature
+
+model_name = "claude-sonnet-4-5-20250929"
+
+# Optional override for every agent/router llm: factory(temperature) -> chat model (fakes for benchmarks, replay)
+LLM_FACTORY = None
+
+def set_llm_factory(factory):
+    global LLM_FACTORY
+    previous = LLM_FACTORY
+    LLM_FACTORY = factory
+    return previous
+
+# Heavy SDK imports (anthropic client, agent executors) are deferred until something is actually built
+def anthropic_llm(temperature):
+    chat_anthropic = timed_import("langchain_anthropic").ChatAnthropic
+    return chat_anthropic(model = model_name, temperature = temperature)
+
+# Responses are cached (when the llm cache is on) only for near-deterministic calls: router 0.0, agents 0.1-0.2
+def create_llm(temperature):
+    llm = LLM_FACTORY(temperature) if LLM_FACTORY is not None else anthropic_llm(temperature)
+    cache = get_llm_cache() if temperature <= llm_cache_max_temperature else None
+    if cache is not None:
+        llm = with_cached_streaming(llm)
+        llm.cache = cache
+    return llm
+
+def _agent_executor(llm, tools, prompt):
+    agents = timed_import("langchain_classic.agents")
+    agent = agents.create_tool_calling_agent(llm, tools, prompt)
+    # cached llms stream too (with_cached_streaming checks the cache before streaming and stores the final message)
+    return agents.AgentExecutor(agent = agent, tools = tools, verbose = True, return_intermediate_steps=True, stream_runnable = True)
 
 # RAG glossary agent
 def create_glossary_agent(tools):
-    llm = ChatAnthropic(
-        model="claude-sonnet-4-5-20250929",
-        temperature = 0.1
-        )
+    llm = create_llm(0.1)
     prompt = ChatPromptTemplate.from_messages([
         ("system", 
         "You are a finance glossary tutor for Apple financial metrics. "
@@ -18,62 +46,58 @@ def create_glossary_agent(tools):
         ("human", "{input}"),
         MessagesPlaceholder("agent_scratchpad")
         ])
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    executor = AgentExecutor(agent = agent, tools = tools, verbose = True, return_intermediate_steps=True)
-    return executor
+    return _agent_executor(llm, tools, prompt)
         
+# Schema goes into the system prompt so agents skip the schema_info_tool round trip; `schema` may be a callable
+def _with_schema(prompt, schema):
+    if schema is None:
+        schema = "Not provided; call schema_info_tool to see available columns."
+    return prompt.partial(schema = schema)
+
 # Analyst agent
-def create_analyst_agent(tools):
-    llm = ChatAnthropic(
-        model="claude-sonnet-4-5-20250929",
-        temperature=0.1
-        )
+def create_analyst_agent(tools, schema = None):
+    llm = create_llm(0.1)
     prompt = ChatPromptTemplate.from_messages([
         ("system",
          "You are an expert Apple financial analyst. "
-         "always Call the schema_info_tool first to see available columns"
+         "The table schema is listed below; use it directly instead of calling schema_info_tool. "
          "Use the tools to fetch accurate historical data from the horizon presented in the data. "
          "Prefer metric tools for standard trends and the SQL tool for complex filters. "
+         "Tool results are column-oriented: {{\"data\": {{column: [values...]}}, \"rows\": n}}; long results are truncated and carry a summary. "
+         "For changes between two years, YoY growth or CAGR use metric_change_tool / metric_growth_tool instead of computing them yourself. "
          "If a requested metric is not in schema, use SQL to compute it from available columns. "
          "Use only the apple_financials table name in SQL. "
-         "Always explain your reasoning in clear, logical CFO-friendly language."),
+         "Always explain your reasoning in clear, logical CFO-friendly language.\n\n"
+         "Schema:\n{schema}"),
         ("human", "{input}"),
         MessagesPlaceholder("agent_scratchpad")
         ])
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    executor = AgentExecutor(agent = agent, tools = tools, verbose = True, return_intermediate_steps=True)
-    return executor
+    return _agent_executor(llm, tools, _with_schema(prompt, schema))
 
 # Charting agent
-def create_chart_agent(tools):
-    llm = ChatAnthropic(
-        model="claude-sonnet-4-5-20250929",
-        temperature = 0.2
-        )  
+def create_chart_agent(tools, schema = None):
+    llm = create_llm(0.2)
     prompt = ChatPromptTemplate.from_messages([
         ("system",
          "You are a data visualization expert. "
          "Create clear charts and briefly explain insights. "
-         "Always call the schema_info_tool first to see available columns. "
+         "The table schema is listed below; use it directly instead of calling schema_info_tool. "
          "Always use plotting tools to generate charts when the user asks for visuals. "
          "When comparisons involve multiple metrics, use the multi-metric plotting tool. "
+         "Plotting tools return the chart path and a summary of the plotted data; you do not need to fetch the same data again. "
          "Use metric tools to fetch data if/when needed. "
          "If a requested metric is not in the schema, use SQL to compute it from available columns. "
          "Use only the apple_financials table name in SQL. "
-         "Keep explanations concise and focus attention on what the chart(s) show."),
+         "Keep explanations concise and focus attention on what the chart(s) show.\n\n"
+         "Schema:\n{schema}"),
         ("human", "{input}"),
         MessagesPlaceholder("agent_scratchpad")
         ])
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    executor = AgentExecutor(agent = agent, tools = tools, verbose = True, return_intermediate_steps=True)
-    return executor
+    return _agent_executor(llm, tools, _with_schema(prompt, schema))
 
 # Router chain logic
 def create_router_chain():
-    llm = ChatAnthropic(
-        model = "claude-sonnet-4-5-20250929",    ## revert to older model (verfify this)
-        temperature = 0.0
-        )
+    llm = create_llm(0.0)
     prompt = ChatPromptTemplate.from_messages([
         ("system",
          "You are a router for an Apple financial assistant. "
@@ -81,5 +105,5 @@ def create_router_chain():
          "Respond with ONLY one of: analysis, analysis_with_chart, definition, other."),
         ("human", "{input}")
         ])
-    chain = LLMChain(llm = llm, prompt = prompt)
+    chain = timed_import("langchain_classic.chains").LLMChain(llm = llm, prompt = prompt)
     return chain
\ No newline at end of file
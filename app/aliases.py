@@ -0,0 +1,171 @@
+import difflib
+import re
+import threading
+from .config import alias_fuzzy_cutoff
+
+# Alias registry -> one compiled regex (longest alias first = longest match wins) + difflib fuzzy pass for typos
+
+# Phrasings neither the schema nor the glossary headings produce (these win over generated aliases)
+extra_aliases = {
+    "operating income": "operating_income_millions",
+    "op income": "operating_income_millions",
+    "cash": "cash_on_hand_millions",
+    "long term debt": "long_term_debt_millions",
+    "pe ratio": "pe_ratio",
+    "p e ratio": "pe_ratio",
+    "price to earnings": "pe_ratio",
+    "debt to assets": "debt_to_assets_ratio",
+    "headcount": "employees",
+    "sales": "revenue_millions",
+    }
+# Columns that are not metrics
+non_metric_columns = {"year", "date", "granularity", "symbol"}
+
+_stopwords = {
+    "a", "an", "the", "of", "for", "to", "from", "in", "on", "and", "or", "by", "with", "between", "vs", "versus",
+    "me", "show", "give", "get", "tell", "please", "can", "you", "could", "what", "was", "were", "is", "are",
+    "how", "did", "does", "do", "apple", "apples", "s", "its", "their", "over", "through", "since", "plot",
+    "chart", "graph", "trend", "trends", "time", "year", "years", "compare", "between", "explain", "define",
+    "mean", "meaning", "change", "growth", "last", "past", "each", "per", "about", "this", "that", "which",
+    }
+_word_re = re.compile(r"[a-z0-9]+")
+
+def normalize_phrase(text):
+    return " ".join(_word_re.findall(text.lower().replace("_", " ")))
+
+# phrase -> column from schema column names, glossary headings ("Net Income (`net_income_millions`)") and extras
+def build_aliases(columns = None, sections = ()):
+    available = set(columns) if columns else None
+    aliases = {}
+    def add(phrase, column):
+        phrase = normalize_phrase(phrase)
+        if phrase and column not in non_metric_columns and (available is None or column in available):
+            aliases.setdefault(phrase, column)
+    for section in sections:
+        column = section.get("column")
+        if column:
+            add(section["title"].replace("-", " ").replace("/", " "), column)
+    for column in (columns or []):
+        add(column, column)
+        add(column.removesuffix("_millions"), column)
+    for phrase, column in extra_aliases.items():
+        phrase = normalize_phrase(phrase)
+        if column not in non_metric_columns and (available is None or column in available):
+            aliases[phrase] = column
+    return aliases
+
+class AliasResolver:
+    def __init__(self, aliases, fuzzy_cutoff = alias_fuzzy_cutoff, max_fuzzy_cache = 4096):
+        self.aliases = dict(aliases)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.max_fuzzy_cache = max_fuzzy_cache
+        self._fuzzy_cache = {}
+        # "gross profit margin" before "gross profit"; words may be joined by spaces, underscores or hyphens
+        ordered = sorted(self.aliases, key = len, reverse = True)
+        pattern = "|".join(r"[\s_\-/]+".join(re.escape(word) for word in phrase.split()) for phrase in ordered)
+        self.pattern = re.compile(rf"\b(?:{pattern})\b") if ordered else None
+        self.by_words = {}
+        for phrase in ordered:
+            self.by_words.setdefault(len(phrase.split()), []).append(phrase)
+        self.max_words = max(self.by_words) if self.by_words else 0
+        self.canonical = {}             # first alias per column: the glossary title when there is one
+        for phrase, column in self.aliases.items():
+            self.canonical.setdefault(column, phrase)
+
+    # (start, end, column, score) in question order; exact matches score 1.0, typo matches their similarity
+    def matches(self, question, fuzzy = True):
+        text = question.lower()
+        found = []
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text):
+                found.append((match.start(), match.end(), self.aliases[normalize_phrase(match.group(0))], 1.0))
+        if fuzzy and self.fuzzy_cutoff < 1.0:
+            found.extend(self._fuzzy_matches(text, found))
+        return sorted(found)
+
+    def metrics(self, question, fuzzy = True):
+        columns = []
+        for _, _, column, _ in self.matches(question, fuzzy):
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    # Lowercased question with typo'd mentions replaced by their column's canonical phrase ("plot revnue" -> "plot revenue")
+    def canonicalize(self, question):
+        text = question.lower()
+        for start, end, column, score in reversed(self.matches(question)):
+            if score < 1.0:
+                text = text[:start] + self.canonical[column] + text[end:]
+        return text
+
+    # runs of uncovered non-stopwords; longest n-gram first, each word used at most once
+    def _fuzzy_matches(self, text, exact):
+        covered = [(start, end) for start, end, _, _ in exact]
+        words = [m for m in re.finditer(r"[a-z][a-z0-9]*", text)
+                 if not any(s <= m.start() < e for s, e in covered)]
+        runs, prev_end = [], None
+        for word in words:
+            if word.group(0) in _stopwords:
+                prev_end = None
+                continue
+            if prev_end is not None and text[prev_end:word.start()].strip(" -_") == "":
+                runs[-1].append(word)
+            else:
+                runs.append([word])
+            prev_end = word.end()
+        found = []
+        for run in runs:
+            i = 0
+            while i < len(run):
+                for n in range(min(self.max_words, len(run) - i), 0, -1):
+                    gram = " ".join(w.group(0) for w in run[i:i + n])
+                    if n == 1 and len(gram) < 4:
+                        continue
+                    hit = self._closest(gram, n)
+                    if hit is not None:
+                        phrase, score = hit
+                        found.append((run[i].start(), run[i + n - 1].end(), self.aliases[phrase], score))
+                        i += n
+                        break
+                else:
+                    i += 1
+        return found
+
+    def _closest(self, gram, n):
+        key = (gram, n)
+        if key in self._fuzzy_cache:
+            return self._fuzzy_cache[key]
+        hit = None
+        candidates = difflib.get_close_matches(gram, self.by_words.get(n, []), n = 1, cutoff = self.fuzzy_cutoff)
+        if candidates:
+            hit = (candidates[0], difflib.SequenceMatcher(None, gram, candidates[0]).ratio())
+        if len(self._fuzzy_cache) >= self.max_fuzzy_cache:
+            self._fuzzy_cache.clear()
+        self._fuzzy_cache[key] = hit
+        return hit
+
+# One resolver per column set (schema catalog columns when not given), glossary headings read once
+ALIAS_RESOLVERS = {}
+_alias_resolvers_lock = threading.Lock()
+
+def _catalog_columns():
+    from .db import SCHEMA_CATALOG
+    columns = set()
+    for table_name, entry in list(SCHEMA_CATALOG.items()):
+        if not table_name.startswith("ts_"):      # period datasets have their own tool
+            columns.update(entry["columns"])
+    return columns
+
+def get_alias_resolver(columns = None):
+    if columns is None:
+        columns = _catalog_columns()
+    key = tuple(sorted(columns))
+    with _alias_resolvers_lock:
+        resolver = ALIAS_RESOLVERS.get(key)
+        if resolver is None:
+            from .glossary_index import get_glossary_index
+            resolver = AliasResolver(build_aliases(key, get_glossary_index().sections))
+            if len(ALIAS_RESOLVERS) >= 8:
+                ALIAS_RESOLVERS.clear()
+            ALIAS_RESOLVERS[key] = resolver
+    return resolver
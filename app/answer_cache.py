@@ -0,0 +1,207 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from .config import answer_cache_path, answer_cache_max_entries, answer_cache_similarity
+from .graph import extract_year_bounds, resolve_metrics_from_question
+from .router import rule_route
+
+# Words that carry no meaning for "same question?" (years/metrics are matched exactly elsewhere)
+_stopwords = {
+    "a", "an", "the", "of", "for", "to", "from", "in", "on", "and", "or", "by", "with", "between",
+    "me", "show", "give", "get", "tell", "please", "can", "you", "could", "what", "was", "were",
+    "is", "are", "how", "did", "does", "do", "apple", "apples", "s", "its", "their", "over", "through",
+    # presentation only: "revenue trend 2015-2024" asks for the same range as "show revenue from 2015 to 2024"
+    "trend", "trends", "display", "list", "time", "history", "historical", "evolution", "years", "across", "during",
+    "plot", "chart", "graph", "draw", "much", "make", "made",
+    # definition phrasing: "what does eps mean" = "what is eps" ("the mean of" still counts as an average below)
+    "mean", "means", "meaning", "define", "definition",
+    }
+
+# Words that change what is computed ("net income" vs "net income growth"); stems -> operation, part of the exact signature
+operation_words = {
+    "growth": "growth", "grow": "growth", "grew": "growth", "growing": "growth", "yoy": "growth", "cagr": "growth",
+    "change": "change", "changed": "change", "delta": "change", "difference": "change", "differ": "change",
+    "increase": "increase", "increased": "increase", "rise": "increase", "rose": "increase", "up": "increase",
+    "decrease": "decrease", "decreased": "decrease", "fall": "decrease", "fell": "decrease", "drop": "decrease",
+    "dropped": "decrease", "decline": "decrease", "declined": "decrease", "down": "decrease",
+    "average": "average", "avg": "average", "mean": "average", "median": "median",
+    "total": "total", "sum": "total", "cumulative": "total",
+    "highest": "max", "max": "max", "maximum": "max", "peak": "max", "best": "max", "largest": "max", "most": "max",
+    "lowest": "min", "min": "min", "minimum": "min", "worst": "min", "smallest": "min", "least": "min",
+    "why": "why", "reason": "why", "because": "why", "explain": "why", "driver": "why", "drivers": "why",
+    "vs": "compare", "versus": "compare", "compare": "compare", "compared": "compare", "comparison": "compare",
+    "ratio": "ratio", "per": "ratio", "share": "ratio", "percent": "percent", "percentage": "percent",
+    "forecast": "forecast", "predict": "forecast", "projection": "forecast", "project": "forecast",
+    "rank": "rank", "top": "rank", "first": "first", "last": "last", "latest": "last",
+    "before": "before", "after": "after", "since": "since",
+    "quarter": "quarter", "quarterly": "quarter", "month": "month", "monthly": "month", "not": "not", "without": "not",
+    }
+
+# "mean" is an average only as a noun ("the mean revenue", "mean of"), not in "what does eps mean"
+_average_mean_re = re.compile(r"\b(?:the|a|arithmetic)\s+mean\b|\bmean\s+(?:of|value|annual|yearly)\b")
+
+def question_operations(question):
+    question = question.lower()
+    words = re.findall(r"[a-z]+", question)
+    operations = {operation_words[w] for w in words if w in operation_words and w != "mean"}
+    if "mean" in words and _average_mean_re.search(question):
+        operations.add("average")
+    return sorted(operations)
+
+def _words(question):
+    return [w for w in re.findall(r"[a-z]+", question.lower()) if w not in _stopwords]
+
+# Cheap local embedding: tf-weighted words + char trigrams, L2-normalized sparse vector
+def embed_question(question):
+    features = Counter()
+    for word in _words(question):
+        features[f"w:{word}"] += 2
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            features[f"c:{padded[i:i + 3]}"] += 1
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {k: v / norm for k, v in features.items()}
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+# Exact-match guard: the cache may only answer when years + metrics + intent + operations agree
+def question_signature(question, available_columns):
+    start_year, end_year = extract_year_bounds(question)
+    metrics = tuple(sorted(resolve_metrics_from_question(question, available_columns)))
+    intent = rule_route(question)
+    return [start_year, end_year, list(metrics), intent == "definition", question_operations(question)]
+
+# SQLite-persisted, size-bounded (LRU) semantic cache in front of run_question. Every store is one row write (WAL, safe
+# across processes); each process keeps the vectors in memory and picks up rows other processes added since its last read
+class AnswerCache:
+    def __init__(self, dataset_version, available_columns, path = answer_cache_path,
+                 max_entries = answer_cache_max_entries, threshold = answer_cache_similarity):
+        self.dataset_version = str(dataset_version)
+        self.available_columns = list(available_columns)
+        self.path = ":memory:" if path is None else str(path)
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.entries = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_rowid = 0
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+        self._conn = sqlite3.connect(self.path, check_same_thread = False, timeout = 30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answer_cache ("
+            "question TEXT PRIMARY KEY, dataset_version TEXT, signature TEXT, route TEXT, output TEXT, image_path TEXT, last_used REAL)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answer_cache_last_used ON answer_cache(last_used)")
+        # dataset changed: old answers are stale
+        self._conn.execute("DELETE FROM answer_cache WHERE dataset_version != ?", (self.dataset_version,))
+        self._conn.commit()
+        with self._lock:
+            self._refresh()
+
+    # Rows written since the last read (ours or another process's); INSERT OR REPLACE gives a rewritten row a new rowid
+    def _refresh(self):
+        rows = self._conn.execute(
+            "SELECT rowid, question, signature, route, output, image_path, last_used FROM answer_cache "
+            "WHERE rowid > ? AND dataset_version = ? ORDER BY rowid", (self._last_rowid, self.dataset_version),
+            ).fetchall()
+        if not rows:
+            return
+        fresh = {}
+        for rowid, question, signature, route, output, image_path, last_used in rows:
+            fresh[question] = {
+                "question": question,
+                "signature": json.loads(signature),
+                "route": route,
+                "output": output,
+                "image_path": image_path,
+                "last_used": last_used,
+                "vector": embed_question(question),
+                }
+            self._last_rowid = max(self._last_rowid, rowid)
+        self.entries = [e for e in self.entries if e["question"] not in fresh] + list(fresh.values())
+        if len(self.entries) > self.max_entries:
+            self.entries.sort(key = lambda e: e["last_used"])
+            del self.entries[:len(self.entries) - self.max_entries]
+
+    def _forget(self, entry):
+        self.entries.remove(entry)
+        self._conn.execute("DELETE FROM answer_cache WHERE question = ?", (entry["question"],))
+        self._conn.commit()
+
+    def lookup(self, question):
+        signature = question_signature(question, self.available_columns)
+        wants_chart = rule_route(question) == "analysis_with_chart"
+        vector = embed_question(question)
+        with self._lock:
+            self._refresh()
+            best, best_score = None, 0.0
+            for entry in self.entries:
+                if entry["signature"] != signature:
+                    continue
+                if wants_chart and not entry.get("image_path"):
+                    continue
+                score = cosine(vector, entry["vector"])
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            if best.get("image_path") and not os.path.exists(best["image_path"]):
+                self._forget(best)
+                self.misses += 1
+                return None
+            best["last_used"] = time.time()
+            self._conn.execute("UPDATE answer_cache SET last_used = ? WHERE question = ?", (best["last_used"], best["question"]))
+            self._conn.commit()
+            self.hits += 1
+            return {"route": best["route"], "output": best["output"], "image_path": best.get("image_path"), "similarity": best_score}
+
+    def store(self, question, route, output, image_path = None):
+        if not output or route not in ("analysis", "analysis_with_chart", "definition"):
+            return
+        signature = json.dumps(question_signature(question, self.available_columns))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache (question, dataset_version, signature, route, output, image_path, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (question, self.dataset_version, signature, route, output, image_path, time.time()),
+                )
+            self._evict()
+            self._conn.commit()
+            self._refresh()
+
+    # least recently used rows go first (shared table: whichever process writes keeps it within max_entries)
+    def _evict(self):
+        overflow = self._conn.execute("SELECT count(*) FROM answer_cache").fetchone()[0] - self.max_entries
+        if overflow <= 0:
+            return
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT question FROM answer_cache ORDER BY last_used LIMIT ?", (overflow,)).fetchall()]
+        self._conn.executemany("DELETE FROM answer_cache WHERE question = ?", [(q,) for q in evicted])
+        evicted = set(evicted)
+        self.entries = [e for e in self.entries if e["question"] not in evicted]
+        self.evictions += overflow
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "dataset_version": self.dataset_version,
+                }
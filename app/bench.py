@@ -0,0 +1,802 @@
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import duckdb
+import pandas as pd
+from .config import apple_csv_path, data_dir
+from .data_loader import cleaned_data, cleaned_data_sql
+from .db import duckdb_connection, table_registration, get_table_columns, run_sql, SQL_RESULT_CACHE, CursorPool
+from .queries import range_sql, derived_pair_sql, bind_year, bind_text
+from .metrics import metric_over_time, multi_metrics_over_time, metric_btwn_yrs, metric_change, metric_growth
+
+### ---Ingestion---
+
+# Same schema/format as the apple csv ("$1,234 ", "$6.08 ", "46.21%"), generated inside duckdb
+def write_synthetic_csv(path, rows):
+    conn = duckdb.connect()
+    money = lambda col, scale: f"'$' || format('{{:,}}', ((i * {scale}) % 500000)::BIGINT) || ' ' AS {col}"
+    conn.execute(
+        f"""
+        COPY (
+            SELECT
+                2009 + (i % 16) AS year,
+                {money('ebitda_millions', 7)},
+                {money('revenue_millions', 13)},
+                {money('gross_profit_millions', 5)},
+                {money('op_income_millions', 3)},
+                {money('net_income_millions', 2)},
+                '$' || printf('%.2f', (i % 700) / 100.0) || ' ' AS eps,
+                format('{{:,}}', 15000 + i % 15000) AS shares_outstanding,
+                round(20 + (i % 2300) / 10.0, 4) AS year_close_price,
+                {money('total_assets_millions', 17)},
+                {money('cash_on_hand_millions', 11)},
+                {money('long_term_debt_millions', 9)},
+                {money('total_liabilities_millions', 19)},
+                printf('%.2f', 35 + (i % 1200) / 100.0) || '%' AS gross_margin,
+                round(10 + (i % 300) / 10.0, 2) AS pe_ratio,
+                format('{{:,}}', 30000 + i % 140000) AS employees
+            FROM range(1, {int(rows) + 1}) t(i)
+        ) TO '{path}' (HEADER, DELIMITER ',')
+        """
+        )
+    conn.close()
+
+# Duckdb ingestion must match the pandas reference cleaner column-for-column
+def check_ingestion_equivalence(csv_path = apple_csv_path):
+    conn = duckdb.connect()
+    expected = cleaned_data(csv_path)
+    actual = conn.execute(cleaned_data_sql(conn, csv_path)).df()
+    conn.close()
+    expected["year"] = expected["year"].astype("int64")
+    pd.testing.assert_frame_equal(actual, expected, check_dtype = True)
+    return True
+
+def bench_ingestion(rows = 2_000_000, include_pandas = True):
+    results = {"rows": rows, "equivalent": check_ingestion_equivalence()}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "synthetic.csv"
+        start = time.perf_counter()
+        write_synthetic_csv(csv_path, rows)
+        results["generate_s"] = time.perf_counter() - start
+
+        conn = duckdb.connect()
+        start = time.perf_counter()
+        conn.execute(f"CREATE TABLE bench_ingest AS {cleaned_data_sql(conn, csv_path)}")
+        elapsed = time.perf_counter() - start
+        conn.close()
+        results["duckdb_s"] = elapsed
+        results["duckdb_rows_per_s"] = rows / elapsed
+
+        if include_pandas:
+            start = time.perf_counter()
+            cleaned_data(csv_path)
+            elapsed = time.perf_counter() - start
+            results["pandas_s"] = elapsed
+            results["pandas_rows_per_s"] = rows / elapsed
+    return results
+
+### ---Metric queries---
+
+# Pre-parameter behaviour: fresh f-string SQL per call (new text, new cache key every time)
+def _legacy_metric_over_time(conn, metrics, start_year, end_year):
+    where_clauses = ["1=1"]
+    if start_year is not None:
+        where_clauses.append(f"year >= {int(start_year)}")
+    if end_year is not None:
+        where_clauses.append(f"year <= {int(end_year)}")
+    query = f"SELECT {', '.join(['year'] + metrics)} FROM apple_financials WHERE {' AND '.join(where_clauses)} ORDER BY year"
+    return run_sql(conn, query, use_cache = False)
+
+def _legacy_metric_btwn_yrs(conn, metric, year_a, year_b):
+    return run_sql(conn, f"SELECT year, {metric} FROM apple_financials WHERE year in ({year_a}, {year_b}) ORDER BY year", use_cache = False)
+
+# Same statements two ways: bound parameters (what the tools run) vs PREPARE once per connection + EXECUTE name(<literals>).
+# duckdb's python api has no statement handle and EXECUTE can't take ?/$n parameters, so the second is the only plan reuse
+def _statement_call(conn, prepared, kind, metrics, start, end):
+    query = derived_pair_sql() if kind == "pair" else range_sql(metrics)
+    params = [bind_year(start), bind_year(end)]
+    if kind == "pair":
+        params = [metrics[0]] + params
+    if prepared is None:
+        return run_sql(conn, query, params, use_cache = False)
+    name = prepared.get(query)
+    if name is None:
+        name = prepared[query] = f"bench_{len(prepared)}"
+        conn.execute(f"PREPARE {name} AS {query}")
+    args_sql = ", ".join("NULL" if p is None else (bind_text(p) if isinstance(p, str) else str(p)) for p in params)
+    return run_sql(conn, f"EXECUTE {name}({args_sql})", use_cache = False)
+
+# Tight loop of tool-shaped calls, result cache off so only parse/plan/execute is measured
+def bench_metric_queries(iterations = 2000, repeats = 3):
+    conn = duckdb_connection()
+    table_registration(conn)
+    calls = [
+        ("single", ["revenue_millions"], 2010, 2024),
+        ("single", ["eps"], 2015, None),
+        ("multi", ["revenue_millions", "net_income_millions"], 2012, 2020),
+        ("multi", ["operating_income_millions", "net_income_millions", "gross_margin"], None, 2022),
+        ("pair", ["net_income_millions"], 2015, 2024),
+        ]
+    def legacy(kind, metrics, start, end):
+        if kind == "pair":
+            return _legacy_metric_btwn_yrs(conn, metrics[0], start, end)
+        return _legacy_metric_over_time(conn, metrics, start, end)
+    def bound(kind, metrics, start, end):
+        if kind == "pair":
+            return metric_btwn_yrs(conn, metrics[0], start, end)
+        if kind == "single":
+            return metric_over_time(conn, metrics[0], start, end)
+        return multi_metrics_over_time(conn, metrics, start, end)
+    prepared_names = {}
+    def bound_sql(kind, metrics, start, end):
+        return _statement_call(conn, None, kind, metrics, start, end)
+    def prepared(kind, metrics, start, end):
+        return _statement_call(conn, prepared_names, kind, metrics, start, end)
+
+    results = {"iterations": iterations}
+    was_enabled = SQL_RESULT_CACHE.enabled
+    SQL_RESULT_CACHE.enabled = False
+    try:
+        for label, fn in (("fstring", legacy), ("bound", bound), ("bound_sql", bound_sql), ("prepared", prepared)):
+            for call in calls:      # warm-up
+                fn(*call)
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for i in range(iterations):
+                    fn(*calls[i % len(calls)])
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[f"{label}_us_per_call"] = best / iterations * 1e6
+    finally:
+        SQL_RESULT_CACHE.enabled = was_enabled
+        conn.close()
+    results["speedup"] = results["fstring_us_per_call"] / results["bound_us_per_call"]
+    results["prepared_speedup"] = results["bound_sql_us_per_call"] / results["prepared_us_per_call"]
+    return results
+
+### ---Cursor pool---
+
+# Query mix that keeps duckdb busy (it releases the GIL while executing)
+_pool_query = (
+    "SELECT sum(revenue_millions * (i % 7)) AS total, avg(net_income_millions / (1 + i % 5)) AS ratio "
+    "FROM apple_financials, range({n}) t(i) WHERE year >= {year}"
+    )
+
+# Same threads, same queries: one shared connection (serialized) vs a cursor per call from CursorPool
+def bench_cursor_pool(threads = (1, 2, 4, 8), calls = 64, fanout = 20000):
+    conn = duckdb_connection()
+    table_registration(conn)
+    results = {"calls": calls, "fanout_rows": fanout}
+    was_enabled = SQL_RESULT_CACHE.enabled
+    SQL_RESULT_CACHE.enabled = False
+    try:
+        for label in ("shared", "pool"):
+            for n_threads in threads:
+                source = CursorPool(conn, size = n_threads) if label == "pool" else conn
+                queries = [_pool_query.format(n = fanout, year = 2000 + i % 20) for i in range(calls)]
+                with ThreadPoolExecutor(max_workers = n_threads) as pool:
+                    start = time.perf_counter()
+                    frames = list(pool.map(lambda query: run_sql(source, query), queries))
+                    elapsed = time.perf_counter() - start
+                failed = sum(1 for frame in frames if "error" in frame.columns)
+                results[f"{label}_t{n_threads}_queries_per_s"] = calls / elapsed
+                if failed:
+                    results[f"{label}_t{n_threads}_failed"] = failed
+                if label == "pool":
+                    results[f"pool_t{n_threads}_wait_ms_avg"] = source.stats()["wait_ms_avg"]
+                    source.close()
+    finally:
+        SQL_RESULT_CACHE.enabled = was_enabled
+        conn.close()
+    return results
+
+### ---Startup---
+
+# Modules that must not be loaded just by starting the app (only by the route that needs them)
+heavy_modules = ["langchain_anthropic", "langchain_classic.agents", "matplotlib", "langchain_huggingface", "chromadb", "torch"]
+
+_startup_script = """
+import json, sys, time
+start = time.perf_counter()
+from app.runtime import init_graph
+imported = time.perf_counter()
+init_graph()
+ready = time.perf_counter()
+from app.lazy import startup_report
+print(json.dumps({
+    "import_s": imported - start,
+    "init_graph_s": ready - imported,
+    "loaded": [m for m in HEAVY if m in sys.modules],
+    "phases": startup_report(),
+    }))
+"""
+
+# Cold start in a fresh interpreter each run (nothing cached in sys.modules)
+def bench_startup(runs = 3):
+    script = _startup_script.replace("HEAVY", repr(heavy_modules))
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", script], capture_output = True, text = True, check = True)
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    best = min(samples, key = lambda sample: sample["import_s"] + sample["init_graph_s"])
+    results = {
+        "runs": runs,
+        "import_s": best["import_s"],
+        "init_graph_s": best["init_graph_s"],
+        "total_s": best["import_s"] + best["init_graph_s"],
+        "heavy_loaded": ", ".join(best["loaded"]) or "none",
+        }
+    for phase in best["phases"]:
+        results[f"{phase['kind']}:{phase['name']}"] = phase["seconds"]
+    return results
+
+### ---Concurrency---
+
+throughput_questions = [
+    "What was Apple's revenue from 2015 to 2024?",
+    "How did net income change between 2018 and 2022?",
+    "Show operating income over the last decade",
+    "What was gross margin in 2020 compared to 2019?",
+    ]
+
+# Questions/sec through run_questions at several concurrency limits, llm replaced by a fixed-latency fake
+def bench_throughput(questions = 32, concurrencies = (1, 2, 4, 8, 16), latency_s = 0.05):
+    from .agents import set_llm_factory
+    from .fake_llm import fake_llm_factory
+    from .runtime import init_graph, run_questions
+    previous = set_llm_factory(fake_llm_factory(latency_s))
+    results = {"questions": questions, "llm_latency_s": latency_s}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):        # agent executors are verbose
+            graph = init_graph()
+            batch = [throughput_questions[i % len(throughput_questions)] for i in range(questions)]
+            run_questions(graph, batch[:2], concurrency = 2, use_cache = False)     # warm-up (lazy agents, plans)
+            for concurrency in concurrencies:
+                start = time.perf_counter()
+                answers = run_questions(graph, batch, concurrency = concurrency, use_cache = False)
+                elapsed = time.perf_counter() - start
+                failed = sum(1 for route, _ in answers if route in ("error", "timeout"))
+                results[f"c{concurrency}_questions_per_s"] = questions / elapsed
+                results[f"c{concurrency}_failed"] = failed
+    finally:
+        set_llm_factory(previous)
+    return results
+
+### ---LLM response cache---
+
+# Same question set twice through the graph with a fresh sqlite llm cache: cold pass pays llm latency, warm pass should not
+def bench_llm_cache(questions = 8, latency_s = 0.2):
+    from .agents import set_llm_factory
+    from .fake_llm import fake_llm_factory
+    from .llm_cache import SQLiteLLMCache, set_llm_cache
+    from .runtime import init_graph, run_question
+    previous_factory = set_llm_factory(fake_llm_factory(latency_s))
+    results = {"questions": questions, "llm_latency_s": latency_s}
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SQLiteLLMCache(Path(tmp)/"llm_cache.sqlite")
+        previous_cache = set_llm_cache(cache)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                graph = init_graph()
+                batch = [throughput_questions[i % len(throughput_questions)] for i in range(questions)]
+                for name in ("cold", "warm"):
+                    start = time.perf_counter()
+                    for question in batch:
+                        run_question(graph, question, use_cache = False)
+                    results[f"{name}_s_per_question"] = (time.perf_counter() - start) / questions
+                    results[f"{name}_hit_rate"] = cache.stats()["hit_rate"]
+        finally:
+            set_llm_cache(previous_cache)
+            set_llm_factory(previous_factory)
+        stats = cache.stats()
+    results.update({"hits": stats["hits"], "misses": stats["misses"], "entries": stats["entries"], "bytes": stats["bytes"]})
+    return results
+
+### ---Alias resolution---
+
+# The old graph.resolve_metrics_from_question: substring checks over a fixed dict, then every column name
+_legacy_aliases = {
+    "operating income": "operating_income_millions", "op income": "operating_income_millions",
+    "net income": "net_income_millions", "revenue": "revenue_millions", "gross profit": "gross_profit_millions",
+    "ebitda": "ebitda_millions", "gross margin": "gross_margin", "net profit margin": "net_profit_margin",
+    "operating margin": "operating_margin", "cash": "cash_on_hand_millions", "cash on hand": "cash_on_hand_millions",
+    "long term debt": "long_term_debt_millions", "total assets": "total_assets_millions",
+    "total liabilities": "total_liabilities_millions", "shares outstanding": "shares_outstanding",
+    "employees": "employees", "eps": "eps", "pe ratio": "pe_ratio",
+    }
+
+def _legacy_resolve_metrics(question, available_columns):
+    q = question.lower()
+    available = set(available_columns)
+    metrics = []
+    for phrase, column in _legacy_aliases.items():
+        if phrase in q and column in available:
+            metrics.append(column)
+    for column in available:
+        if column in q and column not in metrics:
+            metrics.append(column)
+    return metrics
+
+alias_templates = [
+    "plot {a} from {y0} to {y1}",
+    "how did {a} change between {y0} and {y1}",
+    "compare {a} and {b} since {y0}",
+    "what was apple's {a} in {y1}",
+    "chart {a} vs {b} {y0}-{y1}",
+    "show the trend of {a} over time",
+    ]
+
+def _typo(phrase, rng):
+    words = phrase.split()
+    i = max(range(len(words)), key = lambda k: len(words[k]))
+    word = words[i]
+    if len(word) < 5:
+        return phrase
+    j = rng.randrange(1, len(word) - 1)
+    words[i] = word[:j] + word[j + 1:] if rng.random() < 0.5 else word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    return " ".join(words)
+
+# Synthetic questions with known answers: (question, expected columns, has_typo)
+def alias_corpus(phrases, size, typo_rate = 0.2, seed = 7):
+    import random
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        template = rng.choice(alias_templates)
+        (pa, ca), (pb, cb) = rng.sample(phrases, 2)
+        if ca == cb:
+            continue
+        typo = rng.random() < typo_rate
+        a = _typo(pa, rng) if typo else pa
+        y0 = rng.randrange(2009, 2020)
+        question = template.format(a = a, b = pb, y0 = y0, y1 = rng.randrange(y0 + 1, 2025))
+        expected = {ca, cb} if "{b}" in template else {ca}
+        corpus.append((question, expected, typo and a != pa))
+    return corpus
+
+# Accuracy (exact set of metrics) and questions/s: legacy substring scan vs compiled resolver (exact / with typo matching)
+def bench_aliases(size = 20000):
+    from .aliases import get_alias_resolver
+    from .glossary_index import get_glossary_index
+    conn = duckdb_connection()
+    table_registration(conn)
+    columns = get_table_columns(conn)
+    conn.close()
+    resolver = get_alias_resolver(columns)
+    phrases = dict(_legacy_aliases)
+    for section in get_glossary_index().sections:
+        if section.get("column") in columns and section["column"] != "year":
+            phrases.setdefault(section["title"].lower().replace("-", " ").replace("/", ""), section["column"])
+    corpus = alias_corpus(sorted(phrases.items()), size)
+    typos = sum(1 for _, _, typo in corpus if typo)
+    results = {"questions": len(corpus), "with_typos": typos, "aliases": len(resolver.aliases)}
+    variants = {
+        "legacy": lambda q: _legacy_resolve_metrics(q, columns),
+        "compiled": lambda q: resolver.metrics(q, fuzzy = False),
+        "compiled_fuzzy": lambda q: resolver.metrics(q),
+        }
+    for name, resolve in variants.items():
+        resolve(corpus[0][0])
+        start = time.perf_counter()
+        answers = [resolve(question) for question, _, _ in corpus]
+        elapsed = time.perf_counter() - start
+        clean = [set(a) == e for a, (_, e, t) in zip(answers, corpus) if not t]
+        typo = [set(a) == e for a, (_, e, t) in zip(answers, corpus) if t]
+        results[f"{name}_questions_per_s"] = len(corpus) / elapsed
+        results[f"{name}_accuracy_clean"] = sum(clean) / len(clean)
+        results[f"{name}_accuracy_typos"] = (sum(typo) / len(typo)) if typo else 0.0
+    return results
+
+### ---Answer cache---
+
+# (stored, asked, should hit): paraphrases hit, a changed operation (growth/average/why/...) must miss
+answer_cache_pairs = [
+    ("What was net income in 2020?", "What was net income growth in 2020?", False),
+    ("What was net income in 2020?", "What was the average net income in 2020?", False),
+    ("What was net income in 2020?", "Why did net income fall in 2020?", False),
+    ("What was net income in 2020?", "What was the highest net income in 2020?", False),
+    ("What was revenue from 2015 to 2020?", "What was revenue growth from 2015 to 2020?", False),
+    ("Compare revenue and net income in 2020", "What was revenue and net income in 2020?", False),
+    ("What was net income in 2020?", "What was Apple's net income in 2020?", True),
+    ("What was net income in 2020?", "what was the net income for 2020", True),
+    ("Show revenue from 2015 to 2020", "Show me revenue between 2015 and 2020", True),
+    ("revenue trend 2015-2024", "show revenue from 2015 to 2024", True),
+    ("What was revenue over time from 2015 to 2024?", "What was revenue from 2015 to 2024?", True),
+    ("what is eps", "what does eps mean", True),
+    ("What does net profit margin mean?", "Define net profit margin", True),
+    ("What was the mean revenue from 2015 to 2020?", "What was revenue from 2015 to 2020?", False),
+    ("What is eps?", "What is gross margin?", False),
+    ("What was net income in 2020?", "How much net income did Apple make in 2020?", True),
+    ("revenue trend 2015-2024", "plot the revenue trend from 2015 to 2024", True),
+    ("What was revenue in 2020?", "What was iPhone revenue in 2020?", False),
+    ("What was revenue in 2020?", "What was revenue in 2020 in billions?", False),
+    ("What was revenue in 2020?", "What was revenue in 2020 excluding services?", False),
+    ]
+
+# Regression check for near-miss questions; raises with the offending pairs
+def check_answer_cache_near_misses(pairs = answer_cache_pairs):
+    from .answer_cache import AnswerCache
+    conn = duckdb_connection()
+    table_registration(conn)
+    columns = get_table_columns(conn)
+    conn.close()
+    wrong = []
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = str(Path(tmp)/"chart.png")        # every stored answer has a chart, so chart questions can hit too
+        Path(image_path).write_bytes(b"")
+        for stored, asked, should_hit in pairs:
+            cache = AnswerCache("check", columns, path = None)
+            cache.store(stored, "analysis", "cached answer", image_path)
+            hit = cache.lookup(asked)
+            if (hit is not None) != should_hit:
+                wrong.append((stored, asked, "hit" if hit else "miss"))
+    if wrong:
+        raise AssertionError(f"answer cache near-miss check failed: {wrong}")
+    return True
+
+def bench_answer_cache(size = 2000):
+    from .answer_cache import AnswerCache
+    conn = duckdb_connection()
+    table_registration(conn)
+    columns = get_table_columns(conn)
+    conn.close()
+    results = {"near_miss_check": check_answer_cache_near_misses(), "pairs": len(answer_cache_pairs)}
+    cache = AnswerCache("bench", columns, path = None, max_entries = size)
+    questions = [f"What was net income in {2009 + i % 16}? ({i})" for i in range(size)]
+    for question in questions:
+        cache.store(question, "analysis", "answer")
+    start = time.perf_counter()
+    for question in questions[:200]:
+        cache.lookup(question)
+    results["lookup_ms"] = (time.perf_counter() - start) / 200 * 1000
+    return results
+
+### ---Time series---
+
+# symbols x calendar days of synthetic prices/volume (deterministic), generated inside duckdb
+def _synthetic_prices_sql(symbols, days, first_day = "2000-01-01"):
+    return (
+        f"SELECT 'S' || lpad(CAST(s AS VARCHAR), 4, '0') AS symbol, DATE '{first_day}' + CAST(d AS INTEGER) AS \"date\", "
+        "round(50 + s % 200 + 20 * sin(d / 90.0) + d * 0.01, 2) AS close, "
+        "round(50 + s % 200 + 20 * sin(d / 90.0) + d * 0.01 + 1.5, 2) AS high, "
+        "round(50 + s % 200 + 20 * sin(d / 90.0) + d * 0.01 - 1.5, 2) AS low, "
+        "CAST(1000000 + (s * 7919 + d * 104729) % 500000 AS BIGINT) AS volume "
+        f"FROM range({days}) t(d), range({symbols}) u(s)"
+        )
+
+# Period queries over tens of millions of daily rows: hive-partitioned + sorted parquet vs one flat file
+def bench_timeseries(symbols = 2000, days = 10000, repeats = 3):
+    from .timeseries import write_timeseries, period_sql, timeseries_datasets
+    conn = duckdb_connection()
+    results = {"rows": symbols * days, "symbols": symbols, "days": days}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)/"timeseries"
+        flat = (Path(tmp)/"prices_flat.parquet").as_posix()
+        start = time.perf_counter()
+        conn.execute(f"COPY ({_synthetic_prices_sql(symbols, days)}) TO '{flat}' (FORMAT PARQUET)")
+        results["write_flat_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        write_timeseries(conn, "prices", f"SELECT * FROM read_parquet('{flat}')", "day", root)
+        results["write_partitioned_s"] = time.perf_counter() - start
+        view = timeseries_datasets()["prices"]["view"]
+        flat_view = f"(SELECT *, 'day' AS granularity, year(\"date\") AS year FROM read_parquet('{flat}'))"
+        cases = {
+            "monthly_5y": (["close", "volume"], "month", "2015", "2019"),
+            "quarterly_all": (["close", "high", "low"], "quarter", None, None),
+            "daily_1q": (["close"], "day", "2020-Q1", "2020-Q1"),
+            }
+        for name, (metrics, granularity, first, last) in cases.items():
+            query = period_sql("prices", metrics, granularity, first, last, symbol = "S0042")
+            timings = {}
+            frames = {}
+            for layout, sql in (("flat", query.replace(view, flat_view)), ("partitioned", query)):
+                best = float("inf")
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    frames[layout] = conn.execute(sql).df()
+                    best = min(best, time.perf_counter() - start)
+                timings[layout] = best
+            if not frames["flat"].equals(frames["partitioned"]):
+                raise AssertionError(f"{name}: partitioned result differs from the flat file")
+            results[f"{name}_periods"] = len(frames["partitioned"])
+            results[f"{name}_flat_ms"] = timings["flat"] * 1000
+            results[f"{name}_partitioned_ms"] = timings["partitioned"] * 1000
+            results[f"{name}_speedup"] = timings["flat"] / timings["partitioned"]
+    conn.close()
+    return results
+
+### ---Streaming---
+
+# Time to first visible answer token (streaming) vs time to the full answer (blocking run_question)
+def bench_streaming(questions = 4, latency_s = 0.3, token_latency_s = 0.02, answer_words = 80):
+    from .agents import set_llm_factory
+    from .fake_llm import fake_llm_factory
+    from .runtime import init_graph, run_question, stream_question
+    answer = " ".join(["insight"] * answer_words)
+    previous = set_llm_factory(fake_llm_factory(latency_s, token_latency_s = token_latency_s, answer = answer))
+    blocking, first_token, streamed = [], [], []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph = init_graph()
+            for i in range(questions):
+                question = throughput_questions[i % len(throughput_questions)]
+                start = time.perf_counter()
+                run_question(graph, question, use_cache = False)
+                blocking.append(time.perf_counter() - start)
+                for event in stream_question(graph, question, use_cache = False):
+                    if event["type"] == "final":
+                        first_token.append((event["result"]["first_token_ms"] or 0.0) / 1000)
+                        streamed.append(event["result"]["total_ms"] / 1000)
+    finally:
+        set_llm_factory(previous)
+    return {
+        "questions": questions,
+        "blocking_answer_s": sum(blocking) / len(blocking),
+        "stream_first_token_s": sum(first_token) / len(first_token),
+        "stream_full_answer_s": sum(streamed) / len(streamed),
+        }
+
+### ---Tool payloads---
+
+# Tool calls behind the standard questions (trend, comparison, growth, custom SQL, charts)
+payload_calls = [
+    ("metric_over_time_tool", {"metric": "revenue_millions"}),
+    ("metric_over_time_tool", {"metric": "eps", "start_year": 2015, "end_year": 2024}),
+    ("multi_metrics_over_time_tool", {"metrics": ["revenue_millions", "net_income_millions", "gross_margin"]}),
+    ("metric_change_tool", {"metric": "net_income_millions", "year_a": 2015, "year_b": 2024}),
+    ("metric_growth_tool", {"metric": "revenue_millions", "start_year": 2012, "end_year": 2024}),
+    ("sql_query_tool", {"query": "SELECT year, net_income_millions / revenue_millions AS net_margin FROM apple_financials ORDER BY year"}),
+    ("sql_query_tool", {"query": "SELECT * FROM apple_financials ORDER BY year"}),
+    ("plot_metric_over_time_tool", {"metric": "revenue_millions", "start_year": 2010}),
+    ("plot_multi_metrics_over_time_tool", {"metrics": ["revenue_millions", "net_income_millions"]}),
+    ]
+
+# The old encoding: df.to_dict("records") (plot tools: image path + all records)
+def _legacy_payload(conn, name, args, new_payload):
+    if name == "sql_query_tool":
+        return run_sql(conn, args["query"]).to_dict(orient = "records")
+    if name == "metric_change_tool":
+        return metric_change(conn, args["metric"], args["year_a"], args["year_b"]).to_dict(orient = "records")[0]
+    if name == "metric_growth_tool":
+        yoy = metric_growth(conn, args["metric"], args.get("start_year"), args.get("end_year"))
+        return {**{k: v for k, v in new_payload.items() if k != "yoy"}, "yoy": yoy.to_dict(orient = "records")}
+    metrics = args.get("metrics") or [args["metric"]]
+    df = multi_metrics_over_time(conn, metrics, args.get("start_year"), args.get("end_year"))
+    if name.startswith("plot_"):
+        return {"image_path": new_payload.get("image_path"), "data": df.to_dict(orient = "records")}
+    return df.to_dict(orient = "records")
+
+# Approximate tokens per tool result: legacy records vs compact columnar payload
+def bench_payloads():
+    from .tools import (create_metric_over_time_tool, create_multi_metrics_over_time_tool, create_metric_change_tool,
+                        create_metric_growth_tool, create_sql_query_tool, create_plot_metric_over_time_tool,
+                        create_plot_multi_metrics_over_time_tool)
+    from .payloads import estimate_tokens
+    conn = duckdb_connection()
+    table_registration(conn)
+    tools = {tool.name: tool for tool in [
+        create_metric_over_time_tool(conn), create_multi_metrics_over_time_tool(conn), create_metric_change_tool(conn),
+        create_metric_growth_tool(conn), create_sql_query_tool(conn), create_plot_metric_over_time_tool(conn),
+        create_plot_multi_metrics_over_time_tool(conn),
+        ]}
+    results = {}
+    legacy_total = compact_total = 0
+    try:
+        for i, (name, args) in enumerate(payload_calls):
+            compact = tools[name].invoke(args)
+            legacy = _legacy_payload(conn, name, args, compact)
+            legacy_tokens, compact_tokens = estimate_tokens(legacy), estimate_tokens(compact)
+            legacy_total += legacy_tokens
+            compact_total += compact_tokens
+            results[f"{i}:{name}"] = f"{legacy_tokens} -> {compact_tokens}"
+    finally:
+        conn.close()
+    results["total_tokens"] = f"{legacy_total} -> {compact_total}"
+    results["reduction"] = 1 - compact_total / legacy_total
+    return results
+
+### ---Replay (end to end, offline)---
+
+# Curated question set: analysis, chart, definition, multi-metric
+replay_questions = [
+    "What was Apple's revenue from 2015 to 2024?",
+    "How did net income change between 2018 and 2022?",
+    "Plot revenue over time",
+    "Show a chart of net income from 2010 to 2024",
+    "What is EPS?",
+    "What does gross margin mean?",
+    "Compare revenue and net income trends from 2010 to 2024",
+    "Chart operating income vs net income since 2015",
+    ]
+replay_fixtures_path = data_dir/"llm_fixtures"/"replay.json"
+
+# Scripted tool calls for the fake model (used when no fixtures were recorded / for replay misses)
+replay_tool_plan = {
+    "plot_multi_metrics_over_time_tool": {"metrics": ["revenue_millions", "net_income_millions"], "start_year": 2010},
+    "metric_over_time_tool": {"metric": "revenue_millions", "start_year": 2015, "end_year": 2024},
+    "glossary_rag_tool": {"question": "What is EPS?"},
+    }
+
+# Metrics compared against the baseline: lower is better except throughput; any extra model/tool round trip counts
+def _regressions(results, baseline, threshold, min_delta_ms = 1.0):
+    regressions = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if not isinstance(current, (int, float)) or not isinstance(base, (int, float)) or base <= 0:
+            continue
+        if key.endswith("questions_per_s"):
+            if current < base / (1 + threshold):
+                regressions.append(f"{key}: {base:.2f} -> {current:.2f}")
+        elif key.endswith("_calls_per_question"):
+            if current > base + 1e-9:
+                regressions.append(f"{key}: {base:.2f} -> {current:.2f}")
+        elif key.endswith("_ms") or key.endswith("_kb"):
+            if current > base * (1 + threshold) and current - base > min_delta_ms:
+                regressions.append(f"{key}: {base:.2f} -> {current:.2f}")
+    return regressions
+
+# Replays recorded llm responses (or the fake model) through the real graph: per-node/tool time, allocations, throughput
+def bench_replay(fixtures = replay_fixtures_path, record = False, repeats = 3, concurrency = 4,
+                 baseline = None, threshold = 0.25, save_baseline = None):
+    from .agents import set_llm_factory
+    from .fake_llm import FakeChatModel, fake_llm_factory
+    from .replay import Cassette, recording_llm_factory, replay_llm_factory
+    from .runtime import init_graph, run_question, run_questions
+    from .tracing import TRACER, trace_stats
+    from .chart_fastpath import chart_fast_path_stats
+    cassette = Cassette(fixtures)
+    if record:
+        mode, factory = "record", recording_llm_factory(cassette)
+    elif cassette.entries:
+        mode, factory = "replay", replay_llm_factory(cassette, fallback = FakeChatModel(latency_s = 0.0, tool_plan = replay_tool_plan))
+    else:
+        mode, factory = "fake", fake_llm_factory(0.0, tool_plan = replay_tool_plan)
+    previous = set_llm_factory(factory)
+    results = {"mode": mode, "questions": len(replay_questions), "repeats": repeats}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph = init_graph()
+            for question in replay_questions:           # warm-up: builds lazy agents; in record mode this is the recording
+                run_question(graph, question, use_cache = False)
+            if record:
+                results.update(cassette.stats())
+                return results
+            # wall time per question, per node and per tool (from the tracer)
+            TRACER.reset()
+            SQL_RESULT_CACHE.clear()
+            timings = []
+            for _ in range(repeats):
+                for question in replay_questions:
+                    start = time.perf_counter()
+                    run_question(graph, question, use_cache = False)
+                    timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results["question_p50_ms"] = timings[len(timings) // 2]
+            results["question_p95_ms"] = timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+            stats = trace_stats()
+            for name, row in stats["spans"].items():
+                if name != "question":
+                    results[f"{name}_p50_ms"] = row["p50_ms"]
+            results["llm_calls_per_question"] = float(stats["per_question"]["llm_calls"]["mean"])
+            results["tool_calls_per_question"] = float(stats["per_question"]["tool_calls"]["mean"])
+            results["chart_fast_path_share"] = chart_fast_path_stats()["fast_path_share"]
+            # allocations: peak traced memory per question
+            tracemalloc.start()
+            peaks = []
+            for question in replay_questions:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                run_question(graph, question, use_cache = False)
+                peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+            tracemalloc.stop()
+            results["alloc_peak_avg_kb"] = sum(peaks) / len(peaks)
+            results["alloc_peak_max_kb"] = max(peaks)
+            # throughput through the concurrent entry point
+            batch = replay_questions * repeats
+            start = time.perf_counter()
+            run_questions(graph, batch, concurrency = concurrency, use_cache = False)
+            results[f"c{concurrency}_questions_per_s"] = len(batch) / (time.perf_counter() - start)
+    finally:
+        set_llm_factory(previous)
+    if mode == "replay":
+        results["replay_misses"] = cassette.stats()["misses"]
+    metrics = {k: v for k, v in results.items() if isinstance(v, float)}
+    if save_baseline:
+        with open(save_baseline, "w", encoding = "utf-8") as f:
+            json.dump({"mode": mode, **metrics}, f, indent = 1)
+    if baseline:
+        with open(baseline, "r", encoding = "utf-8") as f:
+            base = json.load(f)
+        if base.get("mode") != mode:
+            results["baseline_warning"] = f"baseline was measured in {base.get('mode')} mode"
+        results["regressions"] = _regressions(results, base, threshold) or "none"
+    return results
+
+### ---CLI---
+
+def _print_results(title, results):
+    print(f"== {title} ==")
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f"  {key:<24} {value:,.4f}")
+        else:
+            print(f"  {key:<24} {value}")
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m app.bench", description = "CFO Insights micro-benchmarks")
+    sub = parser.add_subparsers(dest = "suite", required = True)
+    ingest = sub.add_parser("ingest", help = "csv ingestion throughput (duckdb vs pandas) + equivalence check")
+    ingest.add_argument("--rows", type = int, default = 2_000_000)
+    ingest.add_argument("--skip-pandas", action = "store_true")
+    queries = sub.add_parser("queries", help = "per-call latency of metric tools: f-string SQL vs bound parameters vs PREPARE/EXECUTE")
+    queries.add_argument("--iterations", type = int, default = 2000)
+    pool = sub.add_parser("pool", help = "parallel query throughput: shared connection vs cursor pool")
+    pool.add_argument("--calls", type = int, default = 64)
+    pool.add_argument("--fanout", type = int, default = 20000)
+    startup = sub.add_parser("startup", help = "cold-start time to a ready graph + which heavy modules got loaded")
+    startup.add_argument("--runs", type = int, default = 3)
+    throughput = sub.add_parser("throughput", help = "questions/sec of run_questions vs concurrency (fake llm, no network)")
+    throughput.add_argument("--questions", type = int, default = 32)
+    throughput.add_argument("--latency", type = float, default = 0.05)
+    streaming = sub.add_parser("stream", help = "time to first token (streaming) vs full answer (blocking), fake llm")
+    streaming.add_argument("--questions", type = int, default = 4)
+    aliases = sub.add_parser("aliases", help = "metric mention resolution on a synthetic question corpus: legacy vs compiled resolver")
+    aliases.add_argument("--size", type = int, default = 20000)
+    llmcache = sub.add_parser("llmcache", help = "cold vs warm question latency with the sqlite llm response cache (fake llm)")
+    llmcache.add_argument("--questions", type = int, default = 8)
+    llmcache.add_argument("--latency", type = float, default = 0.2)
+    answercache = sub.add_parser("answercache", help = "answer cache near-miss regression check + lookup latency")
+    answercache.add_argument("--size", type = int, default = 2000)
+    timeseries = sub.add_parser("timeseries", help = "period queries over synthetic daily prices: partitioned parquet vs one flat file")
+    timeseries.add_argument("--symbols", type = int, default = 2000)
+    timeseries.add_argument("--days", type = int, default = 10000)
+    sub.add_parser("payloads", help = "approx. tokens per tool result: records vs compact columnar payloads")
+    replay = sub.add_parser("replay", help = "offline end-to-end run of the curated question set (recorded llm responses or fake)")
+    replay.add_argument("--fixtures", default = str(replay_fixtures_path))
+    replay.add_argument("--record", action = "store_true", help = "call the real model once per question and save its responses")
+    replay.add_argument("--repeats", type = int, default = 3)
+    replay.add_argument("--concurrency", type = int, default = 4)
+    replay.add_argument("--baseline", help = "json from --save-baseline; exit 1 when a metric regresses past --threshold")
+    replay.add_argument("--threshold", type = float, default = 0.25)
+    replay.add_argument("--save-baseline")
+    args = parser.parse_args(argv)
+
+    if args.suite == "ingest":
+        _print_results("ingestion", bench_ingestion(args.rows, include_pandas = not args.skip_pandas))
+    elif args.suite == "queries":
+        _print_results("metric queries", bench_metric_queries(args.iterations))
+    elif args.suite == "pool":
+        _print_results("cursor pool", bench_cursor_pool(calls = args.calls, fanout = args.fanout))
+    elif args.suite == "stream":
+        _print_results("streaming", bench_streaming(args.questions))
+    elif args.suite == "aliases":
+        _print_results("alias resolution", bench_aliases(args.size))
+    elif args.suite == "llmcache":
+        _print_results("llm cache", bench_llm_cache(args.questions, args.latency))
+    elif args.suite == "answercache":
+        _print_results("answer cache", bench_answer_cache(args.size))
+    elif args.suite == "timeseries":
+        _print_results("time series", bench_timeseries(args.symbols, args.days))
+    elif args.suite == "payloads":
+        _print_results("tool payload tokens", bench_payloads())
+    elif args.suite == "replay":
+        results = bench_replay(args.fixtures, args.record, args.repeats, args.concurrency, args.baseline, args.threshold, args.save_baseline)
+        _print_results(f"replay ({results['mode']})", results)
+        if isinstance(results.get("regressions"), list):
+            sys.exit(1)
+    elif args.suite == "startup":
+        _print_results("startup", bench_startup(args.runs))
+    elif args.suite == "throughput":
+        _print_results("throughput", bench_throughput(args.questions, latency_s = args.latency))
+
+if __name__ == "__main__":
+    main()
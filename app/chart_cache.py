@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from .config import chart_cache_max_bytes, chart_cache_max_files, chart_janitor_interval_s
+
+# Same (metrics, years, title, data version, style) -> same file name -> render once
+def chart_key(kind, metrics, start_year, end_year, title, data_version, style):
+    payload = json.dumps(
+        {
+            "kind": kind,
+            "metrics": list(metrics),
+            "start_year": start_year,
+            "end_year": end_year,
+            "title": title,
+            "data_version": data_version,
+            "style": style,
+            },
+        sort_keys = True,
+        default = str,
+        )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+class ChartCache:
+    def __init__(self, charts_dir, max_bytes = chart_cache_max_bytes, max_files = chart_cache_max_files):
+        self.charts_dir = str(charts_dir)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.charts_dir, exist_ok = True)
+
+    def path_for(self, key, prefix = "chart", ext = "png"):
+        prefix = re.sub(r"[^A-Za-z0-9_]+", "_", prefix)[:60] or "chart"
+        return os.path.join(self.charts_dir, f"{prefix}_{key}.{ext}")
+
+    # Existing file -> hit (mtime bumped so the janitor treats it as recently used)
+    def lookup(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    # Write via temp file + rename so readers never see half-written images
+    def store(self, path, write_fn):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def _chart_files(self):
+        files = []
+        with os.scandir(self.charts_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    # LRU eviction (oldest mtime first) until both byte and count budgets hold
+    def enforce_budget(self):
+        files = sorted(self._chart_files())
+        total_bytes = sum(size for _, size, _ in files)
+        removed = 0
+        while files and (total_bytes > self.max_bytes or len(files) > self.max_files):
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self):
+        files = self._chart_files()
+        with self._lock:
+            return {
+                "files": len(files),
+                "bytes": sum(size for _, size, _ in files),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                }
+
+# One cache + background janitor per charts directory
+CHART_CACHES = {}
+_janitor_lock = threading.Lock()
+
+def _janitor_loop(cache, interval_s):
+    while True:
+        try:
+            cache.enforce_budget()
+        except OSError:
+            pass
+        time.sleep(interval_s)
+
+def get_chart_cache(charts_dir, interval_s = chart_janitor_interval_s):
+    charts_dir = os.path.abspath(str(charts_dir))
+    with _janitor_lock:
+        cache = CHART_CACHES.get(charts_dir)
+        if cache is None:
+            cache = ChartCache(charts_dir)
+            CHART_CACHES[charts_dir] = cache
+            if interval_s and interval_s > 0:
+                thread = threading.Thread(target = _janitor_loop, args = (cache, interval_s), name = "chart-janitor", daemon = True)
+                thread.start()
+    return cache
+
+def chart_cache_stats():
+    return {path: cache.stats() for path, cache in CHART_CACHES.items()}
@@ -0,0 +1,171 @@
+import re
+import threading
+from collections import Counter
+import pandas as pd
+from .db import column_unit
+from .aliases import get_alias_resolver
+from .payloads import summarize
+from .config import chart_fast_path_min_confidence
+
+# Deterministic chart requests ("plot revenue and net income 2012-2020"): parse locally, render, describe from stats (no llm)
+
+# Words a plain "chart metric(s) over years" request is made of; anything else might change the meaning
+chart_vocabulary = {
+    "plot", "chart", "graph", "visualize", "visualise", "draw", "show", "display", "line", "trend", "trends",
+    "over", "time", "the", "a", "an", "of", "for", "and", "vs", "versus", "against", "compare", "comparing",
+    "comparison", "from", "to", "between", "since", "through", "until", "till", "in", "me", "please", "apple",
+    "apples", "s", "year", "years", "annual", "yearly", "fiscal", "fy", "last", "past", "with", "historical",
+    "history", "evolution", "how", "did", "has", "have", "is", "was", "what", "can", "you", "create", "make",
+    "generate", "give", "its", "across", "all", "millions", "million", "each", "data",
+    }
+# Chart types the plotting tools can't draw (they only do line charts)
+unsupported_chart_types = ("bar", "pie", "scatter", "histogram", "area", "stacked", "waterfall", "heatmap", "table")
+# Requests for derived numbers or explanations need the agent
+analytic_markers = ("growth", "yoy", "year over year", "cagr", "change", "percent", "%", "ratio of", "divided", "average",
+                    "forecast", "predict", "project", "why", "explain", "quarter", "monthly", "correlat", "versus average")
+
+_year_re = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_last_years_re = re.compile(r"\b(?:last|past)\s+(\d{1,2})\s+years?\b")
+_word_re = re.compile(r"[a-z]+")
+
+# {"metrics", "start_year", "end_year", "multi", "chart_type", "confidence", "reasons"}; confidence 1.0 = every word accounted for
+def parse_chart_request(question, available_columns, year_min = None, year_max = None):
+    text = question.lower().replace("–", "-").replace("—", "-")
+    reasons = []
+    confidence = 1.0
+
+    matches = get_alias_resolver(available_columns).matches(text)
+    metrics = []
+    for start, end, column, score in matches:
+        if score < 1.0:             # typo: trust it only as far as the similarity goes
+            confidence = min(confidence, score)
+            reasons.append(f"fuzzy match {text[start:end]!r} -> {column}")
+        if column not in metrics:
+            metrics.append(column)
+    if not metrics:
+        return {"metrics": [], "start_year": None, "end_year": None, "multi": False, "chart_type": "line", "confidence": 0.0, "reasons": ["no known metric"]}
+    if len(metrics) > 3:
+        confidence = min(confidence, 0.4)
+        reasons.append("more than 3 metrics")
+
+    years = sorted({int(year) for year in _year_re.findall(text)})
+    start_year = end_year = None
+    last_years = _last_years_re.search(text)
+    if last_years and year_max is not None and not years:
+        start_year, end_year = year_max - int(last_years.group(1)) + 1, year_max
+    elif len(years) == 1:
+        start_year = years[0]
+        if not re.search(r"\b(since|from|after)\s+" + str(years[0]), text):
+            end_year = years[0]
+            confidence = min(confidence, 0.5)
+            reasons.append("single year (point value, not a trend)")
+    elif len(years) == 2:
+        start_year, end_year = years
+    elif len(years) > 2:
+        start_year, end_year = years[0], years[-1]
+        confidence = min(confidence, 0.5)
+        reasons.append("more than two years mentioned")
+    if years and year_min is not None and year_max is not None and (years[0] > year_max or years[-1] < year_min):
+        confidence = min(confidence, 0.3)
+        reasons.append("years outside the data")
+
+    chart_type = next((kind for kind in unsupported_chart_types if re.search(rf"\b{kind}", text)), "line")
+    if chart_type != "line":
+        confidence = min(confidence, 0.3)
+        reasons.append(f"{chart_type} chart requested")
+    marker = next((marker for marker in analytic_markers if marker in text), None)
+    if marker:
+        confidence = min(confidence, 0.5)
+        reasons.append(f"derived/analytic request ({marker!r})")
+
+    # leftover words: remove matched metric phrases, years and chart vocabulary
+    remainder = text
+    for start, end, _, _ in reversed(matches):
+        remainder = remainder[:start] + " " * (end - start) + remainder[end:]
+    remainder = _year_re.sub(" ", remainder)
+    leftover = [word for word in _word_re.findall(remainder) if word not in chart_vocabulary]
+    if leftover:
+        confidence = max(0.0, min(confidence, 1.0 - 0.3 * len(leftover)))
+        reasons.append(f"unexplained words: {', '.join(leftover[:5])}")
+
+    return {
+        "metrics": metrics,
+        "start_year": start_year,
+        "end_year": end_year,
+        "multi": len(metrics) > 1,
+        "chart_type": chart_type,
+        "confidence": confidence,
+        "reasons": reasons,
+        }
+
+def is_fast_path(plan, min_confidence = chart_fast_path_min_confidence):
+    return bool(plan["metrics"]) and plan["confidence"] >= min_confidence
+
+### ---Narrative---
+
+def metric_label(column):
+    special = {"eps": "EPS", "pe_ratio": "P/E ratio", "ebitda_millions": "EBITDA"}
+    if column in special:
+        return special[column]
+    label = column.removesuffix("_millions").replace("_", " ")
+    return label[:1].upper() + label[1:]
+
+def format_value(column, value):
+    if value is None:
+        return "n/a"
+    unit = column_unit(column)
+    if unit == "USD millions":
+        return f"${value / 1000:,.1f}B" if abs(value) >= 1000 else f"${value:,.0f}M"
+    if unit == "USD per share":
+        return f"${value:,.2f}"
+    if unit.startswith("fraction"):
+        return f"{value * 100:.1f}%"
+    if unit == "count":
+        return f"{value:,.0f}"
+    return f"{value:,.2f}"
+
+# Plot payloads carry a summary (chart_only mode) or the plotted columns; either way one sentence per metric
+def chart_narrative(plan, payload):
+    summary = payload.get("summary")
+    if summary is None and isinstance(payload.get("data"), dict):
+        summary = summarize(pd.DataFrame(payload["data"]))
+    lines = []
+    for column in plan["metrics"]:
+        stats = (summary or {}).get(column)
+        if not stats:
+            continue
+        label = metric_label(column)
+        first, last = stats["first"], stats["last"]
+        years = stats.get("years") or [plan["start_year"], plan["end_year"]]
+        direction = "rose" if last > first else "fell" if last < first else "was flat"
+        sentence = f"{label} {direction} from {format_value(column, first)} in {years[0]} to {format_value(column, last)} in {years[1]}"
+        if column_unit(column).startswith("fraction"):
+            sentence += f" ({(last - first) * 100:+.1f} pts)"
+        elif first:
+            cagr = f", CAGR {stats['cagr']:.1%}" if stats.get("cagr") is not None else ""
+            sentence += f" ({(last - first) / abs(first):+.1%}{cagr})"
+        sentence += f"; range {format_value(column, stats['min'])} to {format_value(column, stats['max'])}."
+        lines.append(sentence)
+    if not lines:
+        return "Chart generated."
+    return "\n".join(f"- {line}" for line in lines)
+
+### ---Stats---
+
+# How chart questions were answered: fast_path (no llm), agent (low confidence), render_failed (parsed but no image)
+CHART_PATHS = Counter()
+_chart_paths_lock = threading.Lock()
+
+def record_chart_path(kind):
+    with _chart_paths_lock:
+        CHART_PATHS[kind] += 1
+
+def chart_fast_path_stats():
+    with _chart_paths_lock:
+        total = sum(CHART_PATHS.values())
+        return {
+            "chart_questions": total,
+            "fast_path": CHART_PATHS["fast_path"],
+            "fast_path_share": (CHART_PATHS["fast_path"] / total) if total else 0.0,
+            "by_path": dict(CHART_PATHS),
+            }
@@ -1,7 +1,59 @@
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
+import io
+from .lazy import timed_import
 from .metrics import metric_over_time, multi_metrics_over_time
 
+# Bump when the look of the charts changes (part of the chart cache key)
+chart_style_version = 2
+
+# Object-oriented Agg figures (no pyplot global state -> safe to render from worker threads)
+# matplotlib is only imported on the first render, not when the app starts
+def _new_axes():
+    fig = timed_import("matplotlib.figure").Figure(figsize=(10, 6))
+    timed_import("matplotlib.backends.backend_agg").FigureCanvasAgg(fig)
+    ax = fig.add_subplot(1, 1, 1)
+    return fig, ax
+
+# Plain-data chart spec (picklable, so it can be rendered in a thread or process pool)
+def chart_spec(df, metrics, title=None, kind=None):
+    metrics = list(metrics)
+    kind = kind or ("single" if len(metrics) == 1 else "multi")
+    return {
+        "kind": kind,
+        "years": [int(year) for year in df["year"].tolist()],
+        "series": {metric: [None if value != value else float(value) for value in df[metric].tolist()] for metric in metrics},
+        "title": title,
+    }
+
+def draw_chart(spec):
+    fig, ax = _new_axes()
+    years = spec["years"]
+    if spec["kind"] == "single":
+        metric, values = next(iter(spec["series"].items()))
+        ax.plot(years, values, marker="o", linestyle="-", linewidth=2, color="#007AFF")
+        ax.set_xlabel("Year", fontsize=12)
+        title = spec.get("title") or f"{metric.replace('_', ' ').title()} Over Time"
+        ax.set_title(title, fontsize=14, fontweight='bold')
+        ax.grid(True, linestyle="--", alpha=0.7)
+    else:
+        for metric, values in spec["series"].items():
+            ax.plot(years, values, marker="o", label=metric.replace("_", " ").title())
+        ax.set_xlabel("Year")
+        ax.set_title(spec.get("title") or "Financial Comparison", fontsize=14, fontweight='bold')
+        ax.legend()
+        ax.grid(True, linestyle="--", alpha=0.6)
+    ax.yaxis.set_major_formatter(timed_import("matplotlib.ticker").StrMethodFormatter('{x:,.0f}'))
+    fig.tight_layout()
+    return fig
+
+def figure_bytes(fig, fmt="png"):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, bbox_inches="tight")
+    return buffer.getvalue()
+
+# Spec -> encoded image bytes (module-level so process pools can pickle it)
+def render_chart_bytes(spec, fmt="png"):
+    return figure_bytes(draw_chart(spec), fmt)
+
 # Single metric plot
 def plot_metric_over_time(conn, metric, start_year=None, end_year=None, title=None):
     df = metric_over_time(conn, metric, start_year, end_year)
@@ -9,34 +61,14 @@ def plot_metric_over_time(conn, metric, start_year=None, end_year=None, title=No
     # error check -
     if "error" in df.columns or df.empty:
         return None, df
-
-    # matplotlib plot -
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(df["year"], df[metric], marker="o", linestyle="-", linewidth=2, color="#007AFF")
-    ax.set_xlabel("Year", fontsize=12)
-    if title is None:
-        title = f"{metric.replace('_', ' ').title()} Over Time"
-    ax.set_title(title, fontsize=14, fontweight='bold')
-    ax.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.0f}'))
-    ax.grid(True, linestyle="--", alpha=0.7)
-    plt.tight_layout()
+    fig = draw_chart(chart_spec(df, [metric], title, kind="single"))
     return fig, df
 
 # Multiple metrics plot
 def plot_multi_metrics(conn, metrics, start_year=None, end_year=None, title="Financial Comparison"):
     df = multi_metrics_over_time(conn, metrics, start_year, end_year)
-    
+
     if "error" in df.columns or df.empty:
         return None, df
-    
-    # plot -    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    for metric in metrics:
-        ax.plot(df["year"], df[metric], marker="o", label=metric.replace("_", " ").title())
-    ax.set_xlabel("Year")
-    ax.set_title(title, fontsize=14, fontweight='bold')
-    ax.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.0f}'))
-    ax.legend()
-    ax.grid(True, linestyle="--", alpha=0.6)
-    plt.tight_layout()
-    return fig, df
\ No newline at end of file
+    fig = draw_chart(chart_spec(df, metrics, title, kind="multi"))
+    return fig, df
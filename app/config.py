@@ -7,9 +7,91 @@ base_dir = Path(__file__).resolve().parent.parent
 data_dir = base_dir/"data"
 apple_csv_path = data_dir/"apple_2009-2024.csv"
 rag_glossary_path = data_dir/"glossary_apple_finance.md"
+glossary_persist_dir = data_dir/"chroma_glossary"          # persisted glossary embeddings (only new/changed chunks get embedded)
+store_path = data_dir/"apple_financials.duckdb"      # persisted cleaned tables, rebuilt only when the source changes
 
 # Claude API load 
 load_dotenv(dotenv_path=base_dir / ".env")
 anthropic_key = os.getenv("ANTHROPIC_API_KEY")
 if not anthropic_key:
-    raise RuntimeError("ANTHROPIC_API_KEY not found. Put it in project_root/.env")
\ No newline at end of file
+    raise RuntimeError("ANTHROPIC_API_KEY not found. Put it in project_root/.env")
+
+# run_sql result cache (LRU + TTL, bounded by entries and bytes)
+sql_cache_max_entries = int(os.getenv("CFO_SQL_CACHE_ENTRIES", "256"))
+sql_cache_max_bytes = int(os.getenv("CFO_SQL_CACHE_BYTES", str(64 * 1024 * 1024)))
+sql_cache_ttl_s = float(os.getenv("CFO_SQL_CACHE_TTL_S", "3600"))
+
+# Local router: below this confidence the LLM router is consulted
+router_confidence_threshold = float(os.getenv("CFO_ROUTER_CONFIDENCE", "0.7"))
+
+# Semantic answer cache in front of run_question
+answer_cache_path = str(data_dir/"answer_cache.sqlite")
+answer_cache_max_entries = int(os.getenv("CFO_ANSWER_CACHE_ENTRIES", "500"))
+answer_cache_similarity = float(os.getenv("CFO_ANSWER_CACHE_SIMILARITY", "0.8"))     # paraphrases in bench answercache score 1.0, same-signature misses <= 0.73
+answer_cache_enabled = os.getenv("CFO_ANSWER_CACHE", "1") not in ("0", "false", "False")
+
+# Content-addressed chart cache (charts dir kept under these budgets by a background janitor)
+chart_cache_max_bytes = int(os.getenv("CFO_CHART_CACHE_BYTES", str(200 * 1024 * 1024)))
+chart_cache_max_files = int(os.getenv("CFO_CHART_CACHE_FILES", "500"))
+chart_janitor_interval_s = float(os.getenv("CFO_CHART_JANITOR_INTERVAL_S", "60"))
+
+# Chart rendering pool ("thread" or "process")
+chart_render_workers = int(os.getenv("CFO_CHART_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+chart_render_mode = os.getenv("CFO_CHART_RENDER_MODE", "thread")
+
+# Lexical glossary index: below min score / margin (top vs runner-up) the embedding retriever is used
+glossary_bm25_min_score = float(os.getenv("CFO_GLOSSARY_BM25_MIN_SCORE", "2.0"))
+glossary_bm25_margin = float(os.getenv("CFO_GLOSSARY_BM25_MARGIN", "1.25"))
+
+# Concurrent question entry point (run_questions): in-flight questions and per-question deadline
+question_concurrency = int(os.getenv("CFO_QUESTION_CONCURRENCY", "4"))
+question_deadline_s = float(os.getenv("CFO_QUESTION_DEADLINE_S", "120"))
+
+# Database-wide DuckDB limits, set once when a connection is opened: every query in the process (tools, guarded model SQL)
+# shares them, so a runaway query fails with an out-of-memory error instead of taking the process down
+duckdb_memory_limit = os.getenv("CFO_DUCKDB_MEMORY_LIMIT", "1GB")
+duckdb_max_temp_directory_size = os.getenv("CFO_DUCKDB_MAX_TEMP_SIZE", "2GB")      # spill-to-disk cap once memory_limit is reached
+
+# DuckDB cursor pool shared by all sessions (one cursor per tool call, reads only unless disabled)
+cursor_pool_size = int(os.getenv("CFO_CURSOR_POOL_SIZE", str(min(8, os.cpu_count() or 1))))
+cursor_pool_timeout_s = float(os.getenv("CFO_CURSOR_POOL_TIMEOUT_S", "30"))
+cursor_pool_read_only = os.getenv("CFO_CURSOR_POOL_READ_ONLY", "1") not in ("0", "false", "False")
+
+# Tool payloads sent back to the llm: row cap, float rounding, plot tools return "chart_only" (path + summary) or "data"
+payload_max_rows = int(os.getenv("CFO_PAYLOAD_MAX_ROWS", "40"))
+payload_decimals = int(os.getenv("CFO_PAYLOAD_DECIMALS", "4"))
+plot_payload_mode = os.getenv("CFO_PLOT_PAYLOAD", "chart_only")
+
+# Tracing: spans written as JSONL (rotated to .1 past max bytes) + in-memory p50/p95 and token histograms
+tracing_enabled = os.getenv("CFO_TRACING", "1") not in ("0", "false", "False")
+trace_path = os.getenv("CFO_TRACE_PATH", str(data_dir/"traces.jsonl"))
+trace_max_bytes = int(os.getenv("CFO_TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Opt-in persistent llm response cache (sqlite); calls above the max temperature always bypass it
+llm_cache_enabled = os.getenv("CFO_LLM_CACHE", "0") in ("1", "true", "True")
+llm_cache_path = os.getenv("CFO_LLM_CACHE_PATH", str(data_dir/"llm_cache.sqlite"))
+llm_cache_max_temperature = float(os.getenv("CFO_LLM_CACHE_MAX_TEMPERATURE", "0.2"))
+llm_cache_ttl_s = float(os.getenv("CFO_LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+llm_cache_max_entries = int(os.getenv("CFO_LLM_CACHE_ENTRIES", "5000"))
+llm_cache_max_bytes = int(os.getenv("CFO_LLM_CACHE_BYTES", str(100 * 1024 * 1024)))
+
+# Chart questions parsed locally with at least this confidence are rendered without the chart agent
+chart_fast_path_enabled = os.getenv("CFO_CHART_FAST_PATH", "1") in ("1", "true", "True")
+chart_fast_path_min_confidence = float(os.getenv("CFO_CHART_FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+# Metric mentions within this similarity of a known alias count as typos of it (1.0 = exact matches only)
+alias_fuzzy_cutoff = float(os.getenv("CFO_ALIAS_FUZZY_CUTOFF", "0.85"))
+
+# Guard for model-written SQL: single SELECT over allowed tables, EXPLAIN cost cap, timeout, result caps, query budgets
+sql_guard_enabled = os.getenv("CFO_SQL_GUARD", "1") not in ("0", "false", "False")
+sql_allowed_tables = [t.strip() for t in os.getenv("CFO_SQL_ALLOWED_TABLES", "apple_financials,apple_financials_derived").split(",") if t.strip()]
+sql_timeout_s = float(os.getenv("CFO_SQL_TIMEOUT_S", "5"))
+sql_max_cost_rows = float(os.getenv("CFO_SQL_MAX_COST_ROWS", "50000000"))
+sql_max_rows = int(os.getenv("CFO_SQL_MAX_ROWS", "10000"))
+sql_max_bytes = int(os.getenv("CFO_SQL_MAX_BYTES", str(8 * 1024 * 1024)))
+sql_question_max_queries = int(os.getenv("CFO_SQL_QUESTION_MAX_QUERIES", "20"))
+sql_session_max_queries = int(os.getenv("CFO_SQL_SESSION_MAX_QUERIES", "200"))
+sql_session_max_seconds = float(os.getenv("CFO_SQL_SESSION_MAX_SECONDS", "120"))
+
+# Partitioned parquet time series (quarterly fundamentals, daily prices): <dir>/<dataset>/granularity=<g>/year=<yyyy>/*.parquet
+timeseries_dir = Path(os.getenv("CFO_TIMESERIES_DIR", str(data_dir/"timeseries")))
@@ -1,32 +1,55 @@
+import hashlib
 import pandas as pd
 from .config import apple_csv_path
 
-def load_data():
-    if not apple_csv_path.exists():
-        raise FileNotFoundError(f"File not found at {apple_csv_path}") 
-    df = pd.read_csv(apple_csv_path)
+# Bump whenever the cleaning (or derived-table) logic changes so persisted stores get rebuilt
+cleaning_version = 3
+
+# Column groups shared by the pandas (reference) and duckdb (ingestion) cleaners
+monetary_cols = [
+    'ebitda_millions', 'revenue_millions', 'gross_profit_millions',
+    'op_income_millions', 'net_income_millions', 'total_assets_millions',
+    'cash_on_hand_millions', 'long_term_debt_millions',
+    'total_liabilities_millions', 'shares_outstanding', 'employees'
+    ]
+currency_float_cols = ['eps']
+percent_cols = ['gross_margin']
+float_cols = ['pe_ratio']
+
+def load_data(csv_path = apple_csv_path):
+    if not csv_path.exists():
+        raise FileNotFoundError(f"File not found at {csv_path}")
+    df = pd.read_csv(csv_path)
     return df
 
-def cleaned_data():
-    df_cleaned = load_data().copy()
-    
+# Cheap stat signature of the source (lets a warm start skip hashing the file)
+def source_stat(csv_path = apple_csv_path):
+    stat = csv_path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+# Content hash of the source csv + cleaning logic version
+def source_fingerprint(csv_path = apple_csv_path):
+    if not csv_path.exists():
+        raise FileNotFoundError(f"File not found at {csv_path}")
+    digest = hashlib.sha256(f"cleaning_v{cleaning_version}\n".encode("utf-8"))
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Pandas reference cleaner (kept for equivalence checks against the duckdb ingestion path)
+def cleaned_data(csv_path = apple_csv_path):
+    df_cleaned = load_data(csv_path).copy()
+
     if "year" not in df_cleaned.columns:
         raise ValueError("Expected timeframe not found in data.")
     df_cleaned["year"] = pd.to_numeric(df_cleaned["year"], errors = "coerce").astype("Int64")
-    
-    # column clean up -
-    monetary_cols = [
-        'ebitda_millions', 'revenue_millions', 'gross_profit_millions',
-        'op_income_millions', 'net_income_millions', 'total_assets_millions',
-        'cash_on_hand_millions', 'long_term_debt_millions',
-        'total_liabilities_millions', 'shares_outstanding', 'employees'
-        ]
-    
+
     # int64 -
     for col in monetary_cols:
         if col in df_cleaned.columns:
             df_cleaned[col] = df_cleaned[col].astype(str).str.replace(r'[$,\s]', '', regex=True).astype('int64')
-    
+
     # float64 -
     if "eps" in df_cleaned.columns:
         df_cleaned['eps'] = df_cleaned['eps'].astype(str).str.replace(r'[$,\s]', '', regex=True).astype('float64')
@@ -34,7 +57,7 @@ def cleaned_data():
         df_cleaned['gross_margin'] = (df_cleaned['gross_margin'].astype(str).str.replace(r'[%\s]', '', regex=True).astype('float64')/100)
     if "pe_ratio" in df_cleaned.columns:
         df_cleaned["pe_ratio"] = df_cleaned["pe_ratio"].astype("float64")
-    
+
     # feature engineering for financial literacy -
     if {"net_income_millions", "revenue_millions"}.issubset(df_cleaned.columns):
         df_cleaned['net_profit_margin'] = df_cleaned['net_income_millions'] / df_cleaned['revenue_millions']
@@ -47,8 +70,86 @@ def cleaned_data():
     if {"operating_income_millions", "revenue_millions"}.issubset(df_cleaned.columns):
         df_cleaned["operating_margin"] = df_cleaned["operating_income_millions"] / df_cleaned["revenue_millions"]
     if {"gross_profit_millions", "revenue_millions"}.issubset(df_cleaned.columns):
-        df_cleaned["gross_profit_margin"] = df_cleaned["gross_profit_millions"] / df_cleaned["revenue_millions"]        
+        df_cleaned["gross_profit_margin"] = df_cleaned["gross_profit_millions"] / df_cleaned["revenue_millions"]
 
     # sort by year -
     df_cleaned = df_cleaned.sort_values("year").reset_index(drop = True)
-    return df_cleaned
\ No newline at end of file
+    return df_cleaned
+
+# Derived ratio columns (name, numerator, denominator) in the same order as cleaned_data()
+derived_ratios = [
+    ("net_profit_margin", "net_income_millions", "revenue_millions"),
+    ("current_ratio", "total_assets_millions", "total_liabilities_millions"),
+    ("debt_to_assets_ratio", "long_term_debt_millions", "total_assets_millions"),
+    ("operating_margin", "operating_income_millions", "revenue_millions"),
+    ("gross_profit_margin", "gross_profit_millions", "revenue_millions"),
+    ]
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+# translate() drops the characters in one vectorized pass (much cheaper than regexp_replace)
+_whitespace_sql = "chr(32) || chr(9) || chr(10) || chr(13)"
+def _strip_chars(expr, chars):
+    return f"translate({expr}, {_sql_literal(chars)} || {_whitespace_sql}, '')"
+
+# Vectorized duckdb SELECT producing the same schema as cleaned_data() in one pass over the csv
+def cleaned_data_sql(conn, csv_path = apple_csv_path):
+    if not csv_path.exists():
+        raise FileNotFoundError(f"File not found at {csv_path}")
+    source = f"read_csv({_sql_literal(csv_path)}, header = true)"
+    columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+    if "year" not in columns:
+        raise ValueError("Expected timeframe not found in data.")
+
+    # typed transforms -
+    select_exprs = []
+    for col in columns:
+        as_text = f"CAST({_quote(col)} AS VARCHAR)"
+        if col == "year":
+            expr = f"TRY_CAST({_quote(col)} AS BIGINT)"
+        elif col in monetary_cols:
+            expr = f"CAST({_strip_chars(as_text, '$,')} AS BIGINT)"
+        elif col in currency_float_cols:
+            expr = f"CAST({_strip_chars(as_text, '$,')} AS DOUBLE)"
+        elif col in percent_cols:
+            expr = f"CAST({_strip_chars(as_text, '%')} AS DOUBLE) / 100"
+        elif col in float_cols:
+            expr = f"CAST({_quote(col)} AS DOUBLE)"
+        else:
+            expr = _quote(col)
+        select_exprs.append(f"{expr} AS {_quote(col)}")
+
+    # derived columns computed over the typed projection -
+    available = set(columns)
+    derived_exprs = []
+    if "op_income_millions" in available and "operating_income_millions" not in available:
+        derived_exprs.append('"op_income_millions" AS "operating_income_millions"')
+        available.add("operating_income_millions")
+    ratio_exprs = []
+    for name, numerator, denominator in derived_ratios:
+        if {numerator, denominator}.issubset(available) and name not in available:
+            ratio_exprs.append((name, f"{_quote(numerator)} / {_quote(denominator)} AS {_quote(name)}"))
+
+    # keep cleaned_data() column order: ratios, op income alias, then the margins based on it
+    ordered = [expr for name, expr in ratio_exprs if name in ("net_profit_margin", "current_ratio", "debt_to_assets_ratio")]
+    ordered += derived_exprs
+    ordered += [expr for name, expr in ratio_exprs if name not in ("net_profit_margin", "current_ratio", "debt_to_assets_ratio")]
+    extra_sql = "".join(f", {expr}" for expr in ordered)
+    return f"""
+        WITH typed AS (
+            SELECT {', '.join(select_exprs)}
+            FROM {source}
+        )
+        SELECT *{extra_sql}
+        FROM typed
+        ORDER BY year
+        """
+
+# Ingest csv straight into a duckdb table (no pandas copies)
+def ingest_csv(conn, table_name: str = "apple_financials", csv_path = apple_csv_path):
+    query = cleaned_data_sql(conn, csv_path)
+    conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS {query}")
@@ -1,30 +1,680 @@
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from decimal import Decimal
 import duckdb
 import pandas as pd
-from .data_loader import cleaned_data
+from .tracing import span, annotate
+from .data_loader import ingest_csv, cleaning_version, source_fingerprint, source_stat, percent_cols
+from .config import store_path, duckdb_memory_limit, duckdb_max_temp_directory_size, sql_cache_max_entries, sql_cache_max_bytes, sql_cache_ttl_s, cursor_pool_size, cursor_pool_timeout_s, cursor_pool_read_only
 
-# Duckdb to db connection
+# Bookkeeping table for the persisted store (one row per cleaned table)
+store_meta_table = "_store_meta"
+
+# In-process schema catalog, invalidated by a per-table version counter
+TABLE_VERSIONS = {}
+SCHEMA_CATALOG = {}
+SCHEMA_PROMPTS = {}
+_catalog_lock = threading.Lock()
+
+# A duckdb connection must not run statements from two threads at once (async tools run in worker threads)
+_CONNECTION_LOCKS = weakref.WeakKeyDictionary()
+_connection_locks_lock = threading.Lock()
+
+def connection_lock(conn):
+    with _connection_locks_lock:
+        lock = _CONNECTION_LOCKS.get(conn)
+        if lock is None:
+            lock = _CONNECTION_LOCKS[conn] = threading.RLock()
+    return lock
+
+# Which database a connection/cursor talks to (result cache keys): the file for on-disk stores, a fresh id per in-memory db
+_DATABASE_IDS = weakref.WeakKeyDictionary()
+_database_counter = itertools.count(1)
+
+def database_id(conn):
+    if isinstance(conn, CursorPool):
+        conn = conn.conn
+    with _connection_locks_lock:
+        db_id = _DATABASE_IDS.get(conn)
+        if db_id is None:             # connection/cursor we didn't open: never shares cached results with another one
+            db_id = _DATABASE_IDS[conn] = ("connection", next(_database_counter))
+    return db_id
+
+def _register_database(conn, db_id):
+    with _connection_locks_lock:
+        _DATABASE_IDS[conn] = db_id
+
+# Duckdb to db connection (":memory:" or a file path for the persisted store)
 def duckdb_connection(db_path = ":memory:"):
-    conn = duckdb.connect(database = db_path, read_only = False)
+    conn = duckdb.connect(database = str(db_path), read_only = False)
+    if duckdb_memory_limit:
+        conn.execute(f"SET memory_limit = '{duckdb_memory_limit}'")
+    if duckdb_max_temp_directory_size:
+        conn.execute(f"SET max_temp_directory_size = '{duckdb_max_temp_directory_size}'")
+    if str(db_path) == ":memory:":
+        _register_database(conn, ("memory", next(_database_counter)))
+    else:
+        _register_database(conn, ("file", os.path.abspath(str(db_path))))
     return conn
 
-# Data2table
-def table_registration(conn):
-    df = cleaned_data()
-    conn.register("apple_financials", df)
+### ---Cursor pool---
 
-def get_table_columns(conn, table_name: str = "apple_financials"):
-    info = conn.execute(f"PRAGMA table_info('{table_name}')").df()
-    if "name" not in info.columns:
-        return []
-    return info["name"].tolist()
-        
-def run_sql(conn, query):
+# Cursors handed out by a read-only pool (run_sql refuses anything but plain SELECTs over the database on them)
+_READ_ONLY_CURSORS = weakref.WeakSet()
+_read_only_statements = {duckdb.StatementType.SELECT}
+# Functions that reach the file system or the environment from inside a SELECT
+file_access_functions = {
+    "read_text", "read_blob", "read_csv", "read_csv_auto", "read_parquet", "parquet_scan", "read_json", "read_json_auto",
+    "read_ndjson", "read_ndjson_auto", "read_xlsx", "glob", "getenv", "sniff_csv", "parquet_metadata", "parquet_schema",
+    "parquet_file_metadata", "parquet_kv_metadata",
+    }
+
+# Bounded set of duckdb cursors over one database: each caller gets its own cursor, so queries run in parallel
+class CursorPool:
+    def __init__(self, conn, size = cursor_pool_size, read_only = cursor_pool_read_only, timeout_s = cursor_pool_timeout_s):
+        self.conn = conn
+        self.size = max(1, int(size))
+        self.read_only = read_only
+        self.timeout_s = timeout_s
+        self._idle = []
+        self._cursors = []
+        self._cond = threading.Condition()
+        self.in_use = 0
+        self.acquisitions = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms = deque(maxlen = 2000)
+
+    def _checkout(self, timeout):
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            while not self._idle and len(self._cursors) >= self.size:
+                waited = True
+                remaining = None if timeout is None else timeout - (time.perf_counter() - start)
+                if remaining is not None and remaining <= 0:
+                    self.timeouts += 1
+                    raise TimeoutError(f"No free duckdb cursor within {timeout:g}s (pool size {self.size}).")
+                self._cond.wait(remaining)
+            if self._idle:
+                cursor = self._idle.pop()
+            else:
+                with connection_lock(self.conn):
+                    cursor = self.conn.cursor()
+                _register_database(cursor, database_id(self.conn))
+                if self.read_only:
+                    _READ_ONLY_CURSORS.add(cursor)
+                self._cursors.append(cursor)
+            self.in_use += 1
+            waited_ms = (time.perf_counter() - start) * 1000
+            self.acquisitions += 1
+            self.waits += int(waited)
+            self.wait_ms_total += waited_ms
+            self.wait_ms.append(waited_ms)
+        return cursor
+
+    def _release(self, cursor):
+        with self._cond:
+            self.in_use -= 1
+            self._idle.append(cursor)
+            self._cond.notify()
+
+    @contextmanager
+    def acquire(self, timeout = None):
+        cursor = self._checkout(self.timeout_s if timeout is None else timeout)
+        try:
+            yield cursor
+        finally:
+            self._release(cursor)
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self.wait_ms)
+            return {
+                "size": self.size,
+                "read_only": self.read_only,
+                "cursors": len(self._cursors),
+                "in_use": self.in_use,
+                "acquisitions": self.acquisitions,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": (self.wait_ms_total / self.acquisitions) if self.acquisitions else 0.0,
+                "wait_ms_p95": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+                "wait_ms_max": waits[-1] if waits else 0.0,
+                }
+
+    def close(self):
+        with self._cond:
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors, self._idle = [], []
+
+# Anything that takes `conn` also accepts a pool: borrow a cursor for the block (a plain connection is used as is)
+@contextmanager
+def pooled_connection(conn):
+    if isinstance(conn, CursorPool):
+        with conn.acquire() as cursor:
+            yield cursor
+    else:
+        yield conn
+
+def _sql_nodes(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _sql_nodes(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _sql_nodes(value)
+
+# File reads hide in table functions (read_text(...)) and replacement scans (FROM '/etc/passwd' parses as a table name)
+def _external_access(conn, statement_sql):
+    with connection_lock(conn):
+        tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [statement_sql]).fetchone()[0])
+    if tree.get("error"):
+        return f"Read-only connection: query could not be checked ({tree.get('error_message')})."
+    for node in _sql_nodes(tree.get("statements", [])):
+        if node.get("class") == "FUNCTION" and str(node.get("function_name", "")).lower() in file_access_functions:
+            return f"Read-only connection: {node['function_name']}() reads outside the database."
+        if node.get("type") == "BASE_TABLE" and any(c in str(node.get("table_name", "")) for c in "/\\.:"):
+            return f"Read-only connection: {node['table_name']!r} is a file, not a table."
+    return None
+
+# The verdict depends on the SQL text only, so it is remembered per text (cache hits don't pay for the parse)
+_read_only_verdicts = OrderedDict()
+_read_only_verdicts_lock = threading.Lock()
+
+def _read_only_violation(conn, query):
+    if conn not in _READ_ONLY_CURSORS:
+        return None
+    with _read_only_verdicts_lock:
+        if query in _read_only_verdicts:
+            _read_only_verdicts.move_to_end(query)
+            return _read_only_verdicts[query]
+    violation = None
+    for statement in conn.extract_statements(query):
+        if statement.type not in _read_only_statements:
+            violation = f"Read-only connection: {statement.type.name} statements are not allowed, only SELECT queries."
+        else:
+            violation = _external_access(conn, statement.query)
+        if violation is not None:
+            break
+    with _read_only_verdicts_lock:
+        _read_only_verdicts[query] = violation
+        while len(_read_only_verdicts) > 1024:
+            _read_only_verdicts.popitem(last = False)
+    return violation
+
+def store_metadata(conn, table_name: str = "apple_financials"):
+    exists = conn.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [store_meta_table]
+        ).fetchone()[0]
+    if not exists:
+        return None
+    row = conn.execute(
+        f"SELECT fingerprint, cleaning_version, source_size, source_mtime_ns FROM {store_meta_table} WHERE table_name = ?",
+        [table_name],
+        ).fetchone()
+    if row is None:
+        return None
+    return {"fingerprint": row[0], "cleaning_version": row[1], "source_size": row[2], "source_mtime_ns": row[3]}
+
+def _store_is_fresh(conn, table_name):
+    meta = store_metadata(conn, table_name)
+    if meta is None or meta["cleaning_version"] != cleaning_version:
+        return False, None
+    # unchanged size + mtime -> trust the stored hash, skip reading the csv
+    if (meta["source_size"], meta["source_mtime_ns"]) == source_stat():
+        return True, meta["fingerprint"]
+    fingerprint = source_fingerprint()
+    return fingerprint == meta["fingerprint"], fingerprint
+
+# Data2table (rebuilds the cleaned table only when csv hash / cleaning version changed)
+def table_registration(conn, table_name: str = "apple_financials"):
+    fresh, fingerprint = _store_is_fresh(conn, table_name)
+    if fresh:
+        bump_table_version(table_name)
+        bump_table_version(derived_table_name(table_name))
+        return False
+    if fingerprint is None:
+        fingerprint = source_fingerprint()
+    size, mtime_ns = source_stat()
+    conn.execute("BEGIN TRANSACTION")
+    try:
+        ingest_csv(conn, table_name)
+        build_derived_table(conn, table_name)
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {store_meta_table} (
+                table_name VARCHAR PRIMARY KEY,
+                fingerprint VARCHAR,
+                cleaning_version INTEGER,
+                source_size BIGINT,
+                source_mtime_ns BIGINT,
+                built_at TIMESTAMP
+            )
+            """
+            )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {store_meta_table} VALUES (?, ?, ?, ?, ?, now())",
+            [table_name, fingerprint, cleaning_version, size, mtime_ns],
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        bump_table_version(table_name)
+        bump_table_version(derived_table_name(table_name))
+    return True
+
+def derived_table_name(table_name: str = "apple_financials"):
+    return f"{table_name}_derived"
+
+# Precomputed (metric, year_a < year_b) pairs: values, abs/pct delta, CAGR, YoY flag
+def build_derived_table(conn, table_name: str = "apple_financials"):
+    derived = derived_table_name(table_name)
+    metrics = [
+        row[0] for row in conn.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = ? AND column_name <> 'year'
+              AND data_type IN ('BIGINT', 'INTEGER', 'DOUBLE', 'FLOAT', 'HUGEINT', 'SMALLINT')
+            ORDER BY ordinal_position
+            """,
+            [table_name],
+            ).fetchall()
+        ]
+    select_sql = ", ".join(f'CAST("{metric}" AS DOUBLE) AS "{metric}"' for metric in metrics)
+    conn.execute(
+        f"""
+        CREATE OR REPLACE TABLE {derived} AS
+        WITH long AS (
+            UNPIVOT (SELECT year, {select_sql} FROM {table_name})
+            ON COLUMNS(* EXCLUDE (year)) INTO NAME metric VALUE value
+        )
+        SELECT
+            a.metric AS metric,
+            a.year AS year_a,
+            b.year AS year_b,
+            a.value AS value_a,
+            b.value AS value_b,
+            b.value - a.value AS delta_abs,
+            CASE WHEN a.value <> 0 THEN (b.value - a.value) / a.value END AS delta_pct,
+            CASE WHEN a.value > 0 AND b.value > 0 THEN pow(b.value / a.value, 1.0 / (b.year - a.year)) - 1 END AS cagr,
+            (b.year - a.year = 1) AS is_yoy
+        FROM long a
+        JOIN long b ON a.metric = b.metric AND a.year < b.year
+        ORDER BY 1, 2, 3
+        """
+        )
+    _index_derived_table(conn, derived)
+    return derived
+
+def _index_derived_table(conn, derived):
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {derived}_key ON {derived}(metric, year_a, year_b)")
+
+### ---Persisted store---
+
+# Serving never takes the store's write lock (any number of processes/workers): the store is ATTACHed READ_ONLY, checked
+# against the csv hash and its (small) tables copied into this process's in-memory db. A missing/stale store is rebuilt
+# into a temp file first and moved into place with os.replace, so readers never wait on the writer.
+def open_store(db_path = store_path, table_name: str = "apple_financials"):
+    conn = duckdb_connection()
+    if str(db_path) == ":memory:":
+        table_registration(conn, table_name)
+        return conn
+    db_path = os.path.abspath(str(db_path))
+    for _ in range(2):
+        if os.path.exists(db_path) and _load_store(conn, db_path, table_name):
+            return conn
+        rebuild_store(db_path, table_name)
+    raise RuntimeError(f"Store {db_path} is still stale right after a rebuild.")
+
+def _load_store(conn, db_path, table_name):
+    try:
+        conn.execute(f"ATTACH '{db_path.replace(chr(39), chr(39) * 2)}' AS store (READ_ONLY)")
+    except duckdb.Error:
+        return False                    # unreadable / older format: rebuild
+    try:
+        conn.execute("USE store")
+        fresh, _ = _store_is_fresh(conn, table_name)
+        conn.execute("USE memory")
+        if not fresh:
+            return False
+        derived = derived_table_name(table_name)
+        for name in (table_name, derived, store_meta_table):
+            conn.execute(f"CREATE OR REPLACE TABLE memory.main.{name} AS SELECT * FROM store.main.{name}")
+        _index_derived_table(conn, derived)
+    finally:
+        conn.execute("USE memory")
+        conn.execute("DETACH store")
+    bump_table_version(table_name)
+    bump_table_version(derived_table_name(table_name))
+    return True
+
+def rebuild_store(db_path = store_path, table_name: str = "apple_financials"):
+    db_path = os.path.abspath(str(db_path))
+    os.makedirs(os.path.dirname(db_path), exist_ok = True)
+    tmp_path = f"{db_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    for path in (tmp_path, f"{tmp_path}.wal"):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = duckdb.connect(tmp_path)
     try:
-        output_table = conn.execute(query).df()
-        return output_table
-    except (duckdb.Error, AttributeError) as e:
-        columns = get_table_columns(conn)
-        columns_hint = f" Available columns: {', '.join(columns)}." if columns else ""
-        error = f"SQL query failed. Error: {str(e).splitlines()[0]}.{columns_hint}"
-        print(error)
-        return pd.DataFrame({"error": [error]}) 
\ No newline at end of file
+        table_registration(conn, table_name)
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+    if os.path.exists(f"{db_path}.wal"):             # a wal left by an old read-write open belongs to the old file
+        os.remove(f"{db_path}.wal")
+    os.replace(tmp_path, db_path)
+
+# Persistent identity of the loaded data (csv hash + cleaning version), stable across restarts
+DATASET_VERSIONS = {}
+
+def dataset_version(conn, table_name: str = "apple_financials"):
+    version = table_version(table_name)
+    cached = DATASET_VERSIONS.get(table_name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with pooled_connection(conn) as cursor:
+        meta = store_metadata(cursor, table_name)
+    if meta is None:
+        value = f"session-{version}"
+    else:
+        value = f"{meta['fingerprint']}:{meta['cleaning_version']}"
+    DATASET_VERSIONS[table_name] = (version, value)
+    return value
+
+def table_version(table_name: str = "apple_financials"):
+    return TABLE_VERSIONS.get(table_name, 0)
+
+# Call after any (re)load of a table so cached schema/results are dropped
+def bump_table_version(table_name: str = "apple_financials"):
+    with _catalog_lock:
+        TABLE_VERSIONS[table_name] = TABLE_VERSIONS.get(table_name, 0) + 1
+        SCHEMA_CATALOG.pop(table_name, None)
+        SCHEMA_PROMPTS.pop(table_name, None)
+        return TABLE_VERSIONS[table_name]
+
+def _describe_table(conn, table_name, version):
+    with pooled_connection(conn) as cursor, connection_lock(cursor):
+        return _describe_table_locked(cursor, table_name, version)
+
+def _describe_table_locked(conn, table_name, version):
+    try:
+        info = conn.execute(f"PRAGMA table_info('{table_name}')").fetchall()
+    except duckdb.Error:
+        info = []
+    columns = [row[1] for row in info]
+    entry = {
+        "table_name": table_name,
+        "version": version,
+        "columns": columns,
+        "column_set": frozenset(columns),
+        "dtypes": {row[1]: row[2] for row in info},
+        "year_min": None,
+        "year_max": None,
+        "year_count": 0,
+        }
+    if "year" in entry["column_set"]:
+        year_min, year_max, year_count = conn.execute(
+            f"SELECT min(year), max(year), count(DISTINCT year) FROM {table_name}"
+            ).fetchone()
+        entry.update({"year_min": year_min, "year_max": year_max, "year_count": year_count})
+    return entry
+
+# Columns, dtypes, year coverage for a table (one PRAGMA per table version)
+def get_table_schema(conn, table_name: str = "apple_financials"):
+    version = table_version(table_name)
+    entry = SCHEMA_CATALOG.get(table_name)
+    if entry is not None and entry["version"] == version:
+        return entry
+    entry = _describe_table(conn, table_name, version)
+    if entry["columns"]:
+        with _catalog_lock:
+            if table_version(table_name) == version:
+                SCHEMA_CATALOG[table_name] = entry
+    return entry
+
+def get_table_columns(conn, table_name: str = "apple_financials"):
+    return list(get_table_schema(conn, table_name)["columns"])
+
+# Units as stored after cleaning (percent columns and margins are fractions)
+def column_unit(column):
+    if column == "year":
+        return "fiscal year"
+    if column.endswith("_millions"):
+        return "USD millions"
+    if column in ("eps", "year_close_price"):
+        return "USD per share"
+    if column in ("shares_outstanding", "employees"):
+        return "count"
+    if column in percent_cols or column.endswith("_margin"):
+        return "fraction, 0.25 = 25%"
+    if column.endswith("_ratio"):
+        return "ratio"
+    return "other"
+
+# One line per unit: "USD millions (BIGINT): revenue_millions, ..." keeps the prompt short
+def _schema_text(entry):
+    groups = OrderedDict()
+    for column in entry["columns"]:
+        groups.setdefault((column_unit(column), entry["dtypes"][column]), []).append(column)
+    lines = [f"Table {entry['table_name']}: one row per fiscal year, {entry['year_min']}-{entry['year_max']} ({entry['year_count']} years). Columns by unit:"]
+    for (unit, dtype), columns in groups.items():
+        lines.append(f"- {unit} ({dtype}): {', '.join(columns)}")
+    return "\n".join(lines)
+
+# Compact schema description for agent prompts, rebuilt only when the table version changes
+def schema_prompt(conn, table_name: str = "apple_financials"):
+    entry = get_table_schema(conn, table_name)
+    cached = SCHEMA_PROMPTS.get(table_name)
+    if cached is not None and cached[0] == entry["version"]:
+        return cached[1]
+    if not entry["columns"]:
+        return f"Table {table_name} is not loaded; call schema_info_tool to inspect it."
+    text = _schema_text(entry)
+    with _catalog_lock:
+        if table_version(table_name) == entry["version"]:
+            SCHEMA_PROMPTS[table_name] = (entry["version"], text)
+    return text
+
+### ---Result cache---
+
+# string literal | quoted identifier | line comment | block comment | number
+_sql_token_re = re.compile(
+    r"('(?:[^']|'')*')|(\"(?:[^\"]|\"\")*\")|(--[^\n]*)|(/\*.*?\*/)|(\b\d+(?:\.\d*)?(?:[eE][+-]?\d+)?\b)",
+    re.DOTALL,
+    )
+_cacheable_prefixes = ("select", "with", "from", "(")
+# Results that change between runs of the same SQL (random values, clock, sequences) are never cached
+_volatile_re = re.compile(
+    r"\b(?:random|now|uuid|gen_random_uuid|uuidv4|uuidv7|today|get_current_time|get_current_timestamp|transaction_timestamp|"
+    r"statement_timestamp|nextval|currval|setseed)\s*\(|"
+    r"\b(?:current_date|current_time|current_timestamp|current_localtime|current_localtimestamp|localtime|localtimestamp|"
+    r"current_query|current_transaction_id)\b"
+    )
+
+def _literal_key(number):
+    if re.fullmatch(r"\d+", number):
+        return ("int", int(number))
+    return ("num", format(Decimal(number).normalize(), "f"))
+
+# Whitespace/case-folded template with literals pulled out, so formatting variants share a key
+def normalize_sql(query: str):
+    parts = []
+    literals = []
+    pos = 0
+    for match in _sql_token_re.finditer(query):
+        parts.append(query[pos:match.start()].lower())
+        string, identifier, line_comment, block_comment, number = match.groups()
+        if string is not None:
+            literals.append(("str", string))
+            parts.append(" ? ")
+        elif identifier is not None:
+            parts.append(identifier)
+        elif number is not None:
+            literals.append(_literal_key(number))
+            parts.append(" ? ")
+        else:
+            parts.append(" ")
+        pos = match.end()
+    parts.append(query[pos:].lower())
+    template = " ".join("".join(parts).split())
+    template = re.sub(r"\s*([(),;=<>])\s*", r"\1", template).rstrip(";")
+    return template, tuple(literals)
+
+class ResultCache:
+    def __init__(self, max_entries = sql_cache_max_entries, max_bytes = sql_cache_max_bytes, ttl_s = sql_cache_ttl_s):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.enabled = max_entries > 0 and max_bytes > 0
+        self._entries = OrderedDict()          # key -> (frame, nbytes, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key(self, conn, query, params = None):
+        template, literals = normalize_sql(query)
+        if not template.startswith(_cacheable_prefixes) or _volatile_re.search(template):
+            return None
+        versions = tuple(sorted(TABLE_VERSIONS.items()))
+        return database_id(conn), template, literals, tuple(params or ()), versions
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            frame, nbytes, stored_at = entry
+            if self.ttl_s and time.monotonic() - stored_at > self.ttl_s:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # callers own what they get back: the cached frame itself is never handed out
+        return frame.copy()
+
+    def put(self, key, frame):
+        nbytes = int(frame.memory_usage(index = True, deep = True).sum())
+        if nbytes > self.max_bytes:
+            return frame
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (frame, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return frame.copy()
+
+    def _drop(self, key):
+        _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                }
+
+# Shared across sessions in this process
+SQL_RESULT_CACHE = ResultCache()
+
+def sql_cache_stats():
+    return SQL_RESULT_CACHE.stats()
+
+# params are bound by duckdb ($1/? placeholders): same SQL text -> same cache template whatever the values
+def run_sql(conn, query, params = None, use_cache: bool = True, timeout_s = None):
+    with span("sql", "sql", sql = query[:1000]):
+        return _run_sql(conn, query, params, use_cache, timeout_s)
+
+sql_timeout_error = "SQL query timed out"
+
+# Interrupts the cursor if the statement is still running after timeout_s (never after finish())
+class _Deadline:
+    def __init__(self, conn, timeout_s):
+        self._lock = threading.Lock()
+        self._done = False
+        self._timer = None
+        if timeout_s:
+            self._timer = threading.Timer(timeout_s, self._fire, args = (conn,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _fire(self, conn):
+        with self._lock:
+            if not self._done:
+                conn.interrupt()
+
+    def finish(self):
+        with self._lock:
+            self._done = True
+        if self._timer is not None:
+            self._timer.cancel()
+
+def _run_sql(conn, query, params, use_cache, timeout_s):
+    cache = SQL_RESULT_CACHE
+    with pooled_connection(conn) as cursor:
+        try:
+            # before the cache: a result filled by a writable connection must not reach a read-only one
+            violation = _read_only_violation(cursor, query)
+            if violation is not None:
+                annotate(error = violation)
+                return pd.DataFrame({"error": [violation]})
+            key = cache.key(conn, query, params) if (use_cache and cache.enabled) else None
+            if key is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    annotate(cached = True, rows = len(cached))
+                    return cached
+            with connection_lock(cursor):
+                deadline = _Deadline(cursor, timeout_s)
+                try:
+                    output_table = cursor.execute(query, params).df()
+                finally:
+                    deadline.finish()
+            annotate(cached = False, rows = len(output_table))
+            if key is not None:
+                output_table = cache.put(key, output_table)
+            return output_table
+        except (duckdb.Error, AttributeError) as e:
+            if isinstance(e, duckdb.InterruptException) and timeout_s:
+                error = f"{sql_timeout_error} after {timeout_s:g}s; narrow the query (filters, fewer joins, aggregates)."
+                annotate(error = error, timed_out = True)
+                return pd.DataFrame({"error": [error]})
+            columns = get_table_columns(cursor)
+            columns_hint = f" Available columns: {', '.join(columns)}." if columns else ""
+            error = f"SQL query failed. Error: {str(e).splitlines()[0]}.{columns_hint}"
+            annotate(error = error)
+            return pd.DataFrame({"error": [error]})
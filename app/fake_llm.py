@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+from typing import Any, Dict, List
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_call_ids = itertools.count()
+
+# Default tool calls the fake makes once per question (first one that is bound to the agent wins)
+default_tool_plan = {
+    "metric_over_time_tool": {"metric": "revenue_millions", "start_year": 2015, "end_year": 2024},
+    "glossary_rag_tool": {"question": "What is EPS?"},
+    }
+
+# Local stand-in for ChatAnthropic: fixed latency, one scripted tool call, then a canned answer (no network)
+class FakeChatModel(BaseChatModel):
+    latency_s: float = 0.05
+    token_latency_s: float = 0.0
+    answer: str = "analysis"
+    tool_plan: Dict[str, Dict[str, Any]] = default_tool_plan
+    bound_tools: List[str] = []
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(tool, "name", None) or tool.get("name") for tool in tools]
+        return self.model_copy(update = {"bound_tools": names})
+
+    # word counts stand in for token usage so traces/histograms have numbers to aggregate
+    def _usage(self, messages, output):
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        output_tokens = len(output.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _respond(self, messages):
+        self.calls += 1
+        if not any(isinstance(message, ToolMessage) for message in messages):
+            for name, args in self.tool_plan.items():
+                if name in self.bound_tools:
+                    call = {"name": name, "args": dict(args), "id": f"call_{next(_call_ids)}", "type": "tool_call"}
+                    message = AIMessage(content = "", tool_calls = [call], usage_metadata = self._usage(messages, json.dumps(args)))
+                    return ChatResult(generations = [ChatGeneration(message = message)])
+        message = AIMessage(content = self.answer, usage_metadata = self._usage(messages, self.answer))
+        return ChatResult(generations = [ChatGeneration(message = message)])
+
+    def _generate(self, messages, stop = None, run_manager = None, **kwargs):
+        time.sleep(self.latency_s)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop = None, run_manager = None, **kwargs):
+        await asyncio.sleep(self.latency_s)
+        return self._respond(messages)
+
+    # Streaming: tool calls arrive as one chunk, answers word by word (latency_s before the first chunk)
+    def _chunks(self, messages):
+        message = self._respond(messages).generations[0].message
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            tool_chunk = {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+            return [ChatGenerationChunk(message = AIMessageChunk(content = "", tool_call_chunks = [tool_chunk], usage_metadata = message.usage_metadata))]
+        words = [word for word in re.split(r"(\s+)", message.content) if word]
+        chunks = [ChatGenerationChunk(message = AIMessageChunk(content = word)) for word in words]
+        chunks[-1].message.usage_metadata = message.usage_metadata
+        return chunks
+
+    def _stream(self, messages, stop = None, run_manager = None, **kwargs):
+        time.sleep(self.latency_s)
+        for chunk in self._chunks(messages):
+            yield chunk
+            time.sleep(self.token_latency_s)
+
+    async def _astream(self, messages, stop = None, run_manager = None, **kwargs):
+        await asyncio.sleep(self.latency_s)
+        for chunk in self._chunks(messages):
+            yield chunk
+            await asyncio.sleep(self.token_latency_s)
+
+def fake_llm_factory(latency_s = 0.05, **kwargs):
+    return lambda temperature: FakeChatModel(latency_s = latency_s, **kwargs)
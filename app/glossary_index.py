@@ -0,0 +1,214 @@
+import math
+import re
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+from .config import rag_glossary_path, glossary_bm25_min_score, glossary_bm25_margin
+
+_heading_re = re.compile(r"^(#{1,2})\s+(.*?)\s*$")
+_column_re = re.compile(r"\(`([^`]+)`\)\s*$")
+_stopwords = {
+    "what", "is", "are", "the", "a", "an", "of", "does", "do", "mean", "means", "meaning", "define",
+    "definition", "explain", "tell", "me", "about", "how", "why", "it", "to", "in", "for", "and", "apple",
+    "apples", "s", "by", "meant", "please", "this", "that", "with", "on",
+    }
+
+# Question words that don't name a concept (ignored when checking that a hit covers the question)
+_generic_terms = {
+    "calculate", "calculated", "calculation", "compute", "computed", "measure", "measured", "measures", "formula",
+    "used", "use", "important", "interpret", "interpreted", "work", "works", "mean", "term", "metric", "metrics",
+    "concept", "give", "example", "simple", "words", "does", "value", "number", "figure", "difference", "between",
+    }
+
+# Short English words an auto-acronym may happen to spell (P/E Ratio -> "per"); never used as aliases
+_common_words = {
+    "per", "and", "are", "can", "for", "its", "not", "one", "our", "out", "see", "the", "use", "was", "who", "yes", "all",
+    "any", "new", "now", "top", "net", "tax", "get", "has", "had", "how", "may", "own", "set", "way", "year", "rate",
+    }
+
+def _stem(token):
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+def _tokens(text):
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _stopwords]
+
+def _normalize(text):
+    return " " + " ".join(re.findall(r"[a-z0-9]+", text.lower())) + " "
+
+# Markdown glossary -> one section per heading (title, backticked column, full text, char offset)
+def parse_sections(text):
+    sections = []
+    current = None
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        match = _heading_re.match(line.rstrip("\n"))
+        if match:
+            if current is not None:
+                sections.append(current)
+            heading = match.group(2)
+            column_match = _column_re.search(heading)
+            column = column_match.group(1) if column_match else None
+            title = _column_re.sub("", heading).strip()
+            current = {"title": title, "column": column, "level": len(match.group(1)), "start_index": offset, "lines": []}
+        if current is not None:
+            current["lines"].append(line)
+        offset += len(line)
+    if current is not None:
+        sections.append(current)
+    for section in sections:
+        section["content"] = "".join(section.pop("lines")).strip().rstrip("-").strip()
+    return sections
+
+def section_aliases(section):
+    aliases = set()
+    title = section["title"].lower()
+    aliases.add(title)
+    aliases.add(title.replace("-", " ").replace("/", ""))
+    words = re.findall(r"[a-z]+", title)
+    acronym = "".join(word[0] for word in words)                   # earnings per share -> eps
+    if len(words) > 1 and len(acronym) >= 3 and acronym not in _stopwords and acronym not in _common_words:
+        aliases.add(acronym)
+    column = section.get("column")
+    if column:
+        aliases.add(column)
+        aliases.add(column.replace("_", " "))
+        aliases.add(column.replace("_millions", "").replace("_", " "))
+    return {" ".join(re.findall(r"[a-z0-9]+", alias)) for alias in aliases if alias.strip()}
+
+# Exact heading/column match first, BM25 over whole sections second
+class GlossaryIndex:
+    def __init__(self, sections, source = "", k1 = 1.5, b = 0.75):
+        self.sections = [s for s in sections if s["level"] == 2]
+        self.source = source
+        self.k1 = k1
+        self.b = b
+        self.alias_to_section = {}
+        for i, section in enumerate(self.sections):
+            for alias in section_aliases(section):
+                self.alias_to_section.setdefault(alias, set()).add(i)
+        # longest aliases first so "net profit margin" wins over "margin"
+        self.aliases = sorted(self.alias_to_section, key=len, reverse=True)
+        # words a question may use and still be about the section: its title and alias words
+        self.title_terms = [
+            {_stem(t) for alias in section_aliases(s) | {s["title"]} for t in _tokens(alias.replace("_", " "))}
+            for s in self.sections
+            ]
+        self.doc_tokens = [Counter(_tokens(s["content"])) for s in self.sections]
+        self.doc_lengths = [sum(c.values()) for c in self.doc_tokens]
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        doc_freq = Counter()
+        for counts in self.doc_tokens:
+            doc_freq.update(counts.keys())
+        n_docs = len(self.sections)
+        self.idf = {t: math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    @classmethod
+    def from_file(cls, path = rag_glossary_path):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return cls(parse_sections(text), source=str(path))
+
+    # Question terms that name a concept (not filler, not years)
+    def distinctive_terms(self, question):
+        return {_stem(t) for t in _tokens(question) if not t.isdigit()} - _generic_terms
+
+    # Longest alias in the question, and only when the section's title covers the rest of the question too
+    # ("what does year over year mean" contains "year" but isn't about the Year section)
+    def exact_match(self, question):
+        q = _normalize(question)
+        matched = None
+        for alias in self.aliases:
+            if f" {alias} " in q:
+                sections = self.alias_to_section[alias]
+                if len(sections) != 1:
+                    return None
+                matched = next(iter(sections))
+                break
+        if matched is not None and not self.distinctive_terms(question) <= self.title_terms[matched]:
+            return None
+        return matched
+
+    def bm25(self, question):
+        query = _tokens(question)
+        scores = []
+        for i, counts in enumerate(self.doc_tokens):
+            length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / (self.avg_length or 1.0))
+            score = 0.0
+            for token in query:
+                tf = counts.get(token, 0)
+                if tf:
+                    score += self.idf[token] * tf * (self.k1 + 1) / (tf + length_norm)
+            scores.append((score, i))
+        scores.sort(reverse=True)
+        return scores
+
+    def document(self, i, match_type, score = None):
+        section = self.sections[i]
+        metadata = {
+            "source": self.source,
+            "start_index": section["start_index"],
+            "section": section["title"],
+            "column": section["column"],
+            "match": match_type,
+            }
+        if score is not None:
+            metadata["score"] = score
+        return Document(page_content=section["content"], metadata=metadata)
+
+    # -> (documents, ambiguous?)
+    def search(self, question, k = 3, min_score = glossary_bm25_min_score, margin = glossary_bm25_margin):
+        exact = self.exact_match(question)
+        if exact is not None:
+            return [self.document(exact, "exact")], False
+        ranked = [(score, i) for score, i in self.bm25(question) if score > 0]
+        if not ranked:
+            return [], True
+        top_score = ranked[0][0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        ambiguous = top_score < min_score or bool(runner_up and top_score / runner_up < margin)
+        # "free cash flow" must not confidently land on a section that only shares "cash": every distinctive term
+        # of the question has to be in the top section's title/aliases, otherwise the embedding retriever decides
+        if not self.distinctive_terms(question) <= self.title_terms[ranked[0][1]]:
+            ambiguous = True
+        return [self.document(i, "bm25", score) for score, i in ranked[:k]], ambiguous
+
+# Retriever-compatible (invoke) front: lexical index, embedding retriever only when ambiguous
+class HybridGlossaryRetriever:
+    def __init__(self, index, fallback_factory = None, k = 3):
+        self.index = index
+        self.fallback_factory = fallback_factory
+        self.k = k
+        self._fallback = None
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def _fallback_retriever(self):
+        with self._lock:
+            if self._fallback is None and self.fallback_factory is not None:
+                self._fallback = self.fallback_factory()
+        return self._fallback
+
+    def invoke(self, question):
+        docs, ambiguous = self.index.search(question, k=self.k)
+        if docs and not ambiguous:
+            self.counts[docs[0].metadata["match"]] += 1
+            return docs
+        fallback = self._fallback_retriever()
+        if fallback is None:
+            self.counts["lexical_only"] += 1
+            return docs
+        self.counts["embedding"] += 1
+        return fallback.invoke(question)
+
+    def stats(self):
+        total = sum(self.counts.values())
+        return {**dict(self.counts), "total": total}
+
+# Only build once per process run
+GLOSSARY_INDEX = None
+
+def get_glossary_index():
+    global GLOSSARY_INDEX
+    if GLOSSARY_INDEX is None:
+        GLOSSARY_INDEX = GlossaryIndex.from_file()
+    return GLOSSARY_INDEX
@@ -1,10 +1,19 @@
+import asyncio
 import re
 from typing import TypedDict, Any, List, Optional
 from langgraph.graph import StateGraph, END
-from .db import get_table_columns
-from .tools import create_glossary_rag_tool, create_metric_over_time_tool, create_multi_metrics_over_time_tool, create_sql_query_tool, create_plot_metric_over_time_tool, create_schema_info_tool, create_plot_multi_metrics_over_time_tool
+from langchain_core.runnables import RunnableLambda
+from .db import get_table_columns, get_table_schema, schema_prompt
+from .tools import create_glossary_rag_tool, create_metric_over_time_tool, create_multi_metrics_over_time_tool, create_sql_query_tool, create_plot_metric_over_time_tool, create_schema_info_tool, create_plot_multi_metrics_over_time_tool, create_metric_change_tool, create_metric_growth_tool, create_metrics_over_period_tool
 from .agents import create_glossary_agent, create_analyst_agent, create_chart_agent, create_router_chain
-from .config import data_dir
+from .config import glossary_persist_dir
+from .router import get_question_router
+from .lazy import Lazy
+from .aliases import get_alias_resolver
+from .chart_fastpath import parse_chart_request, is_fast_path, chart_narrative, record_chart_path
+from .config import chart_fast_path_enabled
+from .tracing import traced, annotate
+from .timeseries import timeseries_datasets
 
 # Graph state ( basically my state definition, memory going to be shared on the run)
 class GraphState(TypedDict, total = False):
@@ -15,6 +24,7 @@ class GraphState(TypedDict, total = False):
     chart_result: str
     chart_steps: List[Any]
     image_path: Optional[str]
+    chart_fast_path: bool
     glossary_result: str
     
 def extract_year_bounds(question: str):             # fallback 1 if chart doesnt show image
@@ -25,144 +35,155 @@ def extract_year_bounds(question: str):             # fallback 1 if chart doesnt
         return years[0], None
     return min(years), max(years)
 
-def resolve_metrics_from_question(question: str, available_columns: List[str]) -> List[str]: #fallback 1 functioon to hardcode aliases
-    q = question.lower()
-    available = set(available_columns)
-    aliases = {
-        "operating income": "operating_income_millions",
-        "op income": "operating_income_millions",
-        "net income": "net_income_millions",
-        "revenue": "revenue_millions",
-        "gross profit": "gross_profit_millions",
-        "ebitda": "ebitda_millions",
-        "gross margin": "gross_margin",
-        "net profit margin": "net_profit_margin",
-        "operating margin": "operating_margin",
-        "cash": "cash_on_hand_millions",
-        "cash on hand": "cash_on_hand_millions",
-        "long term debt": "long_term_debt_millions",
-        "total assets": "total_assets_millions",
-        "total liabilities": "total_liabilities_millions",
-        "shares outstanding": "shares_outstanding",
-        "employees": "employees",
-        "eps": "eps",
-        "pe ratio": "pe_ratio",
-    }
-    metrics = []
-    for phrase, column in aliases.items():
-        if phrase in q and column in available:
-            metrics.append(column)
-    for column in available:
-        if column in q and column not in metrics:
-            metrics.append(column)
-    return metrics
+def resolve_metrics_from_question(question: str, available_columns: List[str]) -> List[str]: #fallback 1, shared alias resolver (longest match + typos)
+    return get_alias_resolver(available_columns).metrics(question)
 
 
 # ------------- Graph factory -------------
 def create_app_graph(conn):
-    persist_dir = str((data_dir / "chroma_glossary").resolve())     # persist chroma save memory?
-    # tools -
-    glossary_tool = create_glossary_rag_tool(persist_directory=persist_dir)
+    persist_dir = str(glossary_persist_dir.resolve())     # persist chroma save memory?
+    # tools (cheap, duckdb-backed) -
     metric_tool = create_metric_over_time_tool(conn)
     multi_metric_tool = create_multi_metrics_over_time_tool(conn)
     sql_tool = create_sql_query_tool(conn)
     plot_tool = create_plot_metric_over_time_tool(conn)
     plot_multi_tool = create_plot_multi_metrics_over_time_tool(conn)
     schema_tool = create_schema_info_tool(conn)
+    change_tool = create_metric_change_tool(conn)
+    growth_tool = create_metric_growth_tool(conn)
     # tool sets per agent -
-    analyst_tools = [schema_tool, metric_tool, multi_metric_tool, sql_tool]
-    chart_tools = [schema_tool, metric_tool, multi_metric_tool, sql_tool, plot_tool, plot_multi_tool]
-    glossary_tools = [glossary_tool]
+    analyst_tools = [schema_tool, metric_tool, multi_metric_tool, change_tool, growth_tool, sql_tool]
+    chart_tools = [schema_tool, metric_tool, multi_metric_tool, change_tool, growth_tool, sql_tool, plot_tool, plot_multi_tool]
+    if timeseries_datasets():          # quarterly/daily parquet datasets registered at startup
+        period_tool = create_metrics_over_period_tool(conn)
+        analyst_tools.append(period_tool)
+        chart_tools.append(period_tool)
     
-    # router + agents -
-    router_chain = create_router_chain()
-    glossary_agent = create_glossary_agent(glossary_tools)
-    analyst_agent = create_analyst_agent(analyst_tools)
-    chart_agent = create_chart_agent(chart_tools)
+    # router + agents, each built on the first question routed to it (llm router chain only if the local router is unsure) -
+    question_router = get_question_router(llm_chain_factory = create_router_chain)
+    glossary_agent = Lazy("glossary_agent", lambda: create_glossary_agent([create_glossary_rag_tool(persist_directory=persist_dir)]))
+    schema = lambda: schema_prompt(conn)         # re-read per question, rebuilt only when the table version changes
+    analyst_agent = Lazy("analyst_agent", lambda: create_analyst_agent(analyst_tools, schema))
+    chart_agent = Lazy("chart_agent", lambda: create_chart_agent(chart_tools, schema))
     
-    # nodes - 
-    def glossary_node(state: GraphState):
-        question = state["input"]
-        result = glossary_agent.invoke({"input": question})
+    # nodes (each has a sync and an async body; graph.invoke uses the first, graph.ainvoke the second) - 
+    def agent_output(result):
         out = result.get("output")
         if isinstance(out, list):
             out = "\n".join([x.get("text","") for x in out if isinstance(x, dict)])
-        return {"glossary_result": out}
+        return out
+
+    def glossary_update(result):
+        return {"glossary_result": agent_output(result)}
+
+    def glossary_node(state: GraphState):
+        return glossary_update(glossary_agent.get().invoke({"input": state["input"]}))
+
+    async def aglossary_node(state: GraphState):
+        return glossary_update(await glossary_agent.get().ainvoke({"input": state["input"]}))
     
     def router_node(state: GraphState):
-        question = state["input"]
-        route_label = router_chain.run(input=question).strip().lower().strip("`'\" .,\n\t")
-        route_label = route_label.split()[0]
-        q = question.lower()
-        chart_triggers = ("plot", "chart", "graph", "visualize", "trend", "over time", "line chart", "bar chart", "compare", "versus", " vs ")
-        definition_triggers = ("define", "definition", "meaning of", "what is ", "what does ")
-        if any(t in q for t in definition_triggers) and "what was" not in q and not any(t in q for t in chart_triggers):
-            route_label = "definition"
-        elif any(t in q for t in chart_triggers):
-            route_label = "analysis_with_chart"
-        else:
-            route_label = "analysis"
-        allowed = {"analysis", "analysis_with_chart", "definition", "other"}
-        if route_label not in allowed:
-            route_label = "analysis"
-        return {"route": route_label}
+        decision = question_router.route(state["input"])
+        return {"route": decision["route"]}
+
+    async def arouter_node(state: GraphState):
+        decision = await question_router.aroute(state["input"])
+        return {"route": decision["route"]}
     
-    def analyst_node(state: GraphState):
-        question = state["input"]
-        result = analyst_agent.invoke({"input": question})
-        out = result.get("output")
-        if isinstance(out, list):
-            out = "\n".join([x.get("text","") for x in out if isinstance(x, dict)])
+    def analyst_update(result):
         return {
-            "analyst_result": out,
+            "analyst_result": agent_output(result),
             "analyst_steps": result.get("intermediate_steps", [])
             }
+
+    def analyst_node(state: GraphState):
+        return analyst_update(analyst_agent.get().invoke({"input": state["input"]}))
+
+    async def aanalyst_node(state: GraphState):
+        return analyst_update(await analyst_agent.get().ainvoke({"input": state["input"]}))
     
-    def chart_node(state: GraphState):
-        question = state["input"]
-        result = chart_agent.invoke({"input": question})
-        out = result.get("output")
-        if isinstance(out, list):
-            out = "\n".join([x.get("text","") for x in out if isinstance(x, dict)])
-        steps = result.get("intermediate_steps", [])
+    def chart_fallback(question):                              ###### main fallback path image failure bug?
+        available_columns = get_table_columns(conn)
+        metrics = resolve_metrics_from_question(question, available_columns)
+        start_year, end_year = extract_year_bounds(question)
+        fallback = None
+        if len(metrics) >= 2:
+            fallback = plot_multi_tool.invoke({
+                "metrics": metrics[:3],
+                "start_year": start_year,
+                "end_year": end_year,
+                "title": "Financial Comparison",
+            })
+        elif len(metrics) == 1:
+            fallback = plot_tool.invoke({
+                "metric": metrics[0],
+                "start_year": start_year,
+                "end_year": end_year,
+                "title": None,
+            })
+        if isinstance(fallback, dict):
+            return fallback.get("image_path")
+        return None
+
+    def chart_image_path(steps):
         image_path = None
         for action, obs in steps:
             if isinstance(obs, dict) and "image_path" in obs:
                 image_path = obs["image_path"]
-        if image_path is None:                                  ###### main fallback path image failure bug?
-            available_columns = get_table_columns(conn)
-            metrics = resolve_metrics_from_question(question, available_columns)
-            start_year, end_year = extract_year_bounds(question)
-            if len(metrics) >= 2:
-                fallback = plot_multi_tool.invoke({
-                    "metrics": metrics[:3],
-                    "start_year": start_year,
-                    "end_year": end_year,
-                    "title": "Financial Comparison",
-                })
-                if isinstance(fallback, dict):
-                    image_path = fallback.get("image_path")
-            elif len(metrics) == 1:
-                fallback = plot_tool.invoke({
-                    "metric": metrics[0],
-                    "start_year": start_year,
-                    "end_year": end_year,
-                    "title": None,
-                })
-                if isinstance(fallback, dict):
-                    image_path = fallback.get("image_path")
-        return {
-            "chart_result": out,
-            "chart_steps": steps,
-            "image_path": image_path,
-            }
+        return image_path
+
+    # Unambiguous requests are plotted straight from the parse and described from the plotted data's stats (no llm)
+    def chart_fast_path(question):
+        if not chart_fast_path_enabled:
+            return None
+        schema = get_table_schema(conn)
+        plan = parse_chart_request(question, schema["columns"], schema["year_min"], schema["year_max"])
+        annotate(chart_confidence = plan["confidence"])
+        if not is_fast_path(plan):
+            record_chart_path("agent")
+            return None
+        args = {"start_year": plan["start_year"], "end_year": plan["end_year"]}
+        if plan["multi"]:
+            payload = plot_multi_tool.invoke({"metrics": plan["metrics"], "title": "Financial Comparison", **args})
+        else:
+            payload = plot_tool.invoke({"metric": plan["metrics"][0], "title": None, **args})
+        if not isinstance(payload, dict) or not payload.get("image_path"):
+            record_chart_path("render_failed")
+            return None
+        record_chart_path("fast_path")
+        annotate(chart_fast_path = True)
+        return {"chart_result": chart_narrative(plan, payload), "chart_steps": [], "image_path": payload["image_path"], "chart_fast_path": True}
+
+    def chart_node(state: GraphState):
+        question = state["input"]
+        fast = chart_fast_path(question)
+        if fast is not None:
+            return fast
+        result = chart_agent.get().invoke({"input": question})
+        steps = result.get("intermediate_steps", [])
+        image_path = chart_image_path(steps)
+        if image_path is None:
+            image_path = chart_fallback(question)
+        return {"chart_result": agent_output(result), "chart_steps": steps, "image_path": image_path}
+
+    async def achart_node(state: GraphState):
+        question = state["input"]
+        fast = await asyncio.to_thread(chart_fast_path, question)
+        if fast is not None:
+            return fast
+        result = await chart_agent.get().ainvoke({"input": question})
+        steps = result.get("intermediate_steps", [])
+        image_path = chart_image_path(steps)
+        if image_path is None:
+            image_path = await asyncio.to_thread(chart_fallback, question)
+        return {"chart_result": agent_output(result), "chart_steps": steps, "image_path": image_path}
 
     # graph topology -
     workflow = StateGraph(GraphState)
-    workflow.add_node("glossary", glossary_node)
-    workflow.add_node("router", router_node)
-    workflow.add_node("analyst", analyst_node)
-    workflow.add_node("chart", chart_node)
+    workflow.add_node("glossary", RunnableLambda(traced("glossary_node", "node")(glossary_node), afunc = traced("glossary_node", "node")(aglossary_node)))
+    workflow.add_node("router", RunnableLambda(traced("router_node", "node")(router_node), afunc = traced("router_node", "node")(arouter_node)))
+    workflow.add_node("analyst", RunnableLambda(traced("analyst_node", "node")(analyst_node), afunc = traced("analyst_node", "node")(aanalyst_node)))
+    workflow.add_node("chart", RunnableLambda(traced("chart_node", "node")(chart_node), afunc = traced("chart_node", "node")(achart_node)))
     workflow.set_entry_point("router")
     
     # control flow & edge logic - 
@@ -0,0 +1,65 @@
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# name -> {"kind": "import"|"build"|"phase", "seconds": float} for startup / first-use costs
+STARTUP_PROFILE = {}
+_profile_lock = threading.Lock()
+
+def record_startup(name, seconds, kind = "phase"):
+    with _profile_lock:
+        STARTUP_PROFILE[name] = {"kind": kind, "seconds": seconds}
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_startup(name, time.perf_counter() - start, "phase")
+
+# Deferred heavy import; the first (real) import is timed into the startup profile
+def timed_import(module_name):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_startup(f"import {module_name}", time.perf_counter() - start, "import")
+    return module
+
+# Thread-safe build-on-first-use wrapper (double-checked so the hot path takes no lock)
+class Lazy:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._built
+
+    def get(self):
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                start = time.perf_counter()
+                self._value = self.factory()
+                record_startup(self.name, time.perf_counter() - start, "build")
+                self._built = True
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+            self._built = False
+
+def startup_report():
+    with _profile_lock:
+        rows = [{"name": name, **entry} for name, entry in STARTUP_PROFILE.items()]
+    return sorted(rows, key = lambda row: row["seconds"], reverse = True)
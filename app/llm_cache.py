@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.caches import BaseCache
+from langchain_core.callbacks import AsyncCallbackManager, CallbackManager
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+from langchain_core.runnables import ensure_config
+from .config import llm_cache_enabled, llm_cache_path, llm_cache_ttl_s, llm_cache_max_entries, llm_cache_max_bytes
+
+# Persistent llm response cache: key = hash(model + params incl. temperature and tool schemas, messages)
+class SQLiteLLMCache(BaseCache):
+    def __init__(self, path = llm_cache_path, ttl_s = llm_cache_ttl_s, max_entries = llm_cache_max_entries, max_bytes = llm_cache_max_bytes):
+        self.path = str(path)
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+        self._conn = sqlite3.connect(self.path, check_same_thread = False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, created REAL, last_used REAL, size INTEGER, value TEXT)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        key = self.key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT created, value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.ttl_s and now - row[0] > self.ttl_s:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return [loads(generation, allowed_objects = "core") for generation in json.loads(row[1])]
+
+    def update(self, prompt, llm_string, return_val):
+        value = json.dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, created, last_used, size, value) VALUES (?, ?, ?, ?, ?)",
+                (self.key(prompt, llm_string), now, now, len(value), value),
+                )
+            self.writes += 1
+            self._evict()
+            self._conn.commit()
+
+    # least recently used rows go first until both the entry and byte budgets hold
+    def _evict(self):
+        entries, size = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM llm_cache").fetchone()
+        while entries > self.max_entries or (size > self.max_bytes and entries > 1):
+            key, row_size = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used LIMIT 1").fetchone()
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            entries -= 1
+            size -= row_size
+            self.evictions += 1
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM llm_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                }
+
+# BaseChatModel.stream()/astream() never look at llm.cache. This mixin checks the cache before streaming (a hit is
+# replayed as one chunk, with the usual callbacks so astream_events still sees it) and stores the merged final message
+# once the stream ends, so cached agents can keep streaming tokens on misses.
+class CachedStreamingMixin:
+    def _stream_cache(self):
+        return self.cache if isinstance(self.cache, BaseCache) else None
+
+    # same prompt normalization (message ids dropped) and llm string as the invoke path's cache key
+    def _stream_cache_key(self, input, stop, kwargs):
+        messages = [
+            message.model_copy(update = {"id": None}) if getattr(message, "id", None) is not None else message
+            for message in self._convert_input(input).to_messages()
+            ]
+        return messages, dumps(messages), self._get_llm_string(stop = stop, **kwargs)
+
+    def _callback_manager(self, manager_class, config):
+        return manager_class.configure(
+            config.get("callbacks"), self.callbacks, self.verbose, config.get("tags"), self.tags,
+            config.get("metadata"), self.metadata,
+            )
+
+    def stream(self, input, config = None, *, stop = None, **kwargs):
+        cache = self._stream_cache()
+        if cache is None:
+            yield from super().stream(input, config, stop = stop, **kwargs)
+            return
+        messages, prompt, llm_string = self._stream_cache_key(input, stop, kwargs)
+        cached = cache.lookup(prompt, llm_string)
+        if cached:
+            config = ensure_config(config)
+            (run_manager,) = self._callback_manager(CallbackManager, config).on_chat_model_start(
+                self._serialized, [messages], invocation_params = self._get_invocation_params(stop = stop, **kwargs),
+                name = config.get("run_name"), run_id = config.pop("run_id", None), batch_size = 1,
+                )
+            chunk = _message_chunk(cached[0].message)
+            run_manager.on_llm_new_token(chunk.text, chunk = ChatGenerationChunk(message = chunk))
+            run_manager.on_llm_end(LLMResult(generations = [[ChatGeneration(message = cached[0].message)]]))
+            yield chunk
+            return
+        merged = None
+        for chunk in super().stream(input, config, stop = stop, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            cache.update(prompt, llm_string, [ChatGeneration(message = message_chunk_to_message(merged))])
+
+    async def astream(self, input, config = None, *, stop = None, **kwargs):
+        cache = self._stream_cache()
+        if cache is None:
+            async for chunk in super().astream(input, config, stop = stop, **kwargs):
+                yield chunk
+            return
+        messages, prompt, llm_string = self._stream_cache_key(input, stop, kwargs)
+        cached = await cache.alookup(prompt, llm_string)
+        if cached:
+            config = ensure_config(config)
+            (run_manager,) = await self._callback_manager(AsyncCallbackManager, config).on_chat_model_start(
+                self._serialized, [messages], invocation_params = self._get_invocation_params(stop = stop, **kwargs),
+                name = config.get("run_name"), run_id = config.pop("run_id", None), batch_size = 1,
+                )
+            chunk = _message_chunk(cached[0].message)
+            await run_manager.on_llm_new_token(chunk.text, chunk = ChatGenerationChunk(message = chunk))
+            await run_manager.on_llm_end(LLMResult(generations = [[ChatGeneration(message = cached[0].message)]]))
+            yield chunk
+            return
+        merged = None
+        async for chunk in super().astream(input, config, stop = stop, **kwargs):
+            merged = chunk if merged is None else merged + chunk
+            yield chunk
+        if merged is not None:
+            await cache.aupdate(prompt, llm_string, [ChatGeneration(message = message_chunk_to_message(merged))])
+
+# Cached AIMessage -> one complete chunk (tool calls as chunks, so the agent's output parser rebuilds them)
+def _message_chunk(message):
+    tool_call_chunks = [
+        tool_call_chunk(name = call["name"], args = json.dumps(call["args"]), id = call.get("id"), index = i)
+        for i, call in enumerate(getattr(message, "tool_calls", None) or [])
+        ]
+    return AIMessageChunk(
+        content = message.content, additional_kwargs = message.additional_kwargs, response_metadata = message.response_metadata,
+        usage_metadata = getattr(message, "usage_metadata", None), tool_call_chunks = tool_call_chunks, id = message.id,
+        chunk_position = "last",
+        )
+
+_streaming_classes = {}
+_streaming_classes_lock = threading.Lock()
+
+# Same model, cache-aware streaming: the subclass keeps the class name/module, so serialized llm strings (cache keys) don't change
+def with_cached_streaming(llm):
+    if isinstance(llm, CachedStreamingMixin):
+        return llm
+    cls = type(llm)
+    with _streaming_classes_lock:
+        streaming_class = _streaming_classes.get(cls)
+        if streaming_class is None:
+            streaming_class = _streaming_classes[cls] = type(cls.__name__, (CachedStreamingMixin, cls), {"__module__": cls.__module__})
+    llm.__class__ = streaming_class
+    return llm
+
+# Only build once per process run (None while the cache is switched off)
+LLM_CACHE = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    global LLM_CACHE
+    with _llm_cache_lock:
+        if LLM_CACHE is None and llm_cache_enabled:
+            LLM_CACHE = SQLiteLLMCache()
+    return LLM_CACHE
+
+# Install a specific cache (or None to switch it off) regardless of CFO_LLM_CACHE; returns the previous one
+def set_llm_cache(cache):
+    global LLM_CACHE
+    with _llm_cache_lock:
+        previous = LLM_CACHE
+        LLM_CACHE = cache
+    return previous
+
+def llm_cache_stats():
+    if LLM_CACHE is None:
+        return {}
+    return LLM_CACHE.stats()
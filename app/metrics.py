@@ -1,102 +1,140 @@
 from typing import Optional
-from .db import run_sql, get_table_columns
+from .db import get_table_schema
+from .queries import execute_range, execute_derived_pair, execute_derived_yoy
+from .timeseries import execute_period, find_dataset, timeseries_datasets, timeseries_columns
 import pandas as pd
 
-# Metric from yearA to yearB
-def metric_over_time(conn, metric, start_year: Optional[int] = None, end_year: Optional[int] = None):
-    available = set(get_table_columns(conn))
-    if metric not in available:
+def _missing_metrics_error(conn, metrics, single = False):
+    available = get_table_schema(conn)["column_set"]
+    missing = [metric for metric in metrics if metric not in available]
+    if not missing:
+        return None
+    if single:
         error = (
-            f"Metric '{metric}' not found in table. Available columns: "
+            f"Metric '{metrics[0]}' not found in table. Available columns: "
             f"{', '.join(sorted(available))}."
             )
-        return pd.DataFrame({"error": [error]})
-    where_clauses = ["1=1"]
-    if start_year is not None:
-        where_clauses.append(f"year >= {int(start_year)}")
-    if end_year is not None:
-        where_clauses.append(f"year <= {int(end_year)}")
-    where_sql = " AND ".join(where_clauses)
+    else:
+        error = (
+            "Metrics not found in table: "
+            f"{', '.join(missing)}. Available columns: {', '.join(sorted(available))}."
+            )
+    return pd.DataFrame({"error": [error]})
 
-    # query string -
-    query = f"""
-        SELECT
-            year,
-            {metric}
-        FROM apple_financials
-        WHERE {where_sql}
-        ORDER BY year
-        """
-    df = run_sql(conn, query)
+def _year_error(e):
+    return pd.DataFrame({"error": [str(e)]})
+
+# Metric from yearA to yearB
+def metric_over_time(conn, metric, start_year: Optional[int] = None, end_year: Optional[int] = None):
+    error = _missing_metrics_error(conn, [metric], single = True)
+    if error is not None:
+        return error
+    try:
+        df = execute_range(conn, [metric], start_year, end_year)
+    except ValueError as e:
+        return _year_error(e)
     return df
 
-# Metric between yearA, yearB
+# Metric between yearA, yearB (deltas come precomputed from the derived table)
 def metric_btwn_yrs(conn, metric, year_a, year_b):
-    query = f"""
-        SELECT
-            year,
-            {metric}
-        FROM apple_financials
-        WHERE year in ({year_a}, {year_b})
-        ORDER BY year
-        """
-    df = run_sql(conn, query)
+    change = metric_change(conn, metric, year_a, year_b)
     # error, logic checks -
-    if "error" in df.columns:
-        return df
-    if len(df) != 2:     #2-year delta 
-        return df
-    
-    # FE metrics -
-    value_a = df.loc[0, metric]
-    value_b = df.loc[1, metric]
-    delta_abs = value_b - value_a
-    delta_pct = (delta_abs / value_a) if value_a not in (0, None) else None
-    df["delta_abs"] = delta_abs
-    df["delta_pct"] = delta_pct
-    return df  
+    if "error" in change.columns:
+        return change
+    if len(change) != 1:     #2-year delta
+        return pd.DataFrame(columns=["year", metric])
+    row = change.iloc[0]
+    return pd.DataFrame({
+        "year": [row["year_a"], row["year_b"]],
+        metric: [row["value_a"], row["value_b"]],
+        "delta_abs": [row["delta_abs"]] * 2,
+        "delta_pct": [row["delta_pct"]] * 2,
+        })
+
+# Indexed lookup of one (metric, yearA, yearB) pair: values, abs/pct delta, CAGR
+def metric_change(conn, metric, year_a, year_b):
+    error = _missing_metrics_error(conn, [metric], single = True)
+    if error is not None:
+        return error
+    try:
+        year_a, year_b = sorted((int(year_a), int(year_b)))
+    except (TypeError, ValueError):
+        return _year_error(f"Invalid years: {year_a!r}, {year_b!r}")
+    try:
+        if year_a == year_b:
+            raise ValueError("year_a and year_b must be different years.")
+        return execute_derived_pair(conn, metric, year_a, year_b)
+    except ValueError as e:
+        return _year_error(e)
 
 # MetricA, metricB + horizon
 def multi_metrics_over_time(conn, metrics, start_year: Optional[int] = None, end_year: Optional[int] = None):
     if not metrics:
         return pd.DataFrame({"error": ["No metrics provided."]})
-    available = set(get_table_columns(conn))
-    missing = [metric for metric in metrics if metric not in available]
-    if missing:
-        return pd.DataFrame({
-            "error": [
-                "Metrics not found in table: "
-                f"{', '.join(missing)}. Available columns: {', '.join(sorted(available))}."
-            ]
-        })
-    # build SELECT list: year + each metric-
-    select_cols = ["year"] + metrics
-    select_sql = ", ".join(select_cols)
-    where_clauses = ["1=1"]
-    if start_year is not None:
-        where_clauses.append(f"year >= {int(start_year)}")
-    if end_year is not None:
-        where_clauses.append(f"year <= {int(end_year)}")
-    where_sql = " AND ".join(where_clauses)
-    
-    query = f"""
-        SELECT
-            {select_sql}
-        FROM apple_financials
-        WHERE {where_sql}
-        ORDER BY year
-    """
-    df = run_sql(conn, query)
+    error = _missing_metrics_error(conn, list(metrics))
+    if error is not None:
+        return error
+    try:
+        df = execute_range(conn, list(metrics), start_year, end_year)
+    except ValueError as e:
+        return _year_error(e)
     return df
 
-# Metric growth
+# Metric growth (YoY from the derived table)
 def metric_with_growth(conn, metric, start_year: Optional[int] = None, end_year: Optional[int] = None):
     df = metric_over_time(conn, metric, start_year, end_year)
     # error checks -
     if "error" in df.columns or df.empty:
         return df
+    yoy = metric_growth(conn, metric, start_year, end_year)
+    if "error" in yoy.columns:
+        return yoy
+    growth = dict(zip(yoy["year"], yoy["growth_pct"]))
     df = df.sort_values("year").reset_index(drop=True)
+    df["growth_pct"] = [growth.get(year) for year in df["year"]]
+    df["growth_pct"] = df["growth_pct"].astype("float64")
+    return df
 
-    # using pct_change to compute YoY growth -
-    df["growth_pct"] = df[metric].pct_change()
-    return df
\ No newline at end of file
+# YoY rows for a metric within optional bounds
+def metric_growth(conn, metric, start_year: Optional[int] = None, end_year: Optional[int] = None):
+    error = _missing_metrics_error(conn, [metric], single = True)
+    if error is not None:
+        return error
+    try:
+        return execute_derived_yoy(conn, metric, start_year, end_year)
+    except ValueError as e:
+        return _year_error(e)
+
+# Period datasets (quarterly/monthly/daily parquet): dataset given, or the first one holding every metric
+def _period_dataset(conn, metrics, dataset):
+    if dataset is None:
+        dataset = find_dataset(conn, metrics)
+        if dataset is None:
+            available = {name: timeseries_columns(conn, name) for name in timeseries_datasets()}
+            if not available:
+                return None, pd.DataFrame({"error": ["No period (quarterly/daily) datasets are loaded."]})
+            listing = "; ".join(f"{name}: {', '.join(columns)}" for name, columns in available.items())
+            return None, pd.DataFrame({"error": [f"No period dataset has all of: {', '.join(metrics)}. Available: {listing}."]})
+    elif dataset not in timeseries_datasets():
+        return None, pd.DataFrame({"error": [f"Unknown dataset '{dataset}'. Available: {', '.join(timeseries_datasets()) or 'none'}."]})
+    else:
+        available = set(timeseries_columns(conn, dataset))
+        missing = [metric for metric in metrics if metric not in available]
+        if missing:
+            return None, pd.DataFrame({"error": [f"Metrics not found in {dataset}: {', '.join(missing)}. Available columns: {', '.join(sorted(available))}."]})
+    return dataset, None
+
+# Metric per period (day/week/month/quarter/year) between two period bounds, aggregated in duckdb
+def metric_over_period(conn, metric, granularity = "quarter", start = None, end = None, dataset = None, symbol = None, agg = None):
+    return multi_metrics_over_period(conn, [metric], granularity, start, end, dataset, symbol, agg)
+
+def multi_metrics_over_period(conn, metrics, granularity = "quarter", start = None, end = None, dataset = None, symbol = None, agg = None):
+    if not metrics:
+        return pd.DataFrame({"error": ["No metrics provided."]})
+    dataset, error = _period_dataset(conn, list(metrics), dataset)
+    if error is not None:
+        return error
+    try:
+        return execute_period(conn, dataset, list(metrics), granularity, start, end, agg, symbol)
+    except ValueError as e:
+        return _year_error(e)
@@ -0,0 +1,78 @@
+import json
+import math
+import re
+from .config import payload_max_rows, payload_decimals
+
+# Compact tool results for the LLM: column -> values arrays, rounded numbers, row cap + summary
+
+def clean_value(value, decimals = payload_decimals):
+    if value is None:
+        return None
+    if hasattr(value, "item"):          # numpy scalars
+        value = value.item()
+    if isinstance(value, bool) or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        if value.is_integer() and abs(value) < 1e15:
+            return int(value)
+        return round(value, decimals)
+    if isinstance(value, str):
+        return value
+    return str(value)
+
+def _column(df, column, decimals):
+    return [clean_value(value, decimals) for value in df[column].tolist()]
+
+# min / max / first / last (and CAGR when a year column is present) per numeric column
+def summarize(df, decimals = payload_decimals):
+    ordered = df.sort_values("year") if "year" in df.columns else df
+    summary = {}
+    for column in ordered.columns:
+        if column == "year" or ordered[column].dtype.kind not in "iuf":
+            continue
+        values = ordered[column]
+        valid = values.notna()
+        if not valid.any():
+            continue
+        first, last = values[valid].iloc[0], values[valid].iloc[-1]
+        stats = {
+            "min": clean_value(values.min(), decimals),
+            "max": clean_value(values.max(), decimals),
+            "first": clean_value(first, decimals),
+            "last": clean_value(last, decimals),
+            }
+        if "year" in ordered.columns:
+            years = ordered["year"][valid]
+            span = int(years.iloc[-1]) - int(years.iloc[0])
+            stats["years"] = [int(years.iloc[0]), int(years.iloc[-1])]
+            if span > 0 and first > 0 and last > 0:
+                stats["cagr"] = clean_value((float(last) / float(first)) ** (1 / span) - 1, decimals)
+        summary[column] = stats
+    return summary
+
+# {"data": {column: [...]}, "rows": n}; over the cap keep head + tail rows and add a summary of all rows
+def compact_frame(df, max_rows = payload_max_rows, decimals = payload_decimals):
+    rows = len(df)
+    shown = df
+    payload = {}
+    if rows > max_rows:
+        head = max_rows // 2
+        shown = df.iloc[list(range(head)) + list(range(rows - (max_rows - head), rows))]
+        payload["truncated"] = {"rows_shown": max_rows, "rows_omitted": rows - max_rows, "omitted_after_row": head}
+        payload["summary"] = summarize(df, decimals)
+    payload = {"data": {column: _column(shown, column, decimals) for column in shown.columns}, "rows": rows, **payload}
+    return payload
+
+def compact_record(record, decimals = payload_decimals):
+    return {key: clean_value(value, decimals) for key, value in record.items()}
+
+### ---Measurement---
+
+# Rough token count for JSON payloads (words, digit groups of <= 3, single punctuation marks)
+_token_re = re.compile(r"[A-Za-z_]+|\d{1,3}|[^\sA-Za-z_\d]")
+
+def estimate_tokens(payload):
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii = False, default = str)
+    return len(_token_re.findall(text))
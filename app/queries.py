@@ -0,0 +1,73 @@
+import threading
+from .db import run_sql, table_version, derived_table_name
+
+# One SQL text per query shape (kind, table, metric set) with $n placeholders; values always go in as bound parameters.
+# No per-cursor plan reuse: duckdb's python api has no prepared handle and EXECUTE can't take parameters, and a
+# PREPARE/EXECUTE-with-literals variant is within noise of this path (`python -m app.bench queries`, prepared_speedup)
+_STATEMENTS = {}
+_statements_lock = threading.Lock()
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+# Year bounds are validated to ints (or None -> NULL) before they are bound
+def bind_year(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid year: {value!r}")
+    try:
+        year = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid year: {value!r}")
+    if year != value and str(year) != str(value).strip():
+        raise ValueError(f"Invalid year: {value!r}")
+    return year
+
+# Quoted SQL string literal, for the few places that can't take parameters (COPY targets, partition filters duckdb must see)
+def bind_text(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _statement(kind, shape, table_name, build):
+    key = (kind, table_name, tuple(shape), table_version(table_name))
+    with _statements_lock:
+        statement_sql = _STATEMENTS.get(key)
+        if statement_sql is None:
+            if len(_STATEMENTS) >= 1024:
+                _STATEMENTS.clear()
+            statement_sql = _STATEMENTS[key] = build()
+    return statement_sql
+
+# One statement per metric-set shape for "metrics between optional year bounds"
+def range_sql(metrics, table_name: str = "apple_financials"):
+    def build():
+        select_sql = ", ".join(["year"] + [_quote(metric) for metric in metrics])
+        where_sql = "($1::BIGINT IS NULL OR year >= $1::BIGINT) AND ($2::BIGINT IS NULL OR year <= $2::BIGINT)"
+        return f"SELECT {select_sql} FROM {table_name} WHERE {where_sql} ORDER BY year"
+    return _statement("range", metrics, table_name, build)
+
+# Indexed lookups on the derived table: one (metric, year_a, year_b) pair / the YoY rows of a metric
+def derived_pair_sql(table_name: str = "apple_financials"):
+    derived = derived_table_name(table_name)
+    return _statement("dpair", [], derived, lambda: (
+        "SELECT metric, year_a, year_b, value_a, value_b, delta_abs, delta_pct, cagr "
+        f"FROM {derived} WHERE metric = $1 AND year_a = $2::BIGINT AND year_b = $3::BIGINT"
+        ))
+
+def derived_yoy_sql(table_name: str = "apple_financials"):
+    derived = derived_table_name(table_name)
+    return _statement("dyoy", [], derived, lambda: (
+        "SELECT year_b AS year, value_b AS value, delta_abs, delta_pct AS growth_pct "
+        f"FROM {derived} WHERE metric = $1 AND is_yoy "
+        "AND ($2::BIGINT IS NULL OR year_a >= $2::BIGINT) AND ($3::BIGINT IS NULL OR year_b <= $3::BIGINT) "
+        "ORDER BY year_b"
+        ))
+
+def execute_range(conn, metrics, start_year = None, end_year = None, table_name: str = "apple_financials"):
+    return run_sql(conn, range_sql(metrics, table_name), [bind_year(start_year), bind_year(end_year)])
+
+def execute_derived_pair(conn, metric, year_a, year_b, table_name: str = "apple_financials"):
+    return run_sql(conn, derived_pair_sql(table_name), [metric, bind_year(year_a), bind_year(year_b)])
+
+def execute_derived_yoy(conn, metric, start_year = None, end_year = None, table_name: str = "apple_financials"):
+    return run_sql(conn, derived_yoy_sql(table_name), [metric, bind_year(start_year), bind_year(end_year)])
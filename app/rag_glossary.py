@@ -1,11 +1,12 @@
-from .config import rag_glossary_path
+import hashlib
+from .config import rag_glossary_path, glossary_persist_dir
+from .lazy import timed_import
 from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 
 # Only build once per process run
 GLOSSARY_RETRIEVER = None
+collection_name = "apple_finance_glossary"
 
 def load_glossary_docs():
     loader = TextLoader(str(rag_glossary_path), encoding="utf-8")
@@ -18,16 +19,52 @@ def load_glossary_docs():
     split_docs = splitter.split_documents(docs)
     return split_docs
 
+# Content hash per chunk -> stable Chroma ids (same text = same id, no duplicate rows)
+def chunk_id(doc):
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+def _hashed_docs():
+    by_id = {}
+    for doc in load_glossary_docs():
+        doc_id = chunk_id(doc)
+        if doc_id in by_id:
+            continue
+        doc.metadata = {**(doc.metadata or {}), "chunk_hash": doc_id}
+        by_id[doc_id] = doc
+    return by_id
+
+# Open the persisted collection, embed only new/changed chunks and delete stale ones
+def sync_vector_store(vectorstore, docs_by_id):
+    existing = vectorstore.get(include=["metadatas"])
+    existing_meta = dict(zip(existing.get("ids", []), existing.get("metadatas", [])))
+    new_ids = [doc_id for doc_id in docs_by_id if doc_id not in existing_meta]
+    stale_ids = [doc_id for doc_id in existing_meta if doc_id not in docs_by_id]
+    moved_ids = [
+        doc_id for doc_id, meta in existing_meta.items()
+        if doc_id in docs_by_id and (meta or {}).get("start_index") != docs_by_id[doc_id].metadata.get("start_index")
+        ]
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+    if new_ids:
+        vectorstore.add_documents([docs_by_id[doc_id] for doc_id in new_ids], ids=new_ids)
+    if moved_ids:
+        # same text, new offset: public update (re-embeds just these chunks, usually a handful after an edit)
+        vectorstore.update_documents(ids=moved_ids, documents=[docs_by_id[doc_id] for doc_id in moved_ids])
+    return {"added": len(new_ids), "deleted": len(stale_ids), "updated": len(moved_ids), "total": len(docs_by_id)}
+
 # Chromadb vector store + embeddings    (# no similiraity threshold, not needed here)
+# Always persisted (default data/chroma_glossary): a restart only embeds chunks that are new since the last run
 def vector_store(persist_directory = None):
-    docs = load_glossary_docs()
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        collection_name="apple_finance_glossary",
-        persist_directory=persist_directory,
+    docs_by_id = _hashed_docs()
+    # embeddings/vector store stack (torch, chromadb) is only loaded when the embedding fallback is first needed
+    Chroma = timed_import("langchain_community.vectorstores").Chroma
+    embeddings = timed_import("langchain_huggingface").HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    vectorstore = Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=str(persist_directory or glossary_persist_dir),
     )
+    sync_vector_store(vectorstore, docs_by_id)
     return vectorstore
 
 # Retriever
@@ -36,4 +73,4 @@ def get_glossary_retriever(persist_directory = None):
     if GLOSSARY_RETRIEVER is None:
         vs = vector_store(persist_directory=persist_directory)
         GLOSSARY_RETRIEVER = vs.as_retriever(search_kwargs={"k": 3})
-    return GLOSSARY_RETRIEVER
\ No newline at end of file
+    return GLOSSARY_RETRIEVER
@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .charts import render_chart_bytes, chart_spec
+from .config import chart_render_workers, chart_render_mode
+
+# Chart rendering pool: specs in, encoded image bytes out (disk writes only when asked)
+class ChartRenderer:
+    def __init__(self, workers = chart_render_workers, mode = chart_render_mode):
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        if mode == "process":
+            self._pool = ProcessPoolExecutor(max_workers = self.workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = "chart-render")
+        self._lock = threading.Lock()
+        self.rendered = 0
+
+    def submit(self, spec, fmt = "png"):
+        future = self._pool.submit(render_chart_bytes, spec, fmt)
+        future.add_done_callback(self._count)
+        return future
+
+    def _count(self, future):
+        if future.exception() is None:
+            with self._lock:
+                self.rendered += 1
+
+    def render(self, spec, fmt = "png", timeout = None):
+        return self.submit(spec, fmt).result(timeout = timeout)
+
+    def render_frame(self, df, metrics, title = None, fmt = "png", timeout = None):
+        return self.render(chart_spec(df, metrics, title), fmt, timeout)
+
+    def render_to_file(self, spec, path, fmt = "png", timeout = None):
+        data = self.render(spec, fmt, timeout)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def shutdown(self):
+        self._pool.shutdown(wait = True)
+
+# Only build once per process run
+CHART_RENDERER = None
+_renderer_lock = threading.Lock()
+
+def get_chart_renderer():
+    global CHART_RENDERER
+    with _renderer_lock:
+        if CHART_RENDERER is None:
+            CHART_RENDERER = ChartRenderer()
+    return CHART_RENDERER
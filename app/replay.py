@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, List
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from .config import base_dir
+
+# Record/replay of chat model responses: one JSON cassette keyed by (bound tools, conversation so far)
+
+class ReplayMiss(LookupError):
+    pass
+
+def _message_key(message):
+    entry = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        entry["tool_calls"] = [{"name": call["name"], "args": call["args"], "id": call.get("id")} for call in tool_calls]
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        entry["tool_call_id"] = tool_call_id
+    return entry
+
+# Stable across machines: absolute paths (chart files) are rewritten relative to the repo
+def conversation_key(messages, tool_names = ()):
+    payload = json.dumps({"tools": sorted(tool_names), "messages": [_message_key(m) for m in messages]}, sort_keys = True, default = str)
+    payload = payload.replace(str(base_dir), "<base>")
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _preview(messages):
+    for message in reversed(messages):
+        if message.type == "human":
+            return str(message.content)[:120]
+    return ""
+
+class Cassette:
+    def __init__(self, path):
+        self.path = str(path)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding = "utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return messages_from_dict([entry["message"]])[0]
+
+    def put(self, key, message, messages):
+        with self._lock:
+            self.entries[key] = {"message": message_to_dict(message), "question": _preview(messages)}
+            self.recorded += 1
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding = "utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, indent = 1)
+        os.replace(tmp_path, self.path)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+def _tool_names(tools):
+    return [getattr(tool, "name", None) or tool.get("name") for tool in tools]
+
+# Calls the real model (bound to the agent's tools) and writes every response into the cassette
+class RecordingChatModel(BaseChatModel):
+    inner: Any
+    cassette: Any
+    tools: List[Any] = []
+
+    @property
+    def _llm_type(self):
+        return "recording-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update = {"tools": list(tools)})
+
+    def _generate(self, messages, stop = None, run_manager = None, **kwargs):
+        model = self.inner.bind_tools(self.tools) if self.tools else self.inner
+        message = model.invoke(messages, stop = stop)
+        self.cassette.put(conversation_key(messages, _tool_names(self.tools)), message, messages)
+        return ChatResult(generations = [ChatGeneration(message = message)])
+
+# Answers from the cassette only (no network); misses go to `fallback` (e.g. the fake model) or raise ReplayMiss
+class ReplayChatModel(BaseChatModel):
+    cassette: Any
+    fallback: Any = None
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "replay-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update = {"tool_names": _tool_names(tools)})
+
+    def _generate(self, messages, stop = None, run_manager = None, **kwargs):
+        message = self.cassette.get(conversation_key(messages, self.tool_names))
+        if message is not None:
+            return ChatResult(generations = [ChatGeneration(message = message)])
+        if self.fallback is None:
+            raise ReplayMiss(f"No recorded response for: {_preview(messages)!r}")
+        fallback = self.fallback.bind_tools([{"name": name} for name in self.tool_names]) if self.tool_names else self.fallback
+        return fallback._generate(messages, stop = stop)
+
+def recording_llm_factory(cassette, inner_factory = None):
+    if inner_factory is None:
+        from .agents import anthropic_llm
+        inner_factory = anthropic_llm
+    return lambda temperature: RecordingChatModel(inner = inner_factory(temperature), cassette = cassette)
+
+def replay_llm_factory(cassette, fallback = None):
+    return lambda temperature: ReplayChatModel(cassette = cassette, fallback = fallback)
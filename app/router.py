@@ -0,0 +1,230 @@
+import asyncio
+import math
+import re
+import threading
+import time
+from collections import Counter, deque
+from .config import router_confidence_threshold
+from .aliases import get_alias_resolver
+
+ROUTE_LABELS = ("analysis", "analysis_with_chart", "definition", "other")
+
+# Keyword rules (previously inline in graph.router_node)
+chart_triggers = ("plot", "chart", "graph", "visualize", "trend", "over time", "line chart", "bar chart", "compare", "versus", " vs ")
+definition_triggers = ("define", "definition", "meaning of", "what is ", "what does ")
+
+# Seed questions for the local classifier (small on purpose: it only has to break ties the rules can't)
+seed_examples = {
+    "analysis": [
+        "what was apple's revenue in 2020",
+        "how much did net income grow from 2015 to 2024",
+        "what was the eps in 2018",
+        "calculate the yoy change in revenue for 2022",
+        "which year had the highest operating margin",
+        "how did gross margin change between 2012 and 2020",
+        "what is the cagr of revenue from 2010 to 2024",
+        "how many employees did apple have in 2021",
+        "what was total debt relative to assets in 2019",
+        "give me the net profit margin for each year since 2016",
+        "did cash on hand increase in 2023",
+        "what was the pe ratio at the end of 2022",
+        "summarize apple's profitability over the last five years",
+        "what was the difference in operating income between 2019 and 2021",
+        "rank the years by free cash and revenue growth",
+        ],
+    "analysis_with_chart": [
+        "plot revenue from 2010 to 2024",
+        "chart net income and operating income over time",
+        "show me a graph of eps since 2015",
+        "visualize gross margin trend",
+        "compare revenue versus net income 2012 to 2020",
+        "line chart of total assets and total liabilities",
+        "bar chart of employees by year",
+        "show the trend of cash on hand over the decade",
+        "draw revenue vs gross profit",
+        "plot the net profit margin history",
+        "graph long term debt over time",
+        "compare operating margin and net profit margin",
+        ],
+    "definition": [
+        "what is ebitda",
+        "define net profit margin",
+        "what does eps mean",
+        "meaning of debt to assets ratio",
+        "explain what gross margin is",
+        "what is the definition of current ratio",
+        "what is pe ratio",
+        "what does operating income measure",
+        "explain shares outstanding",
+        "how is net profit margin calculated",
+        "what does long term debt include",
+        "what is meant by cash on hand",
+        ],
+    "other": [
+        "what's the weather today",
+        "tell me a joke",
+        "who won the football game",
+        "write a poem about the sea",
+        "what is the capital of france",
+        "how do i cook pasta",
+        "translate hello to spanish",
+        "recommend a good movie",
+        "what time is it in tokyo",
+        "hi there",
+        ],
+    }
+
+def _tokens(text):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+# Multinomial naive bayes over unigrams + bigrams, trained from the seed set at import
+class NaiveBayesRouter:
+    def __init__(self, examples = None, alpha = 0.5):
+        examples = examples or seed_examples
+        self.alpha = alpha
+        self.labels = list(examples)
+        total_docs = sum(len(questions) for questions in examples.values())
+        self.log_priors = {label: math.log(len(examples[label]) / total_docs) for label in self.labels}
+        self.counts = {label: Counter() for label in self.labels}
+        for label, questions in examples.items():
+            for question in questions:
+                self.counts[label].update(_tokens(question))
+        self.vocab = set().union(*self.counts.values())
+        self.totals = {label: sum(counts.values()) for label, counts in self.counts.items()}
+
+    def predict_proba(self, question):
+        tokens = [t for t in _tokens(question) if t in self.vocab]
+        vocab_size = len(self.vocab)
+        scores = {}
+        for label in self.labels:
+            denom = self.totals[label] + self.alpha * vocab_size
+            score = self.log_priors[label]
+            for token in tokens:
+                score += math.log((self.counts[label][token] + self.alpha) / denom)
+            scores[label] = score
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+def rule_route(question):
+    q = question.lower()
+    if any(t in q for t in definition_triggers) and "what was" not in q and not any(t in q for t in chart_triggers):
+        return "definition"
+    if any(t in q for t in chart_triggers):
+        return "analysis_with_chart"
+    return None
+
+def parse_route_label(text):
+    label = (text or "").strip().lower().strip("`'\" .,\n\t")
+    label = label.split()[0] if label else ""
+    return label if label in ROUTE_LABELS else None
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+# Rules + classifier locally; the LLM router is only built/called when local confidence is low
+class QuestionRouter:
+    def __init__(self, llm_chain_factory = None, threshold = router_confidence_threshold, classifier = None):
+        self.llm_chain_factory = llm_chain_factory
+        self.threshold = threshold
+        self.classifier = classifier or NaiveBayesRouter()
+        self._llm_chain = None
+        self._lock = threading.Lock()
+        self.latencies_ms = deque(maxlen = 2000)
+        self.sources = Counter()
+        self.labels = Counter()
+
+    # -> (label, confidence, from_rule); metric typos are fixed first ("plot revnue" -> "plot revenue") so rules and
+    # classifier see known words
+    def local_route(self, question):
+        resolver = get_alias_resolver()
+        question = resolver.canonicalize(question)
+        proba = self.classifier.predict_proba(question)
+        rule_label = rule_route(question)
+        if rule_label is not None:
+            return rule_label, 0.6 + 0.4 * proba[rule_label], True
+        if resolver.metrics(question, fuzzy = False) and max(proba, key = proba.get) == "other":
+            proba = {label: value for label, value in proba.items() if label != "other"}     # names a metric: not off-topic
+        # no trigger words: the old default was "analysis"; let the classifier confirm or challenge it
+        label = max(proba, key = proba.get)
+        return label, proba[label], False
+
+    def _llm_route(self, question):
+        if self.llm_chain_factory is None:
+            return None
+        with self._lock:
+            if self._llm_chain is None:
+                self._llm_chain = self.llm_chain_factory()
+        try:
+            return parse_route_label(self._llm_chain.run(input = question))
+        except Exception:
+            return None
+
+    def route(self, question):
+        start = time.perf_counter()
+        return self._decide(question, self.local_route(question), start)
+
+    # Async front: confident local decisions stay on the event loop, LLM fallbacks go to a worker thread
+    async def aroute(self, question):
+        start = time.perf_counter()
+        local = self.local_route(question)
+        if local[1] >= self.threshold:
+            return self._decide(question, local, start)
+        return await asyncio.to_thread(self._decide, question, local, start)
+
+    # Local guess above the threshold wins; below it the LLM decides. Without an LLM answer a keyword rule still holds,
+    # anything else gets the old default ("analysis"): a weak classifier guess is not better than the baseline
+    def _decide(self, question, local, start):
+        label, confidence, from_rule = local
+        source = "local"
+        if confidence < self.threshold:
+            llm_label = self._llm_route(question)
+            if llm_label is not None:
+                label, source = llm_label, "llm"
+            else:
+                source = "local_fallback"
+                if not from_rule:
+                    label = "analysis"
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.latencies_ms.append(elapsed_ms)
+            self.sources[source] += 1
+            self.labels[label] += 1
+        return {"route": label, "confidence": confidence, "source": source, "latency_ms": elapsed_ms}
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self.latencies_ms)
+            total = sum(self.sources.values())
+            llm_calls = self.sources["llm"] + self.sources["local_fallback"]
+            return {
+                "questions": total,
+                "llm_fallbacks": llm_calls,
+                "llm_fallback_rate": (llm_calls / total) if total else 0.0,
+                "latency_ms_p50": _percentile(latencies, 50),
+                "latency_ms_p95": _percentile(latencies, 95),
+                "by_source": dict(self.sources),
+                "by_route": dict(self.labels),
+                }
+
+# Only build once per process run (shared by every graph so stats cover all sessions)
+QUESTION_ROUTER = None
+_router_init_lock = threading.Lock()
+
+def get_question_router(llm_chain_factory = None):
+    global QUESTION_ROUTER
+    with _router_init_lock:
+        if QUESTION_ROUTER is None:
+            QUESTION_ROUTER = QuestionRouter(llm_chain_factory = llm_chain_factory)
+    return QUESTION_ROUTER
+
+def router_stats():
+    if QUESTION_ROUTER is None:
+        return {}
+    return QUESTION_ROUTER.stats()
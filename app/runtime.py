@@ -1,17 +1,64 @@
-from .db import duckdb_connection, table_registration
+import asyncio
+import queue
+import threading
+import time
+from typing import Optional
+from .db import open_store, dataset_version, get_table_columns, CursorPool
 from .graph import create_app_graph
+from .answer_cache import AnswerCache
+from .config import store_path, answer_cache_enabled, question_concurrency, question_deadline_s
+from .lazy import timed_phase
+from .aliases import get_alias_resolver
+from .tracing import span, annotate, TracingCallbackHandler
+from .sql_guard import sql_session, SQL_GUARD
+from .timeseries import register_timeseries
 
-# Initializing duckdb, data table and building graph
-def init_graph():
-    conn = duckdb_connection()
-    table_registration(conn)
-    graph = create_app_graph(conn)
+# Only build once per process run (semantic cache of finished answers, cursor pool of the last graph)
+ANSWER_CACHE = None
+CURSOR_POOL = None
+
+# Initializing duckdb (persisted store read without locking it, rebuilt only on source change) and building graph
+def init_graph(db_path = store_path):
+    global ANSWER_CACHE, CURSOR_POOL
+    with timed_phase("open_store"):
+        conn = open_store(db_path)          # read-only load of the persisted store (rebuilt first only when stale)
+    with timed_phase("timeseries_registration"):
+        SQL_GUARD.allow_tables(register_timeseries(conn))     # views over the partitioned parquet datasets (if any)
+    # tools borrow a cursor per call, so concurrent sessions sharing this graph don't serialize on conn
+    CURSOR_POOL = CursorPool(conn)
+    with timed_phase("create_app_graph"):
+        graph = create_app_graph(CURSOR_POOL)
+    with timed_phase("alias_resolver"):
+        get_alias_resolver(get_table_columns(conn))         # compiled once here instead of on the first question
+    if answer_cache_enabled:
+        ANSWER_CACHE = AnswerCache(dataset_version(conn), get_table_columns(conn))
     return graph
 
-# Run user question through graph and return route, result
-def run_question(graph, question):
-    state = {"input": question}
-    final_state = graph.invoke(state)
+def answer_cache_stats():
+    if ANSWER_CACHE is None:
+        return {}
+    return ANSWER_CACHE.stats()
+
+def cursor_pool_stats():
+    if CURSOR_POOL is None:
+        return {}
+    return CURSOR_POOL.stats()
+
+def _cached_result(cache, question):
+    if cache is None:
+        return None
+    cached = cache.lookup(question)
+    if cached is None:
+        return None
+    return cached["route"], {
+        "output": cached["output"],
+        "image_path": cached["image_path"],
+        "intermediate_steps": [],
+        "cached": True,
+        }
+
+# Final graph state -> route, result (and into the answer cache)
+def _final_result(cache, question, final_state):
     route = final_state.get("route", "analysis")
     if route == "analysis":
         output = final_state.get("analyst_result", "") or ""
@@ -29,4 +76,138 @@ def run_question(graph, question):
         output = "I only handle questions about Apple's financials."
         image_path = None
         steps = []
-    return route, {"output": output, "image_path": image_path, "intermediate_steps": steps}
\ No newline at end of file
+    if cache is not None:
+        cache.store(question, route, output, image_path)
+    return route, {"output": output, "image_path": image_path, "intermediate_steps": steps, "cached": False}
+
+# Run user question through graph and return route, result
+def run_question(graph, question, use_cache: bool = True, session_id = None):
+    with span("question", "question", question = question[:300]), sql_session(session_id):
+        route, result = _run_question(graph, question, use_cache)
+        annotate(route = route, cached = result["cached"])
+    return route, result
+
+def _run_question(graph, question, use_cache):
+    cache = ANSWER_CACHE if use_cache else None
+    cached = _cached_result(cache, question)
+    if cached is not None:
+        return cached
+    final_state = graph.invoke({"input": question}, config = _trace_config())
+    return _final_result(cache, question, final_state)
+
+# Callbacks that turn every llm call under the current question span into a child span (latency + tokens)
+def _trace_config():
+    return {"callbacks": [TracingCallbackHandler()]}
+
+# Async variant: graph.ainvoke -> async agents (llm calls awaited, tools in worker threads)
+async def arun_question(graph, question, use_cache: bool = True, deadline_s: Optional[float] = None, session_id = None):
+    with span("question", "question", question = question[:300], deadline_s = deadline_s), sql_session(session_id):
+        route, result = await _arun_question(graph, question, use_cache, deadline_s)
+        annotate(route = route, cached = result["cached"])
+    return route, result
+
+async def _arun_question(graph, question, use_cache, deadline_s):
+    cache = ANSWER_CACHE if use_cache else None
+    cached = _cached_result(cache, question)
+    if cached is not None:
+        return cached
+    final_state = await asyncio.wait_for(graph.ainvoke({"input": question}, config = _trace_config()), timeout = deadline_s)
+    return await asyncio.to_thread(_final_result, cache, question, final_state)
+
+def _failed_result(route, message):
+    return route, {"output": message, "image_path": None, "intermediate_steps": [], "cached": False, "error": message}
+
+# Many questions at once: at most `concurrency` in flight, each bounded by `deadline_s`; results keep input order
+async def arun_questions(graph, questions, concurrency: int = question_concurrency,
+                         deadline_s: Optional[float] = question_deadline_s, use_cache: bool = True):
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+    async def one(question):
+        async with semaphore:
+            try:
+                return await arun_question(graph, question, use_cache = use_cache, deadline_s = deadline_s)
+            except asyncio.TimeoutError:
+                return _failed_result("timeout", f"No answer within {deadline_s:g}s.")
+            except Exception as e:
+                return _failed_result("error", f"Question failed. Error: {e}")
+    return await asyncio.gather(*(one(question) for question in questions))
+
+def run_questions(graph, questions, concurrency: int = question_concurrency,
+                  deadline_s: Optional[float] = question_deadline_s, use_cache: bool = True):
+    return asyncio.run(arun_questions(graph, questions, concurrency, deadline_s, use_cache))
+
+### ---Streaming---
+
+_answer_nodes = {"analyst", "chart", "glossary"}
+chart_tool_names = {"plot_metric_over_time_tool", "plot_multi_metrics_over_time_tool"}
+
+def _chunk_text(chunk):
+    content = getattr(chunk, "content", "")
+    if isinstance(content, list):           # anthropic streams content blocks
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict) and part.get("type") == "text")
+    return content or ""
+
+# Event stream for one question: route, answer tokens, tool start/end, charts as soon as they exist, then final
+async def astream_question(graph, question, use_cache: bool = True, session_id = None):
+    with span("question", "question", question = question[:300], streaming = True), sql_session(session_id):
+        async for event in _astream_question(graph, question, use_cache):
+            if event["type"] == "final":
+                annotate(route = event["route"], cached = event["result"]["cached"],
+                         first_token_ms = event["result"].get("first_token_ms"))
+            yield event
+
+async def _astream_question(graph, question, use_cache):
+    start = time.perf_counter()
+    cache = ANSWER_CACHE if use_cache else None
+    cached = _cached_result(cache, question)
+    if cached is not None:
+        yield {"type": "route", "route": cached[0]}
+        yield {"type": "final", "route": cached[0], "result": cached[1]}
+        return
+    final_state = None
+    first_token_ms = None
+    async for event in graph.astream_events({"input": question}, config = _trace_config(), version = "v2"):
+        kind = event["event"]
+        node = (event.get("metadata") or {}).get("langgraph_node")
+        data = event.get("data") or {}
+        if kind == "on_chain_end" and node == "router" and event["name"] == "router":
+            yield {"type": "route", "route": (data.get("output") or {}).get("route")}
+        elif kind == "on_chat_model_stream" and node in _answer_nodes:
+            text = _chunk_text(data.get("chunk"))
+            if text:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start) * 1000
+                yield {"type": "token", "text": text}
+        elif kind == "on_tool_start":
+            yield {"type": "tool_start", "tool": event["name"], "input": data.get("input")}
+        elif kind == "on_tool_end":
+            output = data.get("output")
+            yield {"type": "tool_end", "tool": event["name"], "output": output}
+            if event["name"] in chart_tool_names and isinstance(output, dict) and output.get("image_path"):
+                yield {"type": "chart", "image_path": output["image_path"]}
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            final_state = data.get("output")
+    route, result = await asyncio.to_thread(_final_result, cache, question, final_state or {})
+    result["first_token_ms"] = first_token_ms
+    result["total_ms"] = (time.perf_counter() - start) * 1000
+    yield {"type": "final", "route": route, "result": result}
+
+# Sync generator over astream_question for Streamlit (the event loop runs in a helper thread)
+def stream_question(graph, question, use_cache: bool = True, session_id = None):
+    events = queue.Queue()
+    done = object()
+    async def consume():
+        async for event in astream_question(graph, question, use_cache, session_id):
+            events.put(event)
+    def pump():
+        try:
+            asyncio.run(consume())
+        except Exception as e:
+            events.put({"type": "error", "error": f"Question failed. Error: {e}"})
+        finally:
+            events.put(done)
+    threading.Thread(target = pump, name = "question-stream", daemon = True).start()
+    while True:
+        event = events.get()
+        if event is done:
+            return
+        yield event
@@ -0,0 +1,253 @@
+import contextvars
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+import duckdb
+import pandas as pd
+from .db import run_sql, connection_lock, get_table_columns, sql_timeout_error, file_access_functions
+from .tracing import annotate
+from .config import (sql_guard_enabled, sql_allowed_tables, sql_timeout_s, sql_max_cost_rows, sql_max_rows, sql_max_bytes,
+                     sql_question_max_queries, sql_session_max_queries, sql_session_max_seconds)
+
+# Guarded execution for model-written SQL: validate -> EXPLAIN cost -> run with timeout + LIMIT -> cap rows/bytes
+
+# Functions that generate rows/huge values or touch the file system / environment (string formatting such as printf,
+# format, lpad stays allowed: an oversized value is stopped by the timeout and the database-wide memory_limit from db.py)
+blocked_functions = file_access_functions | {
+    "range", "generate_series", "repeat", "query", "query_table", "bar", "list_resize", "array_resize",
+    }
+# Joins whose estimated output is the product of their inputs
+_product_operators = {"CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "PIECEWISE_MERGE_JOIN"}
+
+class QueryBudget:
+    def __init__(self, name, max_queries = None, max_seconds = None):
+        self.name = name
+        self.max_queries = max_queries
+        self.max_seconds = max_seconds
+        self.queries = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def exhausted(self):
+        with self._lock:
+            if self.max_queries is not None and self.queries >= self.max_queries:
+                return f"{self.name} query budget used up ({self.max_queries} queries)"
+            if self.max_seconds is not None and self.seconds >= self.max_seconds:
+                return f"{self.name} query time budget used up ({self.max_seconds:g}s)"
+        return None
+
+    def charge(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+
+# Budgets in force for the current question (+ its session); worker threads see them via copied contexts
+_budgets = contextvars.ContextVar("cfo_sql_budgets", default = ())
+SESSION_BUDGETS = OrderedDict()
+_session_budgets_lock = threading.Lock()
+max_sessions = 1000
+
+def _session_budget(session_id):
+    with _session_budgets_lock:
+        budget = SESSION_BUDGETS.get(session_id)
+        if budget is None:
+            budget = SESSION_BUDGETS[session_id] = QueryBudget("session", sql_session_max_queries, sql_session_max_seconds)
+            while len(SESSION_BUDGETS) > max_sessions:
+                SESSION_BUDGETS.popitem(last = False)
+        else:
+            SESSION_BUDGETS.move_to_end(session_id)
+    return budget
+
+# One question (and, when session_id is given, the caller's session) gets a budget for the SQL it triggers
+@contextmanager
+def sql_session(session_id = None):
+    budgets = [QueryBudget("question", sql_question_max_queries)]
+    if session_id is not None:
+        budgets.append(_session_budget(session_id))
+    token = _budgets.set(tuple(budgets))
+    try:
+        yield budgets
+    finally:
+        _budgets.reset(token)
+
+def _walk(node):
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+def _estimate_rows(node):
+    children = [_estimate_rows(child) for child in node.get("children", [])]
+    estimate = node.get("extra_info", {}).get("Estimated Cardinality") if isinstance(node.get("extra_info"), dict) else None
+    own = float(estimate) if estimate not in (None, "") else 0.0
+    if node.get("name", "").strip() in _product_operators and children:
+        product = 1.0
+        for rows, _ in children:
+            product *= max(rows, 1.0)
+        own = max(own, product)
+    peak = max([own] + [child_peak for _, child_peak in children])
+    return own, peak
+
+class SQLGuard:
+    def __init__(self, allowed_tables = sql_allowed_tables, timeout_s = sql_timeout_s, max_cost_rows = sql_max_cost_rows,
+                 max_rows = sql_max_rows, max_bytes = sql_max_bytes, enabled = sql_guard_enabled):
+        self.allowed_tables = {table.lower() for table in allowed_tables}
+        self.timeout_s = timeout_s
+        self.max_cost_rows = max_cost_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    # Extra queryable tables/views registered after startup (e.g. the ts_* period views)
+    def allow_tables(self, tables):
+        with self._lock:
+            self.allowed_tables |= {table.lower() for table in tables}
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _reject(self, key, message):
+        self._count(f"rejected_{key}")
+        annotate(guard = key, error = message)
+        return pd.DataFrame({"error": [message]}), {"rejected": key}
+
+    # Every table reference in the parse tree (get_table_names skips catalog views such as information_schema.tables).
+    # Unqualified names must be allowed tables or CTEs of the query; qualified ones must also point at the main schema
+    # of the current database, so information_schema.*, pg_catalog.* and other attached catalogs never pass.
+    def _disallowed_tables(self, tree, database):
+        ctes = {str(entry.get("key", "")).lower() for node in _walk(tree) for entry in (node.get("cte_map") or {}).get("map", [])}
+        disallowed = set()
+        for node in _walk(tree.get("statements", [])):
+            if node.get("type") != "BASE_TABLE":
+                continue
+            catalog, schema = str(node.get("catalog_name") or "").lower(), str(node.get("schema_name") or "").lower()
+            table = str(node.get("table_name", "")).lower()
+            qualified = ".".join(part for part in (catalog, schema, table) if part)
+            if catalog not in ("", database) or schema not in ("", "main"):
+                disallowed.add(qualified)
+            elif table not in self.allowed_tables and not (table in ctes and not catalog and not schema):
+                disallowed.add(qualified)
+        return disallowed
+
+    # -> (statement text, None) or (None, (reason, message)); parse-time only, nothing is executed
+    def validate(self, conn, query):
+        try:
+            statements = conn.extract_statements(query)
+        except duckdb.Error as e:
+            return None, ("parse", f"SQL could not be parsed: {str(e).splitlines()[0]}")
+        if len(statements) != 1:
+            return None, ("statement", "Send exactly one SQL statement.")
+        statement = statements[0]
+        if statement.type != duckdb.StatementType.SELECT:
+            return None, ("statement", f"Only SELECT queries are allowed, got {statement.type.name}.")
+        text = statement.query.strip().rstrip(";")
+        with connection_lock(conn):
+            tree = json.loads(conn.execute("SELECT json_serialize_sql(?)", [text]).fetchone()[0])
+            database = conn.execute("SELECT current_database()").fetchone()[0].lower()
+        if tree.get("error"):
+            return None, ("parse", f"SQL could not be parsed: {tree.get('error_message')}")
+        disallowed = sorted(self._disallowed_tables(tree, database))
+        if disallowed:
+            return None, ("table", f"Tables not allowed: {', '.join(disallowed)}. Use only: {', '.join(sorted(self.allowed_tables))}.")
+        for node in _walk(tree.get("statements", [])):
+            if node.get("type") == "TABLE_FUNCTION":
+                return None, ("function", "Table functions are not allowed; select from the data tables.")
+            if node.get("class") == "FUNCTION" and str(node.get("function_name", "")).lower() in blocked_functions:
+                return None, ("function", f"Function {node['function_name']}() is not allowed.")
+        return text, None
+
+    # Largest row estimate of any operator in the optimized plan (cross joins multiply)
+    def estimated_rows(self, conn, text):
+        with connection_lock(conn):
+            plan = conn.execute(f"EXPLAIN (FORMAT JSON) {text}").fetchall()
+        peak = 0.0
+        for _, plan_json in plan:
+            for root in json.loads(plan_json):
+                peak = max(peak, _estimate_rows(root)[1])
+        return peak
+
+    def _cap(self, df):
+        notes = {}
+        if len(df) > self.max_rows:
+            df = df.iloc[:self.max_rows]
+            notes = {"row_cap": self.max_rows, "more_rows": True}
+            self._count("truncated_rows")
+        size = int(df.memory_usage(index = False, deep = True).sum()) if len(df) else 0
+        if size > self.max_bytes:
+            keep = max(1, int(len(df) * self.max_bytes / size))
+            df = df.iloc[:keep]
+            notes = {"byte_cap": self.max_bytes, "rows_kept": keep, "more_rows": True}
+            self._count("truncated_bytes")
+        return df, notes
+
+    # -> (DataFrame, notes); errors come back as the usual {"error": [...]} frame
+    def run(self, conn, query, use_cache = True):
+        if not self.enabled:
+            return run_sql(conn, query, use_cache = use_cache), {}
+        budgets = _budgets.get()
+        for budget in budgets:
+            reason = budget.exhausted()
+            if reason is not None:
+                return self._reject("budget", f"SQL not run: {reason}. Answer from the results you already have.")
+        text, problem = self.validate(conn, query)
+        if problem is not None:
+            return self._reject(*problem)
+        try:
+            cost = self.estimated_rows(conn, text)
+        except duckdb.Error as e:              # binder errors (unknown column, bad types): same message run_sql gives
+            self._count("failed")
+            columns = get_table_columns(conn)
+            columns_hint = f" Available columns: {', '.join(columns)}." if columns else ""
+            error = f"SQL query failed. Error: {str(e).splitlines()[0]}.{columns_hint}"
+            annotate(error = error)
+            return pd.DataFrame({"error": [error]}), {}
+        annotate(estimated_rows = cost)
+        if cost > self.max_cost_rows:
+            return self._reject("cost", f"Query too expensive (~{cost:,.0f} intermediate rows, limit {self.max_cost_rows:,.0f}); "
+                                        "filter or aggregate before joining.")
+        start = time.perf_counter()
+        df = run_sql(conn, f"SELECT * FROM ({text}) AS guarded_result LIMIT {self.max_rows + 1}", use_cache = use_cache, timeout_s = self.timeout_s)
+        elapsed = time.perf_counter() - start
+        for budget in budgets:
+            budget.charge(elapsed)
+        if "error" in df.columns:
+            error = str(df.loc[0, "error"])
+            self._count("timeouts" if error.startswith(sql_timeout_error) else "out_of_memory" if "Out of Memory" in error else "failed")
+            return df, {}
+        self._count("executed")
+        df, notes = self._cap(df)
+        if notes:
+            annotate(guard = "capped", **notes)
+        return df, notes
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        rejected = sum(value for key, value in counts.items() if key.startswith("rejected_"))
+        with _session_budgets_lock:
+            sessions = len(SESSION_BUDGETS)
+        return {
+            "enabled": self.enabled,
+            "executed": counts.get("executed", 0),
+            "rejected": rejected,
+            "timeouts": counts.get("timeouts", 0),
+            "failed": counts.get("failed", 0),
+            "out_of_memory": counts.get("out_of_memory", 0),
+            "truncated": counts.get("truncated_rows", 0) + counts.get("truncated_bytes", 0),
+            "sessions": sessions,
+            "by_reason": counts,
+            }
+
+# Only build once per process run
+SQL_GUARD = SQLGuard()
+
+def sql_guard_stats():
+    return SQL_GUARD.stats()
@@ -0,0 +1,205 @@
+import calendar
+import re
+import shutil
+import threading
+from datetime import date
+from pathlib import Path
+from .db import run_sql, connection_lock, pooled_connection, bump_table_version, get_table_schema
+from .queries import bind_text
+from .config import timeseries_dir
+
+# Period data next to the annual table: one hive-partitioned parquet tree per dataset, one view (ts_<dataset>) over it.
+# Filters on granularity/year prune whole partitions, date/symbol filters skip row groups (files are sorted by them).
+
+granularities = ["day", "week", "month", "quarter", "year"]
+_rank = {granularity: i for i, granularity in enumerate(granularities)}
+_period_labels = {
+    "day": "strftime(period_start, '%Y-%m-%d')",
+    "week": "strftime(period_start, '%Y-%m-%d')",
+    "month": "strftime(period_start, '%Y-%m')",
+    "quarter": "strftime(period_start, '%Y') || '-Q' || quarter(period_start)",
+    "year": "strftime(period_start, '%Y')",
+    }
+aggregations = {
+    "sum": "sum({m})",
+    "avg": "avg({m})",
+    "last": "arg_max({m}, \"date\")",
+    "first": "arg_min({m}, \"date\")",
+    "max": "max({m})",
+    "min": "min({m})",
+    }
+# Flows add up over a period; balances and prices take the period-end value; ratios average
+flow_metrics = {
+    "revenue_millions", "gross_profit_millions", "op_income_millions", "operating_income_millions", "net_income_millions",
+    "ebitda_millions", "eps", "volume",
+    }
+
+def default_aggregation(metric):
+    if metric in flow_metrics:
+        return "sum"
+    if metric.endswith(("_margin", "_ratio")):
+        return "avg"
+    return {"high": "max", "low": "min", "open": "first"}.get(metric, "last")
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+def view_name(dataset):
+    return f"ts_{dataset}"
+
+### ---Storage---
+
+# Registered datasets: name -> {"view", "path", "granularities", "has_symbol"}
+TIMESERIES = {}
+_timeseries_lock = threading.Lock()
+
+# (Re)write one granularity of a dataset from any SELECT with a `date` column (sorted so row-group stats prune)
+def write_timeseries(conn, dataset, source_sql, granularity, root = timeseries_dir):
+    if granularity not in _rank:
+        raise ValueError(f"Unknown granularity {granularity!r}; use one of {', '.join(granularities)}.")
+    if not re.fullmatch(r"[a-z][a-z0-9_]*", dataset):
+        raise ValueError(f"Invalid dataset name {dataset!r}.")
+    path = Path(root)/dataset
+    shutil.rmtree(path/f"granularity={granularity}", ignore_errors = True)
+    path.mkdir(parents = True, exist_ok = True)
+    with connection_lock(conn):
+        columns = [row[0] for row in conn.execute(f"DESCRIBE SELECT * FROM ({source_sql})").fetchall()]
+        if "date" not in columns:
+            raise ValueError("Time series source needs a `date` column.")
+        order_sql = "symbol, \"date\"" if "symbol" in columns else "\"date\""
+        conn.execute(
+            f"""
+            COPY (
+                SELECT * REPLACE (CAST("date" AS DATE) AS "date"), {bind_text(granularity)} AS granularity, year(CAST("date" AS DATE)) AS year
+                FROM ({source_sql})
+                ORDER BY {order_sql}
+            ) TO {bind_text(path.as_posix())} (FORMAT PARQUET, PARTITION_BY (granularity, year), OVERWRITE_OR_IGNORE true)
+            """
+            )
+    return register_timeseries(conn, root)
+
+def ingest_timeseries_csv(conn, dataset, csv_path, granularity, date_column = "date", root = timeseries_dir):
+    source_sql = f"SELECT * FROM read_csv_auto({bind_text(Path(csv_path).as_posix())})"
+    if date_column != "date":
+        source_sql = f"SELECT * EXCLUDE ({_quote(date_column)}), {_quote(date_column)} AS \"date\" FROM ({source_sql})"
+    return write_timeseries(conn, dataset, source_sql, granularity, root)
+
+# One view per dataset directory; returns the view names (call after writing, or once at startup)
+def register_timeseries(conn, root = timeseries_dir):
+    root = Path(root)
+    found = {}
+    if root.exists():
+        for path in sorted(p for p in root.iterdir() if p.is_dir()):
+            stored = [p.name.split("=", 1)[1] for p in path.glob("granularity=*") if any(p.rglob("*.parquet"))]
+            stored = sorted((g for g in stored if g in _rank), key = _rank.get)
+            if not stored:
+                continue
+            view = view_name(path.name)
+            pattern = bind_text((path/"*"/"*"/"*.parquet").as_posix())
+            with connection_lock(conn):
+                conn.execute(f"CREATE OR REPLACE VIEW {view} AS SELECT * FROM read_parquet({pattern}, hive_partitioning = true)")
+            bump_table_version(view)
+            found[path.name] = {"view": view, "path": str(path), "granularities": stored}
+    for dataset, info in found.items():
+        info["has_symbol"] = "symbol" in get_table_schema(conn, info["view"])["column_set"]
+    with _timeseries_lock:
+        TIMESERIES.clear()
+        TIMESERIES.update(found)
+    return [info["view"] for info in found.values()]
+
+def timeseries_datasets():
+    with _timeseries_lock:
+        return {dataset: dict(info) for dataset, info in TIMESERIES.items()}
+
+# First dataset whose columns include every metric
+def find_dataset(conn, metrics):
+    for dataset, info in timeseries_datasets().items():
+        if set(metrics) <= get_table_schema(conn, info["view"])["column_set"]:
+            return dataset
+    return None
+
+### ---Period queries---
+
+_bound_re = re.compile(r"^(\d{4})(?:-(?:q([1-4])|(\d{1,2})(?:-(\d{1,2}))?))?$")
+
+# 2015 / "2015" / "2015-Q2" / "2015-06" / "2015-06-30" -> first (side="start") or last (side="end") day covered
+def parse_period_bound(value, side):
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value
+    match = _bound_re.match(str(value).strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid period {value!r}; use YYYY, YYYY-Qn, YYYY-MM or YYYY-MM-DD.")
+    year, quarter, month, day = match.groups()
+    year = int(year)
+    try:
+        if day is not None:
+            return date(year, int(month), int(day))
+        if month is not None:
+            first_month = last_month = int(month)
+        elif quarter is not None:
+            first_month, last_month = 3 * int(quarter) - 2, 3 * int(quarter)
+        else:
+            first_month, last_month = 1, 12
+        if side == "start":
+            return date(year, first_month, 1)
+        return date(year, last_month, calendar.monthrange(year, last_month)[1])
+    except (ValueError, calendar.IllegalMonthError) as e:
+        raise ValueError(f"Invalid period {value!r}: {e}.") from None
+
+# Coarsest stored granularity that can still be rolled up to the requested one (weeks straddle months, so they only serve weeks)
+def source_granularity(dataset, granularity):
+    info = timeseries_datasets().get(dataset)
+    if info is None:
+        raise ValueError(f"No time series dataset {dataset!r}; available: {', '.join(timeseries_datasets()) or 'none'}.")
+    candidates = [g for g in info["granularities"] if _rank[g] <= _rank[granularity] and (g != "week" or granularity == "week")]
+    if not candidates:
+        stored = ", ".join(info["granularities"])
+        raise ValueError(f"{dataset} is stored at {stored} granularity; it can't be rolled up to {granularity} "
+                         "(weekly data only serves weekly queries).")
+    return candidates[-1]
+
+def period_sql(dataset, metrics, granularity, start = None, end = None, agg = None, symbol = None):
+    if granularity not in _rank:
+        raise ValueError(f"Unknown granularity {granularity!r}; use one of {', '.join(granularities)}.")
+    info = timeseries_datasets()[dataset]
+    source = source_granularity(dataset, granularity)
+    start_date, end_date = parse_period_bound(start, "start"), parse_period_bound(end, "end")
+    selects = []
+    for metric in metrics:
+        how = (agg or {}).get(metric) if isinstance(agg, dict) else agg
+        how = how or default_aggregation(metric)
+        if how not in aggregations:
+            raise ValueError(f"Unknown aggregation {how!r}; use one of {', '.join(aggregations)}.")
+        selects.append(f"{aggregations[how].format(m = _quote(metric))} AS {_quote(metric)}")
+    # literal filters so duckdb can prune partitions (granularity, year) and row groups (date, symbol)
+    where = [f"granularity = {bind_text(source)}"]
+    if start_date is not None:
+        where += [f"year >= {start_date.year}", f"\"date\" >= DATE '{start_date.isoformat()}'"]
+    if end_date is not None:
+        where += [f"year <= {end_date.year}", f"\"date\" <= DATE '{end_date.isoformat()}'"]
+    # one series per symbol: mixing symbols would sum their flows and pick an arbitrary symbol's period-end value
+    if symbol is not None:
+        if not info.get("has_symbol"):
+            raise ValueError(f"{dataset} has no symbol column.")
+        where.append(f"symbol = {bind_text(symbol)}")
+    elif info.get("has_symbol"):
+        raise ValueError(f"{dataset} holds several symbols; pass symbol (e.g. 'AAPL') to get one series.")
+    return (
+        f"SELECT {_period_labels[granularity]} AS period, period_start, {', '.join(_quote(m) for m in metrics)} FROM ("
+        f"SELECT date_trunc({bind_text(granularity)}, \"date\") AS period_start, {', '.join(selects)} "
+        f"FROM {info['view']} WHERE {' AND '.join(where)} GROUP BY 1) ORDER BY period_start"
+        )
+
+# -> DataFrame(period, period_start, *metrics) aggregated in duckdb to `granularity`
+def execute_period(conn, dataset, metrics, granularity = "year", start = None, end = None, agg = None, symbol = None):
+    query = period_sql(dataset, list(metrics), granularity, start, end, agg, symbol)
+    with pooled_connection(conn) as cursor:
+        return run_sql(cursor, query)
+
+def timeseries_columns(conn, dataset):
+    info = timeseries_datasets().get(dataset)
+    if info is None:
+        return []
+    return [c for c in get_table_schema(conn, info["view"])["columns"] if c not in ("date", "granularity", "year", "symbol")]
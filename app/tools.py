@@ -1,14 +1,17 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from langchain_core.tools import StructuredTool
-from .rag_glossary import get_glossary_retriever
-from .metrics import metric_over_time, multi_metrics_over_time
-from .db import run_sql, get_table_columns
-from .charts import plot_metric_over_time, plot_multi_metrics
-from .config import base_dir
-import os
-import uuid
-import matplotlib.pyplot as plt
+from .glossary_index import HybridGlossaryRetriever, get_glossary_index
+from .metrics import metric_over_time, multi_metrics_over_time, metric_change, metric_growth, multi_metrics_over_period
+from .db import run_sql, get_table_schema, dataset_version, pooled_connection
+from .charts import chart_spec, chart_style_version
+from .chart_cache import chart_key, get_chart_cache
+from .render import get_chart_renderer
+from .config import base_dir, plot_payload_mode
+from .tracing import traced, span
+from .payloads import compact_frame, compact_record, summarize, clean_value
+from .sql_guard import SQL_GUARD
+from .timeseries import timeseries_datasets, timeseries_columns, granularities, aggregations
 
 ### ---Classes---
 
@@ -39,6 +42,51 @@ class MultiMetricsOverTimeInput(BaseModel):
         None,
         description = "Last year inclusive. If blank/omitted, use latest year.")
 
+class MetricChangeInput(BaseModel):
+    metric: str = Field(
+        ...,
+        description = "Name of the financial metric column. Examples: 'revenue_millions', 'net_income_millions', 'eps'.")
+    year_a: int = Field(
+        ...,
+        description = "First year of the comparison.")
+    year_b: int = Field(
+        ...,
+        description = "Second year of the comparison.")
+
+class MetricGrowthInput(BaseModel):
+    metric: str = Field(
+        ...,
+        description = "Name of the financial metric column. Examples: 'revenue_millions', 'net_income_millions', 'eps'.")
+    start_year: Optional[int] = Field(
+        None,
+        description = "First year inclusive. If blank/omitted, use earliest year.")
+    end_year: Optional[int] = Field(
+        None,
+        description = "Last year inclusive. If blank/omitted, use latest year.")
+
+class MetricsOverPeriodInput(BaseModel):
+    metrics: List[str] = Field(
+        ...,
+        description = "Metric columns of a period dataset. Examples: ['close'], ['revenue_millions', 'net_income_millions'].")
+    granularity: str = Field(
+        "quarter",
+        description = "Period to aggregate to: 'day', 'week', 'month', 'quarter' or 'year'.")
+    start: Optional[str] = Field(
+        None,
+        description = "First period inclusive: 'YYYY', 'YYYY-Qn', 'YYYY-MM' or 'YYYY-MM-DD'. If blank/omitted, use earliest.")
+    end: Optional[str] = Field(
+        None,
+        description = "Last period inclusive, same formats as start. If blank/omitted, use latest.")
+    dataset: Optional[str] = Field(
+        None,
+        description = "Dataset name. If blank/omitted, use the first dataset that has all the metrics.")
+    symbol: Optional[str] = Field(
+        None,
+        description = "Ticker to filter on; required for datasets with a symbol column. Example: 'AAPL'.")
+    agg: Optional[str] = Field(
+        None,
+        description = "Aggregation override: 'sum', 'avg', 'last', 'first', 'max' or 'min'. If blank/omitted, flows are summed, ratios averaged, prices/balances take the period-end value.")
+
 class SQLQueryInput(BaseModel):
     query: str = Field(
         ...,
@@ -79,9 +127,23 @@ class PlotMultiMetricsOverTimeInput(BaseModel):
     
 ### ---Tools---
 
-# Glossary RAG tool
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+# Plot tool result: the chart was already rendered, so by default the model only gets the path + a summary
+def _plot_payload(image_path, df, mode = plot_payload_mode):
+    if mode == "chart_only":
+        return {"image_path": image_path, "rows": len(df), "summary": summarize(df)}
+    return {"image_path": image_path, **compact_frame(df)}
+
+# Glossary RAG tool (lexical section index; the embedding retriever is only built when lexical match is ambiguous)
 def create_glossary_rag_tool(persist_directory = None):
-    retriever = get_glossary_retriever(persist_directory = persist_directory)
+    def embedding_retriever():
+        from .rag_glossary import get_glossary_retriever
+        return get_glossary_retriever(persist_directory = persist_directory)
+    retriever = HybridGlossaryRetriever(get_glossary_index(), fallback_factory = embedding_retriever)
+    @traced("tool:glossary_rag_tool", "tool", record_args = True)
     def run(question: str):
         docs = retriever.invoke(question)
         if not docs:
@@ -110,13 +172,15 @@ def create_glossary_rag_tool(persist_directory = None):
 def create_metric_over_time_tool(conn):
     if conn is None:
         raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:metric_over_time_tool", "tool", record_args = True)
     def run(metric, start_year = None, end_year = None):
-        df = metric_over_time(conn, metric, start_year, end_year)
+        with pooled_connection(conn) as cursor:       # one cursor per tool call (conn may be a CursorPool)
+            df = metric_over_time(cursor, metric, start_year, end_year)
         if "error" in df.columns:
             return [{"error": df.loc[0, "error"]}]
         if df.empty:
             return []
-        return df.to_dict(orient="records")
+        return compact_frame(df)
 
     tool = StructuredTool.from_function(
         func = run,
@@ -130,13 +194,15 @@ def create_metric_over_time_tool(conn):
 def create_multi_metrics_over_time_tool(conn):
     if conn is None:
         raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:multi_metrics_over_time_tool", "tool", record_args = True)
     def run(metrics, start_year = None, end_year = None):
-        df = multi_metrics_over_time(conn, metrics, start_year, end_year)
+        with pooled_connection(conn) as cursor:
+            df = multi_metrics_over_time(cursor, metrics, start_year, end_year)
         if "error" in df.columns:
             return [{"error": df.loc[0, "error"]}]
         if df.empty:
             return []
-        return df.to_dict(orient="records")
+        return compact_frame(df)
     
     tool = StructuredTool.from_function(
         func = run,
@@ -146,22 +212,111 @@ def create_multi_metrics_over_time_tool(conn):
         )
     return tool
 
+# MetricChange tool (precomputed deltas + CAGR)
+def create_metric_change_tool(conn):
+    if conn is None:
+        raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:metric_change_tool", "tool", record_args = True)
+    def run(metric, year_a, year_b):
+        with pooled_connection(conn) as cursor:
+            df = metric_change(cursor, metric, year_a, year_b)
+        if "error" in df.columns:
+            return {"error": df.loc[0, "error"]}
+        if df.empty:
+            return {"error": "No data for that metric/year pair."}
+        return compact_record(df.to_dict(orient="records")[0])
+
+    tool = StructuredTool.from_function(
+        func = run,
+        name = "metric_change_tool",
+        description = ("Use to get a metric's values in two years with the precomputed absolute change, percent change (fraction) and CAGR between them."),
+        args_schema = MetricChangeInput
+        )
+    return tool
+
+# MetricGrowth tool (precomputed YoY growth + CAGR over the range)
+def create_metric_growth_tool(conn):
+    if conn is None:
+        raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:metric_growth_tool", "tool", record_args = True)
+    def run(metric, start_year = None, end_year = None):
+        with pooled_connection(conn) as cursor:
+            yoy = metric_growth(cursor, metric, start_year, end_year)
+            if "error" in yoy.columns:
+                return {"error": yoy.loc[0, "error"]}
+            if yoy.empty:
+                return {"error": "No data for that metric/year range."}
+            first_year = int(yoy["year"].min()) - 1
+            last_year = int(yoy["year"].max())
+            overall = metric_change(cursor, metric, first_year, last_year)
+        result = {"metric": metric, "yoy": compact_frame(yoy)}
+        if "error" not in overall.columns and not overall.empty:
+            result.update({
+                "start_year": first_year,
+                "end_year": last_year,
+                "cagr": clean_value(overall.loc[0, "cagr"]),
+                "delta_abs": clean_value(overall.loc[0, "delta_abs"]),
+                "delta_pct": clean_value(overall.loc[0, "delta_pct"]),
+                })
+        return result
+
+    tool = StructuredTool.from_function(
+        func = run,
+        name = "metric_growth_tool",
+        description = ("Use to get year-over-year growth (fractions) for a metric plus the CAGR and total change over the range."),
+        args_schema = MetricGrowthInput
+        )
+    return tool
+
+# MetricsOverPeriod tool (partitioned quarterly/daily datasets, aggregated in duckdb)
+def create_metrics_over_period_tool(conn):
+    if conn is None:
+        raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:metrics_over_period_tool", "tool", record_args = True)
+    def run(metrics, granularity = "quarter", start = None, end = None, dataset = None, symbol = None, agg = None):
+        df = multi_metrics_over_period(conn, metrics, granularity, start, end, dataset, symbol, agg)
+        if "error" in df.columns:
+            return [{"error": df.loc[0, "error"]}]
+        if df.empty:
+            return []
+        return compact_frame(df.drop(columns = ["period_start"]))
+
+    with pooled_connection(conn) as cursor:
+        listing = "; ".join(
+            f"{name} ({', '.join(info['granularities'])}{'; per symbol, symbol required' if info['has_symbol'] else ''}; "
+            f"{', '.join(timeseries_columns(cursor, name))})"
+            for name, info in timeseries_datasets().items()
+            )
+    tool = StructuredTool.from_function(
+        func = run,
+        name = "metrics_over_period_tool",
+        description = (f"Use for quarterly, monthly, weekly or daily data (the main table is annual only). Datasets: {listing}. "
+                       f"Granularities: {', '.join(granularities)}; aggregations: {', '.join(aggregations)}."),
+        args_schema = MetricsOverPeriodInput
+        )
+    return tool
+
 # SQL tool
 def create_sql_query_tool(conn):
     if conn is None:
         raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
+    @traced("tool:sql_query_tool", "tool", record_args = True)
     def run(query: str):
-        df = run_sql(conn, query)
+        with pooled_connection(conn) as cursor:
+            df, notes = SQL_GUARD.run(cursor, query)
         if "error" in df.columns:
             return [{"error": df.loc[0, "error"]}]
         if df.empty:
             return []
-        return df.to_dict(orient="records")
+        payload = compact_frame(df)
+        if notes:
+            payload["result_cap"] = notes           # more rows exist than were returned
+        return payload
 
     tool = StructuredTool.from_function(
         func = run,
         name = "sql_query_tool",
-        description = "Use to run custom SQL queries over the data table with complex filters, conditions, joins.",
+        description = "Use to run custom SQL queries over the data table with complex filters, conditions, joins. One SELECT statement only; slow or very large queries are rejected or capped.",
         args_schema=SQLQueryInput
         )
     return tool
@@ -170,9 +325,16 @@ def create_sql_query_tool(conn):
 def create_schema_info_tool(conn):
     if conn is None:
         raise ValueError("Connection is None. Call duckdb_connection() and table_registration() properly.")
+    @traced("tool:schema_info_tool", "tool", record_args = True)
     def run(table_name: str = "apple_financials"):
-        columns = get_table_columns(conn, table_name)
-        return {"table_name": table_name, "columns": columns}
+        with pooled_connection(conn) as cursor:
+            schema = get_table_schema(cursor, table_name)
+        return {
+            "table_name": table_name,
+            "columns": list(schema["columns"]),
+            "dtypes": dict(schema["dtypes"]),
+            "year_range": [schema["year_min"], schema["year_max"]],
+            }
 
     tool = StructuredTool.from_function(
         func=run,
@@ -183,69 +345,74 @@ def create_schema_info_tool(conn):
     return tool
 
 # PlotMetricOverTime tool
-def create_plot_metric_over_time_tool(conn, charts_dir = None):
+def create_plot_metric_over_time_tool(conn, charts_dir = None, mode = plot_payload_mode):
     if charts_dir is None:
         charts_dir = str((base_dir/"charts").resolve())
-    os.makedirs(charts_dir, exist_ok = True)
     if conn is None:
         raise ValueError("Connection is None. Please call duckdb_connection() and table_registration() properly.")
-    os.makedirs(charts_dir, exist_ok=True)
+    chart_cache = get_chart_cache(charts_dir)
+    renderer = get_chart_renderer()
+    @traced("tool:plot_metric_over_time_tool", "tool", record_args = True)
     def run(metric, start_year = None, end_year = None, title=None):
-        fig, df = plot_metric_over_time(conn, metric, start_year, end_year, title)
-        if fig is None or df is None:
+        with pooled_connection(conn) as cursor:       # released before rendering
+            df = metric_over_time(cursor, metric, start_year, end_year)
+        if df is None:
             return {"error": "Plot function returned no figure/data."}
-        if hasattr(df, "columns") and "error" in df.columns:
+        if "error" in df.columns:
             return {"error": str(df.loc[0, "error"])}
-        if getattr(df, "empty", False):
+        if df.empty:
             return {"error": "No data returned for that metric/year range."}
-        filename = f"{metric}_{uuid.uuid4().hex}.png"
-        image_path = os.path.join(charts_dir, filename)
-        fig.savefig(image_path, bbox_inches="tight")
-        plt.close(fig)
-    
-        return {
-            "image_path": image_path,
-            "data": df.to_dict(orient="records"),
-        }
+        key = chart_key("single", [metric], start_year, end_year, title, dataset_version(conn), chart_style_version)
+        image_path = chart_cache.path_for(key, prefix = metric)
+        cache_hit = chart_cache.lookup(image_path)
+        with span("chart_render", "chart", cache_hit = cache_hit, image_path = image_path):
+            if not cache_hit:
+                image = renderer.render(chart_spec(df, [metric], title, kind = "single"))
+                chart_cache.store(image_path, lambda path: _write_bytes(path, image))
+        return _plot_payload(image_path, df, mode)
 
     tool = StructuredTool.from_function(
         func=run,
         name="plot_metric_over_time_tool",
         description=(
-            "Generates a time-series line chart for a metric over years and return a file path to the saved chart image and the underlying data."),
+            "Generates a time-series line chart for a metric over years and return a file path to the saved chart image plus a summary (min/max/first/last/CAGR) of the plotted data."),
         args_schema=PlotMetricOverTimeInput,
     )
     return tool
 
 # PlotMultiMetricsOverTime tool
-def create_plot_multi_metrics_over_time_tool(conn, charts_dir=None):
+def create_plot_multi_metrics_over_time_tool(conn, charts_dir=None, mode = plot_payload_mode):
     if charts_dir is None:
         charts_dir = str((base_dir/"charts").resolve())
-    os.makedirs(charts_dir, exist_ok=True)
     if conn is None:
         raise ValueError("Connection is None. call duckdb_connection() and table_registration() properly.")
+    chart_cache = get_chart_cache(charts_dir)
+    renderer = get_chart_renderer()
+    @traced("tool:plot_multi_metrics_over_time_tool", "tool", record_args = True)
     def run(metrics, start_year=None, end_year=None, title=None):
-        fig, df = plot_multi_metrics(conn, metrics, start_year, end_year, title=title or "Financial Comparison")
-        if fig is None or df is None:
+        title = title or "Financial Comparison"
+        with pooled_connection(conn) as cursor:
+            df = multi_metrics_over_time(cursor, metrics, start_year, end_year)
+        if df is None:
             return {"error": "Plot function returned no figure/data."}
-        if hasattr(df, "columns") and "error" in df.columns:
+        if "error" in df.columns:
             return {"error": str(df.loc[0, "error"])}
-        if getattr(df, "empty", False):
+        if df.empty:
             return {"error": "No data returned for that metric/year range."}
-        filename = f"multi_{uuid.uuid4().hex}.png"
-        image_path = os.path.join(charts_dir, filename)
-        fig.savefig(image_path, bbox_inches="tight")
-        plt.close(fig)
-        return {
-            "image_path": image_path,
-            "data": df.to_dict(orient="records"),
-        }
+        key = chart_key("multi", metrics, start_year, end_year, title, dataset_version(conn), chart_style_version)
+        image_path = chart_cache.path_for(key, prefix = "multi")
+        cache_hit = chart_cache.lookup(image_path)
+        with span("chart_render", "chart", cache_hit = cache_hit, image_path = image_path):
+            if not cache_hit:
+                image = renderer.render(chart_spec(df, metrics, title, kind = "multi"))
+                chart_cache.store(image_path, lambda path: _write_bytes(path, image))
+        return _plot_payload(image_path, df, mode)
 
     tool = StructuredTool.from_function(
         func=run,
         name="plot_multi_metrics_over_time_tool",
         description=(
-            "Generates a time-series line chart for multiple metrics over years and return a file path to the saved chart image and the underlying data."),
+            "Generates a time-series line chart for multiple metrics over years and return a file path to the saved chart image plus a summary (min/max/first/last/CAGR) of the plotted data."),
         args_schema=PlotMultiMetricsOverTimeInput,
     )
     return tool
\ No newline at end of file
@@ -0,0 +1,296 @@
+import contextvars
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from .config import tracing_enabled, trace_path, trace_max_bytes
+
+# Currently open span (spans opened inside it become its children, worker threads inherit it via copied contexts)
+_current_span = contextvars.ContextVar("cfo_current_span", default = None)
+
+latency_buckets_ms = [1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 30000]
+token_buckets = [100, 250, 500, 1000, 2000, 4000, 8000, 16000]
+
+def _new_id():
+    return uuid.uuid4().hex[:16]
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+def _histogram(values, edges):
+    counts = OrderedDict((f"<={edge}", 0) for edge in edges)
+    counts[f">{edges[-1]}"] = 0
+    for value in values:
+        for edge in edges:
+            if value <= edge:
+                counts[f"<={edge}"] += 1
+                break
+        else:
+            counts[f">{edges[-1]}"] += 1
+    return counts
+
+# Spans -> JSONL file + in-memory aggregates (latency per span name, llm tokens, last N traces)
+class Tracer:
+    def __init__(self, path = trace_path, enabled = tracing_enabled, max_bytes = trace_max_bytes, window = 5000, keep_traces = 50):
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.keep_traces = keep_traces
+        self.latencies_ms = defaultdict(lambda: deque(maxlen = window))
+        self.tokens = {"input": deque(maxlen = window), "output": deque(maxlen = window)}
+        self.round_trips = {"llm_calls": deque(maxlen = window), "tool_calls": deque(maxlen = window)}
+        self.traces = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, span):
+        if self.path is None:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+            self._file = open(self.path, "a", encoding = "utf-8")
+        self._file.write(json.dumps(span, default = str) + "\n")
+        if span["parent_id"] is None:
+            self._file.flush()
+            if self._file.tell() > self.max_bytes:
+                self._file.close()
+                os.replace(self.path, self.path + ".1")
+                self._file = None
+
+    def record(self, span):
+        with self._lock:
+            self.latencies_ms[span["name"]].append(span["duration_ms"])
+            if span["kind"] == "llm":
+                for direction in ("input", "output"):
+                    if span["attrs"].get(f"{direction}_tokens") is not None:
+                        self.tokens[direction].append(span["attrs"][f"{direction}_tokens"])
+            trace = self.traces.get(span["trace_id"])
+            if trace is None:
+                trace = self.traces[span["trace_id"]] = {"spans": []}
+                while len(self.traces) > self.keep_traces:
+                    self.traces.popitem(last = False)
+            if span["parent_id"] is None:
+                self._count_round_trips(span, trace["spans"])
+            trace["spans"].append(span)
+            try:
+                self._write(span)
+            except OSError:
+                self.path = None            # tracing must never break a question
+
+    # model calls / tool calls made while answering one question (children finish before their root)
+    def _count_round_trips(self, root, spans):
+        counts = {
+            "llm_calls": sum(1 for span in spans if span["kind"] == "llm"),
+            "tool_calls": sum(1 for span in spans if span["kind"] == "tool"),
+            }
+        root["attrs"].update(counts)
+        for key, value in counts.items():
+            self.round_trips[key].append(value)
+
+    def open_span(self, name, kind, attrs, parent = None):
+        parent = parent if parent is not None else _current_span.get()
+        return {
+            "trace_id": parent["trace_id"] if parent else _new_id(),
+            "span_id": _new_id(),
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+            "kind": kind,
+            "start": time.time(),
+            "attrs": dict(attrs),
+            "_t0": time.perf_counter(),
+            }
+
+    def close_span(self, span, error = None):
+        span["duration_ms"] = (time.perf_counter() - span.pop("_t0")) * 1000
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        self.record(span)
+
+    @contextmanager
+    def span(self, name, kind = "internal", **attrs):
+        if not self.enabled:
+            yield None
+            return
+        span = self.open_span(name, kind, attrs)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.close_span(span, error)
+
+    def stats(self):
+        with self._lock:
+            latencies = {name: list(values) for name, values in self.latencies_ms.items()}
+            tokens = {direction: list(values) for direction, values in self.tokens.items()}
+            round_trips = {key: list(values) for key, values in self.round_trips.items()}
+        spans = {
+            name: {
+                "count": len(values),
+                "p50_ms": _percentile(values, 50),
+                "p95_ms": _percentile(values, 95),
+                "max_ms": max(values),
+                "histogram_ms": _histogram(values, latency_buckets_ms),
+                }
+            for name, values in sorted(latencies.items())
+            }
+        llm_tokens = {
+            direction: {
+                "count": len(values),
+                "total": sum(values),
+                "p50": _percentile(values, 50),
+                "p95": _percentile(values, 95),
+                "histogram": _histogram(values, token_buckets),
+                }
+            for direction, values in tokens.items()
+            }
+        per_question = {
+            key: {
+                "questions": len(values),
+                "mean": (sum(values) / len(values)) if values else None,
+                "p50": _percentile(values, 50),
+                "max": max(values) if values else None,
+                }
+            for key, values in round_trips.items()
+            }
+        return {"spans": spans, "llm_tokens": llm_tokens, "per_question": per_question}
+
+    # Finished questions, newest first: root span + where the time went
+    def recent(self, limit = 20):
+        with self._lock:
+            traces = list(self.traces.items())[-limit:]
+        rows = []
+        for trace_id, trace in reversed(traces):
+            root = next((span for span in trace["spans"] if span["parent_id"] is None), None)
+            if root is None:
+                continue
+            rows.append({
+                "trace_id": trace_id,
+                "name": root["name"],
+                "question": root["attrs"].get("question"),
+                "route": root["attrs"].get("route"),
+                "duration_ms": root["duration_ms"],
+                "llm_calls": root["attrs"].get("llm_calls"),
+                "tool_calls": root["attrs"].get("tool_calls"),
+                "spans": len(trace["spans"]),
+                })
+        return rows
+
+    def trace(self, trace_id):
+        with self._lock:
+            spans = list(self.traces.get(trace_id, {}).get("spans", []))
+        return sorted(spans, key = lambda span: span["start"])
+
+    def reset(self):
+        with self._lock:
+            self.latencies_ms.clear()
+            for values in list(self.tokens.values()) + list(self.round_trips.values()):
+                values.clear()
+            self.traces.clear()
+
+TRACER = Tracer()
+
+def span(name, kind = "internal", **attrs):
+    return TRACER.span(name, kind, **attrs)
+
+# Add attributes to the innermost open span (no-op outside a span)
+def annotate(**attrs):
+    current = _current_span.get()
+    if current is not None:
+        current["attrs"].update(attrs)
+
+def current_span():
+    return _current_span.get()
+
+def _call_attrs(args, kwargs, record_args):
+    if not record_args:
+        return {}
+    return {"input": json.dumps({**{str(i): arg for i, arg in enumerate(args)}, **kwargs}, default = str)[:500]}
+
+# Decorator: wrap a sync or async function in a span (record_args keeps the call arguments, e.g. tool inputs)
+def traced(name, kind = "internal", record_args = False):
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, kind, **_call_attrs(args, kwargs, record_args)):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, kind, **_call_attrs(args, kwargs, record_args)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def trace_stats():
+    return TRACER.stats()
+
+def recent_traces(limit = 20):
+    return TRACER.recent(limit)
+
+def get_trace(trace_id):
+    return TRACER.trace(trace_id)
+
+def _usage(response):
+    input_tokens = output_tokens = None
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens = (input_tokens or 0) + usage.get("input_tokens", 0)
+                output_tokens = (output_tokens or 0) + usage.get("output_tokens", 0)
+    if input_tokens is None:
+        usage = (response.llm_output or {}).get("usage") or {}
+        input_tokens, output_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    return input_tokens, output_tokens
+
+# LangChain callbacks -> llm spans under the question span the handler was created in (tools/sql are traced in-process)
+class TracingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, tracer = TRACER):
+        self.tracer = tracer
+        self.parent = _current_span.get()
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, name, kind, attrs):
+        if not self.tracer.enabled:
+            return
+        with self._lock:
+            self._open[run_id] = self.tracer.open_span(name, kind, attrs, parent = self.parent)
+
+    def _end(self, run_id, error = None, **attrs):
+        with self._lock:
+            span = self._open.pop(run_id, None)
+        if span is not None:
+            span["attrs"].update(attrs)
+            self.tracer.close_span(span, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata = None, invocation_params = None, **kwargs):
+        params = invocation_params or kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm", "llm", {
+            "node": (metadata or {}).get("langgraph_node"),
+            "model": params.get("model") or params.get("model_name") or params.get("_type"),
+            "messages": sum(len(batch) for batch in messages),
+            })
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        input_tokens, output_tokens = _usage(response)
+        self._end(run_id, input_tokens = input_tokens, output_tokens = output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# app.config insists on a key at import time; ingestion tests never call the model
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
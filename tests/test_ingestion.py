@@ -0,0 +1,70 @@
+import duckdb
+import pandas as pd
+import pytest
+from app.config import apple_csv_path
+from app.data_loader import cleaned_data, cleaned_data_sql, ingest_csv, derived_ratios
+
+header = (
+    "year,ebitda_millions,revenue_millions,gross_profit_millions,op_income_millions,net_income_millions,eps,"
+    "shares_outstanding,year_close_price,total_assets_millions,cash_on_hand_millions,long_term_debt_millions,"
+    "total_liabilities_millions,gross_margin,pe_ratio,employees"
+    )
+# unsorted years, "$1,234 " money, "46.21%" margins, blanks in the float columns, negative values
+edge_rows = [
+    '2011,"$1,234 ","$10,000 ","$4,621 ","$-1,234 ","$-2,500 ",$-0.50 ,"15,408",243.04,"$364,980 ","$65,171 ","$0 ","$308,030 ",46.21%,39.97,"164,000"',
+    '2009,"$500 ","$1,234 ","$300 ","$250 ","$100 ",,"1,000",,"$2,000 ","$100 ","$50 ","$1,000 ",,,"1,200"',
+    '2010,"$-75 ","$2,000 ","$-10 ","$-60 ","$-80 ",$0.01 ,"999",12.5,"$3,000 ","$1 ","$3,000 ","$4,000 ",-3.50%,-12.25,"1,250"',
+    ]
+
+@pytest.fixture
+def edge_csv(tmp_path):
+    path = tmp_path/"edge.csv"
+    path.write_text("\n".join([header] + edge_rows) + "\n", encoding = "utf-8")
+    return path
+
+def ingested(csv_path):
+    conn = duckdb.connect()
+    try:
+        return conn.execute(cleaned_data_sql(conn, csv_path)).df()
+    finally:
+        conn.close()
+
+def reference(csv_path):
+    expected = cleaned_data(csv_path)
+    expected["year"] = expected["year"].astype("int64")      # duckdb year is BIGINT, pandas keeps nullable Int64
+    return expected
+
+@pytest.mark.parametrize("which", ["sample", "edge"])
+def test_duckdb_ingestion_matches_pandas_cleaner(which, edge_csv):
+    csv_path = apple_csv_path if which == "sample" else edge_csv
+    actual, expected = ingested(csv_path), reference(csv_path)
+    assert list(actual.columns) == list(expected.columns)
+    assert dict(actual.dtypes) == dict(expected.dtypes)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype = True)
+
+def test_edge_values(edge_csv):
+    df = ingested(edge_csv).set_index("year")
+    assert list(df.index) == [2009, 2010, 2011]
+    assert df.loc[2011, "ebitda_millions"] == 1234
+    assert df.loc[2011, "op_income_millions"] == -1234
+    assert df.loc[2011, "eps"] == -0.5
+    assert df.loc[2011, "gross_margin"] == pytest.approx(0.4621)
+    assert df.loc[2010, "gross_margin"] == pytest.approx(-0.035)
+    assert df.loc[2010, "pe_ratio"] == -12.25
+    assert df.loc[2009, ["eps", "gross_margin", "pe_ratio", "year_close_price"]].isna().all()
+
+def test_derived_ratios(edge_csv):
+    df = ingested(edge_csv)
+    assert (df["operating_income_millions"] == df["op_income_millions"]).all()
+    for name, numerator, denominator in derived_ratios:
+        pd.testing.assert_series_equal(df[name], df[numerator] / df[denominator], check_names = False)
+    assert df.loc[df["year"] == 2011, "net_profit_margin"].item() == pytest.approx(-0.25)
+
+def test_ingest_csv_table(edge_csv):
+    conn = duckdb.connect()
+    try:
+        ingest_csv(conn, "apple_financials", edge_csv)
+        table = conn.execute("SELECT * FROM apple_financials").df()
+    finally:
+        conn.close()
+    pd.testing.assert_frame_equal(table, reference(edge_csv), check_dtype = True)